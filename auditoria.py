@@ -1,18 +1,576 @@
 """
 auditoria.py
 Sistema de registro de auditoría para cumplir con Ley 1581
+Log de solo-anexar en formato JSON Lines (un evento por línea): registrar un
+evento cuesta O(1) y una caída a mitad de escritura solo puede dañar la
+última línea. El archivo activo se rota por tamaño o al cambiar de día, y
+cada segmento rotado se sella comprimido con gzip.
+Las peticiones solo encolan el evento; un único hilo escritor los baja a
+disco por lotes, les asigna un 'id' correlativo y los añade al índice SQLite
+(indice_auditoria.py) con el que se hacen las consultas.
 """
 
+import atexit
+import glob
+import gzip
 import json
-from datetime import datetime
 import os
+import queue
+import threading
+import time
+from datetime import datetime
+from itertools import chain, islice
+
+import indice_auditoria
+
+# Archivo activo y segmentos rotados (logs_auditoria-AAAAMMDD-HHMMSS-ffffff.jsonl,
+# .jsonl.gz una vez sellados)
+AUDITORIA_FILE = 'logs_auditoria.jsonl'
+PREFIJO_SEGMENTO = 'logs_auditoria-'
+
+# Formato anterior (lista JSON reescrita en cada evento), se migra una vez
+AUDITORIA_FILE_ANTIGUO = 'logs_auditoria.json'
+
+# Política de fsync: 'siempre' (cada evento), 'intervalo' (como mucho cada
+# FSYNC_INTERVALO_SEGUNDOS) o 'nunca' (lo decide el sistema operativo)
+FSYNC_POLITICA = os.environ.get('AUDITORIA_FSYNC', 'intervalo')
+FSYNC_INTERVALO_SEGUNDOS = float(os.environ.get('AUDITORIA_FSYNC_SEGUNDOS', 1))
+
+# Rotación del archivo activo (además, siempre al cambiar de día)
+MAX_BYTES_SEGMENTO = int(os.environ.get('AUDITORIA_MAX_BYTES', 10 * 1024 * 1024))
+
+# Segmentos sellados
+NIVEL_COMPRESION = 6
+
+# Días que los eventos ya sellados se mantienen también en el índice SQLite;
+# lo anterior se consulta leyendo solo los segmentos que cruzan el rango
+RETENCION_INDICE_DIAS = int(os.environ.get('AUDITORIA_RETENCION_INDICE_DIAS', 90))
+
+# Cola en memoria entre las peticiones y el hilo escritor
+MAX_COLA = int(os.environ.get('AUDITORIA_MAX_COLA', 10000))
+MAX_LOTE = 500
+
+# Con la cola llena: 'descartar' (no frena la petición) o 'bloquear'
+# (espera hasta ESPERA_COLA_LLENA_SEGUNDOS y, si sigue llena, descarta)
+POLITICA_COLA_LLENA = os.environ.get('AUDITORIA_COLA_LLENA', 'bloquear')
+ESPERA_COLA_LLENA_SEGUNDOS = 2
+
+# Tiempo máximo para vaciar la cola al apagar
+ESPERA_VACIADO_SEGUNDOS = 10
+
+_lock = threading.Lock()
+_archivo = None
+_estado = {
+    'bytes': 0,
+    'dia': None,
+    'ultimo_fsync': 0.0,
+    'migrado': False
+}
+_por_sellar = []
+
+
+# ==================== ARCHIVOS ====================
+def _sincronizar(f):
+    f.flush()
+    os.fsync(f.fileno())
+    _estado['ultimo_fsync'] = time.time()
+
+
+def _nombre_segmento():
+    """Nombre para un segmento rotado (el orden alfabético es el cronológico)."""
+    return PREFIJO_SEGMENTO + datetime.now().strftime('%Y%m%d-%H%M%S-%f') + '.jsonl'
+
+
+def _hoy():
+    return datetime.now().strftime('%Y-%m-%d')
+
+
+def listar_segmentos():
+    """
+    Segmentos rotados (sellados o no), del más antiguo al más reciente.
+    Si una caída dejó las dos versiones de un segmento, cuenta la sin sellar.
+    """
+    rutas = set(glob.glob(PREFIJO_SEGMENTO + '*.jsonl')) | set(glob.glob(PREFIJO_SEGMENTO + '*.jsonl.gz'))
+    return sorted(r for r in rutas if not (r.endswith('.gz') and r[:-3] in rutas))
+
+
+def _migrar_formato_antiguo():
+    """
+    Convierte la lista JSON del formato anterior en un segmento JSONL.
+    El archivo antiguo se conserva renombrado como '.migrado'.
+    """
+    _estado['migrado'] = True
+    if not os.path.exists(AUDITORIA_FILE_ANTIGUO):
+        return
+
+    try:
+        with open(AUDITORIA_FILE_ANTIGUO, 'r', encoding='utf-8') as f:
+            logs = json.load(f)
+    except Exception as e:
+        print(f"⚠️ No se pudo migrar {AUDITORIA_FILE_ANTIGUO}: {e}")
+        return
+
+    # Escritura atómica del segmento y, después, retirada del archivo antiguo
+    destino = _nombre_segmento()
+    temporal = destino + '.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        for numero, evento in enumerate(logs, start=1):
+            f.write(json.dumps({'id': numero, **evento}, ensure_ascii=False) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, destino)
+    os.replace(AUDITORIA_FILE_ANTIGUO, AUDITORIA_FILE_ANTIGUO + '.migrado')
+    print(f"📦 Auditoría migrada a JSONL: {len(logs)} eventos → {destino}")
+
+
+def _abrir():
+    global _archivo
+    if not _estado['migrado']:
+        _migrar_formato_antiguo()
+    _archivo = open(AUDITORIA_FILE, 'a', encoding='utf-8')
+    _estado['bytes'] = _archivo.tell()
+    if _estado['bytes']:
+        # Una caída pudo dejar la última línea a medias: no pegar la siguiente a ella
+        with open(AUDITORIA_FILE, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                _archivo.write('\n')
+                _estado['bytes'] += 1
+    # Día del archivo: el de su primer evento
+    _estado['dia'] = _hoy()
+    if _estado['bytes']:
+        with open(AUDITORIA_FILE, 'r', encoding='utf-8') as f:
+            try:
+                _estado['dia'] = json.loads(f.readline())['timestamp'][:10]
+            except (ValueError, KeyError, TypeError):
+                pass
+
+
+def _rotar():
+    """Cierra el archivo activo y lo renombra como segmento."""
+    global _archivo
+    if _archivo is not None:
+        _sincronizar(_archivo)
+        _archivo.close()
+        _archivo = None
+    if os.path.exists(AUDITORIA_FILE) and os.path.getsize(AUDITORIA_FILE) > 0:
+        destino = _nombre_segmento()
+        os.replace(AUDITORIA_FILE, destino)
+        _por_sellar.append(destino)
+        print(f"🔄 Log de auditoría rotado → {destino}")
+
+
+def _necesita_rotar():
+    if _estado['bytes'] == 0:
+        return False
+    return _estado['bytes'] >= MAX_BYTES_SEGMENTO or _estado['dia'] != _hoy()
+
+
+def escribir_lineas(lineas):
+    """
+    Anexa líneas ya serializadas al log (rotando si hace falta) y aplica
+    la política de fsync.
+
+    Args:
+        lineas: Lista de textos JSON sin salto de línea final
+    """
+    with _lock:
+        if _archivo is not None and _necesita_rotar():
+            _rotar()
+        if _archivo is None:
+            _abrir()
+
+        bloque = ''.join(linea + '\n' for linea in lineas)
+        _archivo.write(bloque)
+        _estado['bytes'] += len(bloque.encode('utf-8'))
+
+        if FSYNC_POLITICA == 'siempre':
+            _sincronizar(_archivo)
+        elif FSYNC_POLITICA == 'intervalo' and time.time() - _estado['ultimo_fsync'] >= FSYNC_INTERVALO_SEGUNDOS:
+            _sincronizar(_archivo)
+        else:
+            _archivo.flush()
+
+
+def cerrar():
+    """Sincroniza y cierra el archivo activo (al apagar)."""
+    global _archivo
+    with _lock:
+        if _archivo is not None:
+            _sincronizar(_archivo)
+            _archivo.close()
+            _archivo = None
+
+
+atexit.register(cerrar)
+
+
+# ==================== SEGMENTOS SELLADOS ====================
+def _abrir_segmento(ruta):
+    if ruta.endswith('.gz'):
+        return gzip.open(ruta, 'rt', encoding='utf-8')
+    return open(ruta, 'r', encoding='utf-8')
+
+
+def _rango_vacio():
+    return {'primer_id': None, 'ultimo_id': None, 'desde': None, 'hasta': None, 'eventos': 0}
+
+
+def _acumular_rango(rango, evento):
+    """Amplía el rango de ids y timestamps de un segmento con un evento."""
+    rango['eventos'] += 1
+    if evento.get('id') is not None:
+        rango['primer_id'] = rango['primer_id'] or evento['id']
+        rango['ultimo_id'] = evento['id']
+    marca = evento.get('timestamp')
+    if marca:
+        rango['desde'] = min(rango['desde'] or marca, marca)
+        rango['hasta'] = max(rango['hasta'] or marca, marca)
+
+
+def sellar_segmento(ruta):
+    """
+    Comprime un segmento rotado (escritura atómica), registra su rango de ids
+    y de fechas en el índice y borra el original.
+
+    Returns:
+        str: Ruta del segmento sellado
+    """
+    destino = ruta + '.gz'
+    temporal = destino + '.tmp'
+    rango = _rango_vacio()
+
+    with open(ruta, 'rb') as origen, open(temporal, 'wb') as crudo:
+        with gzip.GzipFile(fileobj=crudo, mode='wb', compresslevel=NIVEL_COMPRESION) as comprimido:
+            for linea in origen:
+                try:
+                    evento = json.loads(linea)
+                except ValueError:
+                    continue
+                comprimido.write(linea if linea.endswith(b'\n') else linea + b'\n')
+                _acumular_rango(rango, evento)
+        crudo.flush()
+        os.fsync(crudo.fileno())
+    os.replace(temporal, destino)
+
+    indice_auditoria.registrar_segmento(destino, bytes=os.path.getsize(destino), **rango)
+    os.remove(ruta)
+    print(f"🗜️ Segmento de auditoría sellado: {destino} ({rango['eventos']} eventos)")
+    return destino
+
+
+def _registrar_segmento_existente(ruta):
+    """Registra un segmento sellado que no figura en el índice (índice nuevo)."""
+    rango = _rango_vacio()
+    for evento in _leer_archivo(ruta):
+        _acumular_rango(rango, evento)
+    indice_auditoria.registrar_segmento(ruta, bytes=os.path.getsize(ruta), **rango)
+
+
+def _sellar_pendientes():
+    """Sella los segmentos rotados y poda del índice lo sellado y antiguo."""
+    while _por_sellar:
+        ruta = _por_sellar.pop(0)
+        try:
+            sellar_segmento(ruta)
+        except Exception as e:
+            print(f"⚠️ Error sellando {ruta}: {e}")
+            continue
+        limite = datetime.fromtimestamp(time.time() - RETENCION_INDICE_DIAS * 86400).isoformat()
+        podados = indice_auditoria.podar(limite)
+        if podados:
+            print(f"🧹 Índice de auditoría: {podados} eventos antiguos quedan solo en segmentos sellados")
+
+
+def _segmentos_frios(desde=None, hasta=None, antes_de_id=None, descendente=False):
+    """Segmentos sellados que pueden contener eventos del rango pedido."""
+    return indice_auditoria.segmentos(desde, hasta, antes_de_id, descendente)
+
+
+def _cumple(evento, tipo, usuario, curso, desde, hasta):
+    """Mismos filtros que indice_auditoria.consultar(), sobre un evento leído del log."""
+    datos = evento.get('datos_adicionales') or {}
+    marca = evento.get('timestamp') or ''
+    return ((tipo is None or evento.get('tipo') == tipo) and
+            (usuario is None or str(evento.get('usuario')) == str(usuario)) and
+            (curso is None or (isinstance(datos, dict) and str(datos.get('curso')) == str(curso))) and
+            (not desde or marca >= desde) and
+            (not hasta or marca < hasta))
+
+
+def _eventos_frios(filtros, antes_de_id=None, descendente=False):
+    """
+    Eventos de los segmentos sellados con id menor que 'antes_de_id' que
+    cumplen los filtros. Solo se abren los segmentos cuyo rango cruza el pedido.
+    """
+    desde, hasta = filtros[3], filtros[4]
+    for segmento in _segmentos_frios(desde, hasta, antes_de_id, descendente):
+        eventos = (
+            evento for evento in _leer_archivo(segmento['archivo'])
+            if _cumple(evento, *filtros) and
+            (antes_de_id is None or (evento.get('id') or 0) < antes_de_id)
+        )
+        if descendente:
+            # Un segmento cabe en memoria; el conjunto no hace falta
+            eventos = reversed(list(eventos))
+        for evento in eventos:
+            yield evento
+
+
+# ==================== HILO ESCRITOR ====================
+_FIN = object()
+_cola = queue.Queue(maxsize=MAX_COLA)
+_hilo_escritor = None
+_lock_hilo = threading.Lock()
+
+contadores = {
+    'encolados': 0,
+    'escritos': 0,
+    'descartados': 0,    # Cola llena
+    'errores': 0,        # Fallo al escribir el lote
+    'errores_indice': 0  # Escritos en el log pero no indexados
+}
+
+_siguiente_id = None
+_reindexar_desde = None      # Tras un fallo del índice: último id indexado seguro
+_listo = threading.Event()   # Migración e índice preparados
+
+
+def _ultimo_id_en_archivo(ruta, bytes_cola=65536):
+    """'id' del último evento completo de un archivo (leyendo solo el final)."""
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - bytes_cola))
+        lineas = f.read().split(b'\n')
+    for linea in reversed(lineas):
+        try:
+            evento = json.loads(linea)
+        except ValueError:
+            continue
+        if isinstance(evento, dict) and 'id' in evento:
+            return evento['id']
+    return None
+
+
+def _ultimo_id_en_disco():
+    sin_sellar = [r for r in listar_segmentos() if not r.endswith('.gz')]
+    for ruta in [AUDITORIA_FILE] + sin_sellar[::-1]:
+        ultimo = _ultimo_id_en_archivo(ruta)
+        if ultimo is not None:
+            return ultimo
+    # Los sellados están registrados con su rango
+    return indice_auditoria.ultimo_id_sellado()
+
+
+def iterar_archivos(excluir=()):
+    """Eventos del log en disco, del más antiguo al más reciente."""
+    for ruta in listar_segmentos() + [AUDITORIA_FILE]:
+        if ruta in excluir:
+            continue
+        for evento in _leer_archivo(ruta):
+            yield evento
+
+
+def _reindexar(desde_id):
+    """Añade al índice los eventos del log posteriores a 'desde_id'."""
+    lote = []
+    total = 0
+    cubiertos = {s['archivo'] for s in _segmentos_frios() if (s['ultimo_id'] or 0) <= desde_id}
+    for evento in iterar_archivos(excluir=cubiertos):
+        if evento.get('id') is not None and evento['id'] <= desde_id:
+            continue
+        lote.append(evento)
+        if len(lote) >= MAX_LOTE:
+            indice_auditoria.insertar(lote)
+            total += len(lote)
+            lote = []
+    if lote:
+        indice_auditoria.insertar(lote)
+        total += len(lote)
+    print(f"🗂️ Índice de auditoría reconstruido: {total} eventos")
+
+
+def _preparar():
+    """
+    Antes del primer lote: migra el formato antiguo, pone el índice al día
+    con el log (p. ej. tras una caída entre ambas escrituras) y fija el
+    siguiente 'id'.
+    """
+    global _siguiente_id
+    with _lock:
+        if not _estado['migrado']:
+            _migrar_formato_antiguo()
+
+    # Segmentos sellados que el índice no conoce y rotados sin sellar
+    registrados = {s['archivo'] for s in _segmentos_frios()}
+    for ruta in listar_segmentos():
+        if ruta.endswith('.gz'):
+            if ruta not in registrados:
+                _registrar_segmento_existente(ruta)
+        else:
+            _por_sellar.append(ruta)
+    _sellar_pendientes()
+
+    en_disco = _ultimo_id_en_disco()
+    # Un índice vacío no necesita lo que ya está sellado
+    en_indice = indice_auditoria.ultimo_id() or indice_auditoria.ultimo_id_sellado()
+    if en_indice < en_disco:
+        _reindexar(en_indice)
+    _siguiente_id = max(en_disco, indice_auditoria.ultimo_id()) + 1
+
+
+def _escribir_lote(lote):
+    global _siguiente_id, _reindexar_desde
+    eventos = []
+    for linea in lote:
+        eventos.append({'id': _siguiente_id, **json.loads(linea)})
+        _siguiente_id += 1
+
+    try:
+        escribir_lineas([json.dumps(evento, ensure_ascii=False) for evento in eventos])
+        contadores['escritos'] += len(eventos)
+    except Exception as e:
+        contadores['errores'] += len(eventos)
+        print(f"⚠️ Error escribiendo {len(eventos)} eventos de auditoría: {e}")
+        return
+    _sellar_pendientes()
+
+    try:
+        if _reindexar_desde is not None:
+            # Ya están en el log: se recuperan de ahí junto con los pendientes
+            _reindexar(_reindexar_desde)
+            _reindexar_desde = None
+        else:
+            indice_auditoria.insertar(eventos)
+    except Exception as e:
+        # El log es la referencia: se reintenta con el próximo lote
+        contadores['errores_indice'] += len(eventos)
+        if _reindexar_desde is None:
+            _reindexar_desde = eventos[0]['id'] - 1
+        print(f"⚠️ Error indexando eventos de auditoría: {e}")
+
+
+def _escritor():
+    """Saca eventos de la cola y los escribe en lotes de hasta MAX_LOTE."""
+    try:
+        _preparar()
+    except Exception as e:
+        print(f"⚠️ Error preparando el índice de auditoría: {e}")
+        if _siguiente_id is None:
+            _fijar_siguiente_id_sin_indice()
+    _listo.set()
+
+    while True:
+        linea = _cola.get()
+        if linea is _FIN:
+            _cola.task_done()
+            return
+
+        lote = [linea]
+        fin = False
+        while len(lote) < MAX_LOTE:
+            try:
+                linea = _cola.get_nowait()
+            except queue.Empty:
+                break
+            if linea is _FIN:
+                fin = True
+                break
+            lote.append(linea)
+
+        _escribir_lote(lote)
+        for _ in range(len(lote) + fin):
+            _cola.task_done()
+        if fin:
+            return
+
+
+def _fijar_siguiente_id_sin_indice():
+    global _siguiente_id
+    try:
+        _siguiente_id = _ultimo_id_en_disco() + 1
+    except Exception:
+        _siguiente_id = 1
+
+
+def _iniciar_escritor():
+    global _hilo_escritor
+    with _lock_hilo:
+        if _hilo_escritor is None:
+            _hilo_escritor = threading.Thread(target=_escritor, daemon=True, name='auditoria')
+            _hilo_escritor.start()
+            atexit.register(_apagar)
+
+
+def _encolar(linea):
+    _iniciar_escritor()
+    try:
+        if POLITICA_COLA_LLENA == 'bloquear':
+            _cola.put(linea, timeout=ESPERA_COLA_LLENA_SEGUNDOS)
+        else:
+            _cola.put_nowait(linea)
+        encolado = True
+    except queue.Full:
+        encolado = False
+    with _lock_hilo:
+        contadores['encolados' if encolado else 'descartados'] += 1
+    return encolado
+
+
+def vaciar(timeout=ESPERA_VACIADO_SEGUNDOS):
+    """
+    Espera a que el hilo escritor haya escrito todo lo encolado.
+
+    Returns:
+        bool: True si la cola quedó vacía a tiempo
+    """
+    limite = time.time() + timeout
+    while _cola.unfinished_tasks:
+        if time.time() >= limite:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def _apagar():
+    """Al salir: termina de escribir la cola y cierra el archivo."""
+    try:
+        _cola.put(_FIN, timeout=ESPERA_VACIADO_SEGUNDOS)
+        _hilo_escritor.join(ESPERA_VACIADO_SEGUNDOS)
+    except queue.Full:
+        print("⚠️ Auditoría: cola llena al apagar, se pueden perder eventos")
+    pendientes = _cola.qsize()
+    if pendientes:
+        print(f"⚠️ Auditoría: {pendientes} eventos sin escribir al apagar")
+    cerrar()
+
+
+def obtener_estadisticas():
+    """Contadores del escritor de auditoría."""
+    return {
+        **contadores,
+        'pendientes': _cola.qsize(),
+        'politica_cola_llena': POLITICA_COLA_LLENA
+    }
+
+
+# ==================== API ====================
+def crear_evento(tipo, descripcion, usuario=None, datos_adicionales=None):
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'tipo': tipo,
+        'descripcion': descripcion,
+        'usuario': usuario,
+        'datos_adicionales': datos_adicionales or {}
+    }
 
-AUDITORIA_FILE = 'logs_auditoria.json'
 
 def registrar_evento(tipo, descripcion, usuario=None, datos_adicionales=None):
     """
     Registra un evento en el log de auditoría.
-    
+
     Tipos de eventos:
     - ACCESO_DATOS: Acceso a datos personales
     - REGISTRO_ESTUDIANTE: Nuevo registro de estudiante
@@ -21,47 +579,83 @@ def registrar_evento(tipo, descripcion, usuario=None, datos_adicionales=None):
     - RECONOCIMIENTO_FACIAL: Reconocimiento exitoso
     """
     try:
-        evento = {
-            'timestamp': datetime.now().isoformat(),
-            'tipo': tipo,
-            'descripcion': descripcion,
-            'usuario': usuario,
-            'datos_adicionales': datos_adicionales or {}
-        }
-        
-        # Cargar logs existentes
-        if os.path.exists(AUDITORIA_FILE):
-            with open(AUDITORIA_FILE, 'r', encoding='utf-8') as f:
-                logs = json.load(f)
+        evento = crear_evento(tipo, descripcion, usuario, datos_adicionales)
+        # Se serializa aquí: el llamador puede seguir modificando sus datos
+        if _encolar(json.dumps(evento, ensure_ascii=False)):
+            print(f"📝 Evento registrado: {tipo}")
         else:
-            logs = []
-        
-        # Agregar nuevo evento
-        logs.append(evento)
-        
-        # Guardar
-        with open(AUDITORIA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(logs, f, indent=2, ensure_ascii=False)
-        
-        print(f"📝 Evento registrado: {tipo}")
-        
+            print(f"⚠️ Cola de auditoría llena, evento descartado: {tipo}")
+
     except Exception as e:
         print(f"⚠️ Error registrando auditoría: {e}")
 
+
+def _leer_archivo(ruta):
+    """Eventos de un archivo JSONL (o .jsonl.gz) de uno en uno; se saltan las líneas incompletas o dañadas."""
+    if not os.path.exists(ruta):
+        # Rotado o sellado mientras se listaba
+        return
+    with _abrir_segmento(ruta) as f:
+        for linea in f:
+            try:
+                yield json.loads(linea)
+            except ValueError:
+                continue
+
+
+def _preparar_consulta():
+    """Que la consulta vea lo encolado hasta ahora."""
+    _iniciar_escritor()
+    _listo.wait(ESPERA_VACIADO_SEGUNDOS)
+    vaciar(timeout=1)
+
+
 def obtener_logs(filtro_tipo=None, limite=100):
     """Obtiene los últimos logs de auditoría"""
     try:
-        if not os.path.exists(AUDITORIA_FILE):
-            return []
-        
-        with open(AUDITORIA_FILE, 'r', encoding='utf-8') as f:
-            logs = json.load(f)
-        
-        if filtro_tipo:
-            logs = [log for log in logs if log['tipo'] == filtro_tipo]
-        
-        return logs[-limite:]
-        
+        return consultar_logs(tipo=filtro_tipo, limite=limite)['eventos'][::-1]
+
     except Exception as e:
         print(f"Error obteniendo logs: {e}")
-        return []
\ No newline at end of file
+        return []
+
+
+def consultar_logs(tipo=None, usuario=None, curso=None, desde=None, hasta=None, cursor=None, limite=100):
+    """
+    Consulta filtrada y paginada (del más reciente al más antiguo).
+
+    Args:
+        tipo, usuario, curso: Filtros exactos (opcionales)
+        desde, hasta: Rango ISO [desde, hasta), p. ej. '2025-03-01'
+        cursor: 'siguiente_cursor' de la respuesta anterior
+        limite: Eventos por página
+
+    Returns:
+        dict: {'eventos': [...], 'siguiente_cursor': int o None}
+    """
+    _preparar_consulta()
+    filtros = (tipo, usuario, curso, desde, hasta)
+    # Un evento de más para saber si hay otra página
+    eventos, _ = indice_auditoria.consultar(*filtros, cursor=cursor, limite=limite + 1)
+
+    if len(eventos) <= limite:
+        # Se completa con los segmentos sellados, por debajo de la frontera del índice
+        topes = [t for t in (cursor, indice_auditoria.primer_id()) if t is not None]
+        frios = _eventos_frios(filtros, min(topes) if topes else None, descendente=True)
+        eventos += list(islice(frios, limite + 1 - len(eventos)))
+
+    pagina = eventos[:limite]
+    siguiente = pagina[-1]['id'] if len(eventos) > limite else None
+    return {'eventos': pagina, 'siguiente_cursor': siguiente}
+
+
+def exportar_logs(tipo=None, usuario=None, curso=None, desde=None, hasta=None):
+    """
+    Iterador en orden cronológico sobre todos los eventos que cumplen los
+    filtros: primero los segmentos sellados (descomprimiendo al vuelo) y
+    después el índice. Memoria constante.
+    """
+    _preparar_consulta()
+    filtros = (tipo, usuario, curso, desde, hasta)
+    frontera = indice_auditoria.primer_id()
+    return chain(_eventos_frios(filtros, frontera), indice_auditoria.iterar(*filtros))
@@ -0,0 +1,235 @@
+"""
+cache_asistencia.py
+Caché en memoria del mapa de asistencia de cada sesión abierta (curso, fecha).
+Se siembra una vez por sesión y se mantiene al día con las escrituras propias
+y con un listener on_snapshot sobre el documento, que recoge los cambios
+hechos desde fuera (p. ej. el regAsistenciaControlador del backend Node).
+Un estudiante que ya está 'Presente' no cuesta ninguna lectura.
+"""
+
+import copy
+import threading
+
+import repositorio
+
+# Espera máxima al primer snapshot del listener antes de leer el documento a mano
+ESPERA_PRIMER_SNAPSHOT_SEGUNDOS = 5
+
+# Listeners abiertos a la vez; el resto de sesiones se leen a demanda
+MAX_SESIONES_VIGILADAS = 50
+
+# {(course_id, fecha): {'registros': dict | None, 'vigilancia': watch | None,
+#                       'sincronizada': bool}}
+# registros None = el documento de asistencia aún no existe
+_sesiones = {}
+_lock = threading.RLock()
+
+# Un lock de apertura por sesión: abrir una (hasta ESPERA_PRIMER_SNAPSHOT_SEGUNDOS
+# + una lectura) no frena las consultas de las demás sesiones ni de otros kioscos
+_locks_apertura = {}
+
+contadores = {
+    'aciertos': 0,       # Consultas resueltas sin leer Firestore
+    'lecturas': 0,       # Lecturas del documento (incluye el primer snapshot)
+    'cambios_externos': 0
+}
+
+
+def _nueva_sesion():
+    return {'registros': None, 'vigilancia': None, 'sincronizada': False}
+
+
+def _lock_apertura(clave):
+    with _lock:
+        return _locks_apertura.setdefault(clave, threading.Lock())
+
+
+def _purgar(fecha):
+    """Cierra las sesiones de otros días (cambio de fecha)."""
+    with _lock:
+        antiguas = [clave for clave in _sesiones if clave[1] != fecha]
+        vigilancias = [_sesiones.pop(clave)['vigilancia'] for clave in antiguas]
+        for clave in [clave for clave in _locks_apertura if clave[1] != fecha]:
+            del _locks_apertura[clave]
+    for vigilancia in vigilancias:
+        if vigilancia is not None:
+            try:
+                vigilancia.unsubscribe()
+            except Exception as e:
+                print(f"⚠️ Error cerrando listener de asistencia: {e}")
+
+
+def _vigilar(clave):
+    """
+    Abre el listener del documento y espera a su primer snapshot.
+
+    Returns:
+        watch o None si no llegó a tiempo o el backend no lo permite
+    """
+    course_id, fecha = clave
+    primer_snapshot = threading.Event()
+
+    def al_cambiar(docs, cambios, momento):
+        doc = docs[0] if docs else None
+        registros = (doc.to_dict() or {}) if doc is not None and doc.exists else None
+        with _lock:
+            sesion = _sesiones.get(clave)
+            if sesion is None:
+                return
+            if primer_snapshot.is_set():
+                contadores['cambios_externos'] += 1
+            else:
+                contadores['lecturas'] += 1
+            sesion['registros'] = registros
+            sesion['sincronizada'] = True
+        primer_snapshot.set()
+
+    try:
+        vigilancia = repositorio.vigilar_asistencia(course_id, fecha, al_cambiar)
+    except Exception as e:
+        print(f"⚠️ No se pudo vigilar la asistencia de {course_id}: {e}")
+        return None
+
+    if not primer_snapshot.wait(ESPERA_PRIMER_SNAPSHOT_SEGUNDOS):
+        vigilancia.unsubscribe()
+        return None
+    return vigilancia
+
+
+def _leer(clave):
+    """Lectura directa del documento de asistencia."""
+    course_id, fecha = clave
+    doc = repositorio.obtener_asistencia(course_id, fecha)
+    with _lock:
+        contadores['lecturas'] += 1
+        sesion = _sesiones.setdefault(clave, _nueva_sesion())
+        sesion['registros'] = (doc.to_dict() or {}) if doc.exists else None
+        sesion['sincronizada'] = True
+
+
+def _abrir(clave):
+    """Siembra la sesión: listener si hay hueco y, si no, una lectura."""
+    _purgar(clave[1])
+    with _lock:
+        sesion = _sesiones.setdefault(clave, _nueva_sesion())
+        vigiladas = sum(1 for s in _sesiones.values() if s['vigilancia'] is not None)
+        importada = sesion['registros'] is not None
+
+    if vigiladas < MAX_SESIONES_VIGILADAS:
+        vigilancia = _vigilar(clave)
+        with _lock:
+            sesion['vigilancia'] = vigilancia
+
+    if not sesion['sincronizada']:
+        try:
+            _leer(clave)
+        except Exception:
+            if not importada:
+                raise
+            # Sin conexión: se sigue con lo que trajo la instantánea
+            print(f"⚠️ Asistencia de {clave[0]} sin verificar: se usa la instantánea")
+
+
+def obtener_registro(course_id, fecha, estudiante_id):
+    """
+    Registro de asistencia de un estudiante en una sesión.
+
+    Args:
+        course_id: ID del curso
+        fecha: Fecha 'YYYY-MM-DD'
+        estudiante_id: ID del estudiante
+
+    Returns:
+        tuple: (existe_documento, registro o None si el estudiante no figura)
+    """
+    clave = (course_id, fecha)
+    with _lock:
+        sesion = _sesiones.get(clave)
+        abierta = sesion is not None and sesion['sincronizada']
+    if not abierta:
+        with _lock_apertura(clave):
+            # Otro hilo pudo abrirla mientras se esperaba el lock
+            with _lock:
+                sesion = _sesiones.get(clave)
+                abierta = sesion is not None and sesion['sincronizada']
+            if not abierta:
+                _abrir(clave)
+
+    with _lock:
+        sesion = _sesiones[clave]
+        registros = sesion['registros']
+        registro = registros.get(estudiante_id) if registros is not None else None
+        vigilada = sesion['vigilancia'] is not None
+
+    # Sin listener no se ven los cambios de fuera: solo es definitivo un
+    # estado distinto de 'Ausente'; lo demás se vuelve a leer
+    if not vigilada and (registro is None or registro.get('estadoAsistencia') == 'Ausente'):
+        _leer(clave)
+        with _lock:
+            registros = _sesiones[clave]['registros']
+            registro = registros.get(estudiante_id) if registros is not None else None
+    else:
+        with _lock:
+            contadores['aciertos'] += 1
+
+    return registros is not None, copy.deepcopy(registro)
+
+
+def recargar_registro(course_id, fecha, estudiante_id):
+    """
+    Como obtener_registro(), pero leyendo antes el documento (p. ej. cuando
+    otro proceso lo acaba de crear y el listener aún no lo ha traído).
+    """
+    _leer((course_id, fecha))
+    with _lock:
+        registros = _sesiones[(course_id, fecha)]['registros']
+        registro = registros.get(estudiante_id) if registros is not None else None
+    return registros is not None, copy.deepcopy(registro)
+
+
+def guardar_documento(course_id, fecha, datos):
+    """Refleja en la caché un documento de asistencia creado por esta aplicación."""
+    with _lock:
+        sesion = _sesiones.setdefault((course_id, fecha), _nueva_sesion())
+        sesion['registros'] = copy.deepcopy(datos)
+
+
+def actualizar_registro(course_id, fecha, estudiante_id, registro):
+    """Refleja en la caché una escritura propia sobre un estudiante."""
+    with _lock:
+        sesion = _sesiones.setdefault((course_id, fecha), _nueva_sesion())
+        if sesion['registros'] is None:
+            sesion['registros'] = {}
+        sesion['registros'][estudiante_id] = copy.deepcopy(registro)
+
+
+def exportar(fecha):
+    """{course_id: registros} de las sesiones de esa fecha (para la instantánea)."""
+    with _lock:
+        return {
+            course_id: copy.deepcopy(sesion['registros'])
+            for (course_id, fecha_sesion), sesion in _sesiones.items()
+            if fecha_sesion == fecha and sesion['registros'] is not None
+        }
+
+
+def importar(fecha, sesiones):
+    """
+    Restaura sesiones desde la instantánea. Quedan sin sincronizar: se
+    verifican contra Firestore la primera vez que se consultan.
+    """
+    with _lock:
+        for course_id, registros in sesiones.items():
+            sesion = _sesiones.setdefault((course_id, fecha), _nueva_sesion())
+            if not sesion['sincronizada']:
+                sesion['registros'] = registros
+
+
+def obtener_estadisticas():
+    """Contadores de la caché y sesiones abiertas."""
+    with _lock:
+        return {
+            **contadores,
+            'sesiones': len(_sesiones),
+            'sesiones_vigiladas': sum(1 for s in _sesiones.values() if s['vigilancia'] is not None)
+        }
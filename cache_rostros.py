@@ -0,0 +1,118 @@
+"""
+cache_rostros.py
+Caché en memoria de rostros ya descifrados y decodificados en escala de
+grises, para que entrenamientos seguidos en el mismo proceso no repitan el
+descifrado ni la decodificación JPEG.
+Clave: ruta + mtime del archivo (si cambia, la entrada no vale). Expulsión
+LRU con un presupuesto en bytes. Nunca se escribe a disco y, al revocar un
+consentimiento, se quitan las entradas de la carpeta del estudiante.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+# Presupuesto en MB (0 = caché desactivada). Un rostro de 150x150 en grises ocupa ~22 KB
+MAX_BYTES = int(float(os.environ.get('CACHE_ROSTROS_MB', 64)) * 1024 * 1024)
+
+# {ruta: (mtime_ns, imagen)}, de la menos a la más recientemente usada
+_entradas = OrderedDict()
+_bytes = 0
+_lock = threading.Lock()
+
+# Sube con cada vaciar(): una carga que empezó antes no se guarda después
+# (un entrenamiento en curso no vuelve a meter rostros ya revocados)
+_generacion = 0
+
+contadores = {
+    'aciertos': 0,
+    'fallos': 0,
+    'expulsiones': 0
+}
+
+
+def _quitar(ruta):
+    global _bytes
+    _, imagen = _entradas.pop(ruta)
+    _bytes -= imagen.nbytes
+
+
+def _guardar(ruta, mtime, imagen, generacion):
+    global _bytes
+    if imagen.nbytes > MAX_BYTES:
+        return
+    # Solo lectura: la misma matriz se entrega a varios entrenamientos
+    imagen.setflags(write=False)
+    with _lock:
+        if generacion != _generacion:
+            return
+        if ruta in _entradas:
+            _quitar(ruta)
+        _entradas[ruta] = (mtime, imagen)
+        _bytes += imagen.nbytes
+        while _bytes > MAX_BYTES:
+            _quitar(next(iter(_entradas)))
+            contadores['expulsiones'] += 1
+
+
+def obtener(ruta, cargar):
+    """
+    Rostro de 'ruta' desde la caché o, si no está o el archivo cambió,
+    con cargar(ruta).
+
+    Args:
+        ruta: Imagen cifrada en disco
+        cargar: Función ruta -> np.ndarray en grises (o None si falla)
+
+    Returns:
+        np.ndarray (solo lectura) o None
+    """
+    if MAX_BYTES <= 0:
+        return cargar(ruta)
+
+    try:
+        mtime = os.stat(ruta).st_mtime_ns
+    except OSError:
+        return cargar(ruta)
+
+    with _lock:
+        entrada = _entradas.get(ruta)
+        if entrada is not None and entrada[0] == mtime:
+            _entradas.move_to_end(ruta)
+            contadores['aciertos'] += 1
+            return entrada[1]
+        contadores['fallos'] += 1
+        generacion = _generacion
+
+    imagen = cargar(ruta)
+    if imagen is not None:
+        _guardar(ruta, mtime, imagen, generacion)
+    return imagen
+
+
+def vaciar(carpeta=None):
+    """
+    Borra las entradas de una carpeta de estudiante (p. ej. al revocar su
+    consentimiento) o, sin carpeta, todas.
+    """
+    global _bytes, _generacion
+    with _lock:
+        _generacion += 1
+        if carpeta is None:
+            _entradas.clear()
+            _bytes = 0
+            return
+        prefijo = os.path.join(carpeta, '')
+        for ruta in [ruta for ruta in _entradas if ruta.startswith(prefijo)]:
+            _quitar(ruta)
+
+
+def obtener_estadisticas():
+    """Contadores y ocupación de la caché."""
+    with _lock:
+        return {
+            **contadores,
+            'entradas': len(_entradas),
+            'bytes': _bytes,
+            'max_bytes': MAX_BYTES
+        }
@@ -0,0 +1,138 @@
+"""
+detector_cambios.py
+Detección de cambios entre fotogramas consecutivos de cada kiosco.
+Si el fotograma es casi idéntico al último analizado (p. ej. una puerta vacía),
+se reutiliza el resultado anterior sin decodificar la imagen completa ni
+ejecutar la cascada de detección.
+"""
+
+import hashlib
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Diferencia media absoluta (0-255) por debajo de la cual dos miniaturas son "iguales"
+UMBRAL_DIFERENCIA = 4.0
+
+# Tamaño de la miniatura de comparación (ancho, alto)
+TAMANO_MINIATURA = (32, 24)
+
+# Tiempo máximo que se reutiliza un resultado antes de forzar un análisis completo
+VIGENCIA_MAXIMA_SEGUNDOS = 10
+
+# Estado por kiosco: {kiosco: {'digest', 'miniatura', 'resultado', 'marca'}}
+_referencias = {}
+_lock = threading.Lock()
+
+contadores = {
+    'analizados': 0,        # Fotogramas que pasaron por la detección completa
+    'reutilizados': 0,      # Fotogramas resueltos con el resultado anterior
+    'bytes_identicos': 0,   # De los reutilizados, cuántos eran bytes idénticos
+}
+_reutilizados_por_kiosco = {}
+
+
+def calcular_miniatura(image_bytes):
+    """
+    Decodifica el JPEG a 1/8 de resolución en escala de grises y lo reduce
+    a una miniatura fija. Mucho más barato que la decodificación completa.
+
+    Returns:
+        np.ndarray o None si la imagen no se puede decodificar
+    """
+    np_arr = np.frombuffer(image_bytes, np.uint8)
+    reducida = cv2.imdecode(np_arr, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if reducida is None:
+        return None
+    return cv2.resize(reducida, TAMANO_MINIATURA, interpolation=cv2.INTER_AREA)
+
+
+def buscar_resultado_previo(kiosco, image_bytes):
+    """
+    Compara el fotograma con el último analizado del mismo kiosco.
+
+    Args:
+        kiosco: Identificador del kiosco
+        image_bytes: Bytes JPEG del fotograma
+
+    Returns:
+        tuple: (resultado_previo o None, firma) - la firma se pasa luego a
+               guardar_resultado() si hubo que analizar el fotograma
+    """
+    digest = hashlib.blake2b(image_bytes, digest_size=16).digest()
+
+    with _lock:
+        referencia = _referencias.get(kiosco)
+
+    vigente = (
+        referencia is not None
+        and time.time() - referencia['marca'] < VIGENCIA_MAXIMA_SEGUNDOS
+    )
+
+    if vigente and referencia['digest'] == digest:
+        _contar_reutilizado(kiosco, identico=True)
+        return referencia['resultado'], (digest, referencia['miniatura'])
+
+    miniatura = calcular_miniatura(image_bytes)
+
+    if vigente and miniatura is not None and referencia['miniatura'] is not None:
+        diferencia = float(cv2.absdiff(miniatura, referencia['miniatura']).mean())
+        if diferencia < UMBRAL_DIFERENCIA:
+            _contar_reutilizado(kiosco, identico=False)
+            return referencia['resultado'], (digest, miniatura)
+
+    with _lock:
+        contadores['analizados'] += 1
+    return None, (digest, miniatura)
+
+
+def guardar_resultado(kiosco, firma, resultado):
+    """Guarda el resultado del análisis completo como nueva referencia del kiosco."""
+    digest, miniatura = firma
+    with _lock:
+        _referencias[kiosco] = {
+            'digest': digest,
+            'miniatura': miniatura,
+            'resultado': resultado,
+            'marca': time.time()
+        }
+
+
+def olvidar_kiosco(kiosco):
+    """
+    Descarta la referencia de un kiosco (p. ej. al cambiar de salón o al
+    desconectarse). Con un ID de kiosco se descartan también todas sus
+    cámaras ('kiosco@ip'); con una clave de cámara, solo esa cámara.
+    """
+    prefijo = f"{kiosco}@"
+    with _lock:
+        for clave in [c for c in _referencias if c == kiosco or c.startswith(prefijo)]:
+            del _referencias[clave]
+
+
+def reiniciar():
+    """Descarta todas las referencias (p. ej. tras reentrenar el modelo)."""
+    with _lock:
+        _referencias.clear()
+
+
+def obtener_estadisticas():
+    """Retorna los contadores de fotogramas analizados y ahorrados."""
+    with _lock:
+        total = contadores['analizados'] + contadores['reutilizados']
+        return {
+            **contadores,
+            'total': total,
+            'porcentaje_ahorrado': round(100 * contadores['reutilizados'] / total, 1) if total else 0.0,
+            'reutilizados_por_kiosco': dict(_reutilizados_por_kiosco)
+        }
+
+
+def _contar_reutilizado(kiosco, identico):
+    with _lock:
+        contadores['reutilizados'] += 1
+        if identico:
+            contadores['bytes_identicos'] += 1
+        _reutilizados_por_kiosco[kiosco] = _reutilizados_por_kiosco.get(kiosco, 0) + 1
@@ -0,0 +1,181 @@
+"""
+estudiantes.py
+Índice en memoria nombre normalizado → ID de estudiante.
+Evita recorrer toda la colección 'person' en cada reconocimiento. Se carga
+una vez (solo 'namePerson'), se actualiza con las altas propias y se
+reconcilia de forma incremental comparando los update_time de Firestore.
+"""
+
+import threading
+import time
+
+import repositorio
+
+# Tiempo mínimo entre reconciliaciones provocadas por un nombre desconocido
+ESPERA_RECONCILIACION_SEGUNDOS = 30
+
+CAMPOS_ESTUDIANTE = ['namePerson']
+
+# {estudiante_id: {'nombre': normalizado, 'marca': update_time}}
+_estudiantes = {}
+# {nombre normalizado: set(estudiante_id)}: con nombres repetidos, dar de baja
+# a uno no deja sin índice a los demás
+_por_nombre = {}
+_lock = threading.RLock()
+_cargado = False
+_ultima_reconciliacion = 0.0
+
+
+# ==================== FUNCIÓN: NORMALIZAR NOMBRE ====================
+def normalizar_nombre(nombre):
+    """
+    Normaliza un nombre para búsqueda en Firebase.
+    - Quita espacios extras
+    - Convierte a mayúsculas
+    - Quita tildes y acentos
+    - Mantiene espacios simples entre palabras
+    """
+    # Quitar espacios extras
+    nombre = nombre.strip()
+    nombre = ' '.join(nombre.split())
+
+    # Quitar tildes y acentos
+    replacements = {
+        'Á': 'A', 'É': 'E', 'Í': 'I', 'Ó': 'O', 'Ú': 'U',
+        'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u',
+        'Ñ': 'N', 'ñ': 'n'
+    }
+    for orig, repl in replacements.items():
+        nombre = nombre.replace(orig, repl)
+
+    # Convertir a mayúsculas
+    nombre = nombre.upper()
+
+    return nombre
+
+
+def _desindexar_nombre(nombre, estudiante_id):
+    ids = _por_nombre.get(nombre)
+    if ids is not None:
+        ids.discard(estudiante_id)
+        if not ids:
+            del _por_nombre[nombre]
+
+
+def _indexar(estudiante_id, nombre_db, marca):
+    anterior = _estudiantes.get(estudiante_id)
+    if anterior:
+        _desindexar_nombre(anterior['nombre'], estudiante_id)
+    nombre = normalizar_nombre(nombre_db or '')
+    _estudiantes[estudiante_id] = {'nombre': nombre, 'marca': marca}
+    _por_nombre.setdefault(nombre, set()).add(estudiante_id)
+
+
+def _quitar(estudiante_id):
+    anterior = _estudiantes.pop(estudiante_id, None)
+    if anterior:
+        _desindexar_nombre(anterior['nombre'], estudiante_id)
+
+
+def _id_por_nombre(nombre):
+    """
+    Ante nombres repetidos, el ID menor: el primero que daba la búsqueda
+    secuencial (Firestore lista por ID).
+    """
+    ids = _por_nombre.get(nombre)
+    return min(ids) if ids else None
+
+
+def cargar():
+    """Carga completa del índice (una consulta con proyección)."""
+    global _cargado, _ultima_reconciliacion
+    with _lock:
+        _estudiantes.clear()
+        _por_nombre.clear()
+        for doc in repositorio.consultar_estudiantes(CAMPOS_ESTUDIANTE):
+            _indexar(doc.id, (doc.to_dict() or {}).get('namePerson', ''), repositorio.marca_tiempo(doc.update_time))
+        _cargado = True
+        _ultima_reconciliacion = time.time()
+        print(f"👥 Índice de estudiantes: {len(_estudiantes)}")
+
+
+def reconciliar():
+    """
+    Pone el índice al día leyendo solo lo que cambió: un listado sin campos
+    (IDs + update_time) y get_all de los documentos nuevos o modificados.
+    Las lecturas se hacen sin bloquear las búsquedas.
+
+    Returns:
+        int: Número de estudiantes añadidos, modificados o eliminados
+    """
+    global _ultima_reconciliacion
+    with _lock:
+        if not _cargado:
+            cargar()
+            return len(_estudiantes)
+        marcas = {e: datos['marca'] for e, datos in _estudiantes.items()}
+
+    versiones = repositorio.versiones_estudiantes()
+    cambiados = [e for e, marca in versiones.items() if marcas.get(e, False) != marca]
+    eliminados = [e for e in marcas if e not in versiones]
+    docs = repositorio.obtener_personas(cambiados, CAMPOS_ESTUDIANTE)
+
+    with _lock:
+        for doc in docs:
+            if doc.exists:
+                _indexar(doc.id, (doc.to_dict() or {}).get('namePerson', ''),
+                         repositorio.marca_tiempo(doc.update_time))
+        for estudiante_id in eliminados:
+            _quitar(estudiante_id)
+        _ultima_reconciliacion = time.time()
+
+    if cambiados or eliminados:
+        print(f"👥 Índice de estudiantes reconciliado: {len(cambiados)} cambios, {len(eliminados)} bajas")
+    return len(cambiados) + len(eliminados)
+
+
+def buscar_id(nombre):
+    """
+    ID del estudiante con ese nombre (se normaliza), o None.
+    Si no aparece, reconcilia (como mucho cada ESPERA_RECONCILIACION_SEGUNDOS)
+    por si es un alta reciente.
+    """
+    nombre = normalizar_nombre(nombre)
+    with _lock:
+        if not _cargado:
+            cargar()
+        estudiante_id = _id_por_nombre(nombre)
+        if estudiante_id or time.time() - _ultima_reconciliacion < ESPERA_RECONCILIACION_SEGUNDOS:
+            return estudiante_id
+    reconciliar()
+    with _lock:
+        return _id_por_nombre(nombre)
+
+
+def agregar(estudiante_id, nombre):
+    """Registra en el índice un estudiante creado por esta aplicación."""
+    with _lock:
+        # Sin marca: la próxima reconciliación traerá su update_time
+        _indexar(estudiante_id, nombre, None)
+
+
+def exportar():
+    """Estado del índice para la instantánea en disco (None si aún no se cargó)."""
+    with _lock:
+        if not _cargado:
+            return None
+        return {e: dict(datos) for e, datos in _estudiantes.items()}
+
+
+def importar(estudiantes):
+    """Restaura el índice desde la instantánea (sin leer Firestore)."""
+    global _cargado, _ultima_reconciliacion
+    with _lock:
+        _estudiantes.clear()
+        _por_nombre.clear()
+        for estudiante_id, datos in estudiantes.items():
+            _estudiantes[estudiante_id] = {'nombre': datos['nombre'], 'marca': datos.get('marca')}
+            _por_nombre.setdefault(datos['nombre'], set()).add(estudiante_id)
+        _cargado = True
+        # Forzar que el primer nombre desconocido reconcilie
+        _ultima_reconciliacion = 0.0
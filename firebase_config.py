@@ -1,10 +1,21 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import os
 
-# Inicializar Firebase solo si no está ya inicializado
-if not firebase_admin._apps:
-    cred = credentials.Certificate('asistenciaconreconocimiento-firebase-adminsdk.json')
-    firebase_admin.initialize_app(cred)
+# Backend de datos: 'firebase' (proyecto real) o 'local' (en memoria, ver firestore_local.py)
+FIRESTORE_BACKEND = os.environ.get('FIRESTORE_BACKEND', 'firebase')
 
-# Instancia global de Firestore
-db = firestore.client()
+if FIRESTORE_BACKEND == 'local':
+    import firestore_local
+
+    # Instancia global en memoria, sembrada con un campus sintético
+    db = firestore_local.crear_cliente_desde_entorno()
+else:
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    # Inicializar Firebase solo si no está ya inicializado
+    if not firebase_admin._apps:
+        cred = credentials.Certificate('asistenciaconreconocimiento-firebase-adminsdk.json')
+        firebase_admin.initialize_app(cred)
+
+    # Instancia global de Firestore
+    db = firestore.client()
@@ -0,0 +1,592 @@
+"""
+firestore_local.py
+Backend de Firestore en memoria para pruebas de carga sin red ni proyecto real.
+Implementa el subconjunto del cliente que usa la aplicación: collection,
+collection_group, document, get/create/set/update/delete, where/select/limit,
+get_all, batch y on_snapshot. Se puede sembrar con un campus sintético
+(N cursos, M estudiantes) e inyectar latencia por llamada.
+Se activa con FIRESTORE_BACKEND=local (ver firebase_config.py).
+"""
+
+import copy
+import enum
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+# Parámetros por defecto al crear el cliente desde variables de entorno
+CURSOS_POR_DEFECTO = 20
+ESTUDIANTES_POR_DEFECTO = 300
+
+
+class DocumentoNoEncontrado(Exception):
+    """update() sobre un documento que no existe (equivalente a NotFound)."""
+
+
+class DocumentoYaExiste(Exception):
+    """create() sobre un documento que ya existe (equivalente a AlreadyExists)."""
+
+
+class TipoCambio(enum.Enum):
+    ADDED = 1
+    MODIFIED = 2
+    REMOVED = 3
+
+
+class CambioDocumento:
+    """Cambio entregado a los callbacks de on_snapshot."""
+
+    def __init__(self, tipo, documento):
+        self.type = tipo
+        self.document = documento
+
+
+def _ahora():
+    return datetime.now(timezone.utc)
+
+
+def _leer_campo(datos, campo):
+    """Lee un campo con notación de puntos ('a.b'); None si no existe."""
+    valor = datos
+    for parte in campo.split('.'):
+        if not isinstance(valor, dict) or parte not in valor:
+            return None
+        valor = valor[parte]
+    return valor
+
+
+def _escribir_campo(datos, campo, valor):
+    """Escribe un campo con notación de puntos, creando los mapas intermedios."""
+    partes = campo.split('.')
+    destino = datos
+    for parte in partes[:-1]:
+        if not isinstance(destino.get(parte), dict):
+            destino[parte] = {}
+        destino = destino[parte]
+    destino[partes[-1]] = valor
+
+
+def _proyectar(datos, campos):
+    """Copia solo los campos pedidos (como select() / field_paths)."""
+    proyectado = {}
+    for campo in campos:
+        valor = _leer_campo(datos, campo)
+        if valor is not None:
+            _escribir_campo(proyectado, campo, copy.deepcopy(valor))
+    return proyectado
+
+
+def _fusionar(destino, origen):
+    """set(..., merge=True): fusiona mapas anidados."""
+    for clave, valor in origen.items():
+        if isinstance(valor, dict) and isinstance(destino.get(clave), dict):
+            _fusionar(destino[clave], valor)
+        else:
+            destino[clave] = copy.deepcopy(valor)
+
+
+# ==================== SNAPSHOTS ====================
+class InstantaneaDocumento:
+    """Equivalente a DocumentSnapshot."""
+
+    def __init__(self, referencia, datos, creado=None, actualizado=None, campos=None):
+        self.reference = referencia
+        self.id = referencia.id
+        self.exists = datos is not None
+        self.create_time = creado
+        self.update_time = actualizado
+        self.read_time = _ahora()
+        if datos is not None:
+            datos = _proyectar(datos, campos) if campos is not None else copy.deepcopy(datos)
+        self._datos = datos
+
+    def to_dict(self):
+        return copy.deepcopy(self._datos) if self.exists else None
+
+    def get(self, campo):
+        return copy.deepcopy(_leer_campo(self._datos or {}, campo))
+
+
+# ==================== REFERENCIAS ====================
+class ReferenciaDocumento:
+    """Equivalente a DocumentReference."""
+
+    def __init__(self, cliente, ruta):
+        self._cliente = cliente
+        self._ruta = tuple(ruta)
+        self.id = self._ruta[-1]
+        self.path = '/'.join(self._ruta)
+
+    @property
+    def parent(self):
+        return ReferenciaColeccion(self._cliente, self._ruta[:-1])
+
+    def collection(self, nombre):
+        return ReferenciaColeccion(self._cliente, self._ruta + (nombre,))
+
+    def get(self, field_paths=None, **kwargs):
+        self._cliente._esperar()
+        return self._cliente._leer(self._ruta, field_paths)
+
+    def create(self, datos):
+        self._cliente._esperar()
+        self._cliente._aplicar([('create', self._ruta, datos, False)])
+
+    def set(self, datos, merge=False):
+        self._cliente._esperar()
+        self._cliente._aplicar([('set', self._ruta, datos, merge)])
+
+    def update(self, cambios):
+        self._cliente._esperar()
+        self._cliente._aplicar([('update', self._ruta, cambios, False)])
+
+    def delete(self):
+        self._cliente._esperar()
+        self._cliente._aplicar([('delete', self._ruta, None, False)])
+
+    def on_snapshot(self, callback):
+        consulta = ConsultaLocal(self._cliente, coleccion=self._ruta[:-1], documento=self.id)
+        return consulta.on_snapshot(callback)
+
+    def __eq__(self, otra):
+        return isinstance(otra, ReferenciaDocumento) and otra._ruta == self._ruta
+
+    def __hash__(self):
+        return hash(self._ruta)
+
+
+class ConsultaLocal:
+    """Equivalente a Query / CollectionGroup."""
+
+    OPERADORES = {
+        '==': lambda a, b: a == b,
+        '!=': lambda a, b: a != b,
+        '<': lambda a, b: a is not None and a < b,
+        '<=': lambda a, b: a is not None and a <= b,
+        '>': lambda a, b: a is not None and a > b,
+        '>=': lambda a, b: a is not None and a >= b,
+        'in': lambda a, b: a in b,
+        'not-in': lambda a, b: a not in b,
+        'array_contains': lambda a, b: isinstance(a, list) and b in a,
+        'array_contains_any': lambda a, b: isinstance(a, list) and any(v in a for v in b),
+    }
+
+    def __init__(self, cliente, coleccion=None, grupo=None, filtros=(), campos=None,
+                 limite=None, orden=(), documento=None):
+        self._cliente = cliente
+        self._coleccion = tuple(coleccion) if coleccion else None
+        self._grupo = grupo
+        self._filtros = tuple(filtros)
+        self._campos = campos
+        self._limite = limite
+        self._orden = tuple(orden)
+        self._documento = documento
+
+    def _copiar(self, **cambios):
+        parametros = {
+            'coleccion': self._coleccion, 'grupo': self._grupo, 'filtros': self._filtros,
+            'campos': self._campos, 'limite': self._limite, 'orden': self._orden,
+            'documento': self._documento
+        }
+        parametros.update(cambios)
+        return ConsultaLocal(self._cliente, **parametros)
+
+    def where(self, campo, operador, valor):
+        if operador not in self.OPERADORES:
+            raise ValueError(f"Operador no soportado: {operador}")
+        return self._copiar(filtros=self._filtros + ((campo, operador, valor),))
+
+    def select(self, campos):
+        return self._copiar(campos=list(campos))
+
+    def limit(self, cantidad):
+        return self._copiar(limite=cantidad)
+
+    def order_by(self, campo, direction='ASCENDING'):
+        return self._copiar(orden=self._orden + ((campo, direction),))
+
+    def incluye_ruta(self, ruta):
+        """¿La ruta de documento pertenece a esta consulta (sin mirar filtros)?"""
+        if self._documento is not None:
+            return ruta == self._coleccion + (self._documento,)
+        if self._coleccion is not None:
+            return ruta[:-1] == self._coleccion
+        return len(ruta) >= 2 and ruta[-2] == self._grupo
+
+    def _coincide(self, datos):
+        for campo, operador, valor in self._filtros:
+            if not self.OPERADORES[operador](_leer_campo(datos, campo), valor):
+                return False
+        return True
+
+    def _resolver(self):
+        """Ejecuta la consulta sobre el estado actual (sin latencia)."""
+        with self._cliente._lock:
+            encontrados = [
+                (ruta, registro)
+                for ruta, registro in self._cliente._documentos.items()
+                if self.incluye_ruta(ruta) and self._coincide(registro['datos'])
+            ]
+            encontrados.sort(key=lambda item: item[0])
+            for campo, direccion in reversed(self._orden):
+                encontrados.sort(
+                    key=lambda item: (_leer_campo(item[1]['datos'], campo) is None,
+                                      _leer_campo(item[1]['datos'], campo)),
+                    reverse=(direccion == 'DESCENDING')
+                )
+            if self._limite is not None:
+                encontrados = encontrados[:self._limite]
+            return [
+                InstantaneaDocumento(
+                    ReferenciaDocumento(self._cliente, ruta),
+                    registro['datos'], registro['creado'], registro['actualizado'],
+                    self._campos
+                )
+                for ruta, registro in encontrados
+            ]
+
+    def get(self, **kwargs):
+        self._cliente._esperar()
+        return self._resolver()
+
+    def stream(self, **kwargs):
+        return iter(self.get())
+
+    def on_snapshot(self, callback):
+        return self._cliente._suscribir(self, callback)
+
+
+class ReferenciaColeccion(ConsultaLocal):
+    """Equivalente a CollectionReference (también se puede consultar)."""
+
+    def __init__(self, cliente, ruta):
+        super().__init__(cliente, coleccion=ruta)
+        self.id = ruta[-1]
+        self._ruta = tuple(ruta)
+
+    @property
+    def parent(self):
+        if len(self._ruta) < 2:
+            return None
+        return ReferenciaDocumento(self._cliente, self._ruta[:-1])
+
+    def document(self, documento_id=None):
+        return ReferenciaDocumento(self._cliente, self._ruta + (documento_id or uuid.uuid4().hex[:20],))
+
+    def add(self, datos):
+        referencia = self.document()
+        referencia.set(datos)
+        return _ahora(), referencia
+
+
+# ==================== LOTES ====================
+class LoteEscritura:
+    """Equivalente a WriteBatch: las escrituras se aplican juntas en commit()."""
+
+    def __init__(self, cliente):
+        self._cliente = cliente
+        self._operaciones = []
+
+    def create(self, referencia, datos):
+        self._operaciones.append(('create', referencia._ruta, datos, False))
+        return self
+
+    def set(self, referencia, datos, merge=False):
+        self._operaciones.append(('set', referencia._ruta, datos, merge))
+        return self
+
+    def update(self, referencia, cambios):
+        self._operaciones.append(('update', referencia._ruta, cambios, False))
+        return self
+
+    def delete(self, referencia):
+        self._operaciones.append(('delete', referencia._ruta, None, False))
+        return self
+
+    def commit(self):
+        self._cliente._esperar()
+        resultados = self._cliente._aplicar(self._operaciones)
+        self._operaciones = []
+        return resultados
+
+
+# ==================== LISTENERS ====================
+class Vigilancia:
+    """Equivalente a Watch: se cancela con unsubscribe()."""
+
+    def __init__(self, cliente, consulta, callback):
+        self._cliente = cliente
+        self.consulta = consulta
+        self.callback = callback
+        self.activa = True
+
+    def unsubscribe(self):
+        self.activa = False
+        with self._cliente._lock:
+            if self in self._cliente._vigilancias:
+                self._cliente._vigilancias.remove(self)
+
+
+# ==================== CLIENTE ====================
+class ClienteLocal:
+    """Cliente Firestore en memoria (subconjunto usado por la aplicación)."""
+
+    def __init__(self, latencia_ms=0, variacion_ms=0):
+        self._documentos = {}   # {ruta (tupla): {'datos', 'creado', 'actualizado'}}
+        self._lock = threading.RLock()
+        self._vigilancias = []
+        self._eventos = queue.Queue()
+        self._despachador = None
+        self.latencia_ms = latencia_ms
+        self.variacion_ms = variacion_ms
+        self.llamadas = 0
+
+    # ---------- API compatible con firestore.Client ----------
+    def collection(self, nombre):
+        return ReferenciaColeccion(self, (nombre,))
+
+    def collection_group(self, nombre):
+        return ConsultaLocal(self, grupo=nombre)
+
+    def document(self, ruta):
+        return ReferenciaDocumento(self, ruta.strip('/').split('/'))
+
+    def batch(self):
+        return LoteEscritura(self)
+
+    def get_all(self, referencias, field_paths=None, **kwargs):
+        """Lee varios documentos con una sola espera de latencia."""
+        self._esperar()
+        for referencia in list(referencias):
+            yield self._leer(referencia._ruta, field_paths)
+
+    # ---------- Latencia ----------
+    def configurar_latencia(self, latencia_ms, variacion_ms=0):
+        """Cada llamada (get, set, commit, consulta...) esperará latencia_ms ± variacion_ms."""
+        self.latencia_ms = latencia_ms
+        self.variacion_ms = variacion_ms
+
+    def _esperar(self):
+        with self._lock:
+            self.llamadas += 1
+        if self.latencia_ms or self.variacion_ms:
+            espera = random.uniform(self.latencia_ms - self.variacion_ms,
+                                    self.latencia_ms + self.variacion_ms)
+            time.sleep(max(0.0, espera) / 1000)
+
+    # ---------- Lectura y escritura ----------
+    def _leer(self, ruta, campos=None):
+        ruta = tuple(ruta)
+        with self._lock:
+            registro = self._documentos.get(ruta)
+            referencia = ReferenciaDocumento(self, ruta)
+            if registro is None:
+                return InstantaneaDocumento(referencia, None)
+            return InstantaneaDocumento(referencia, registro['datos'], registro['creado'],
+                                        registro['actualizado'], campos)
+
+    def _aplicar(self, operaciones):
+        """Aplica las operaciones de forma atómica y notifica a los listeners."""
+        momento = _ahora()
+        with self._lock:
+            # Validar antes de modificar nada (atomicidad del lote)
+            presentes = set()
+            ausentes = set()
+            for tipo, ruta, _, _ in operaciones:
+                if tipo == 'create':
+                    if ruta in presentes or (ruta not in ausentes and ruta in self._documentos):
+                        raise DocumentoYaExiste(f"Ya existe el documento: {'/'.join(ruta)}")
+                    presentes.add(ruta)
+                    ausentes.discard(ruta)
+                elif tipo == 'set':
+                    presentes.add(ruta)
+                    ausentes.discard(ruta)
+                elif tipo == 'delete':
+                    ausentes.add(ruta)
+                    presentes.discard(ruta)
+                elif ruta in ausentes or (ruta not in presentes and ruta not in self._documentos):
+                    raise DocumentoNoEncontrado(f"No existe el documento: {'/'.join(ruta)}")
+
+            rutas_cambiadas = []
+            for tipo, ruta, datos, merge in operaciones:
+                existente = self._documentos.get(ruta)
+                if tipo == 'delete':
+                    self._documentos.pop(ruta, None)
+                elif tipo in ('set', 'create'):
+                    if merge and existente:
+                        nuevos = copy.deepcopy(existente['datos'])
+                        _fusionar(nuevos, datos)
+                    else:
+                        nuevos = copy.deepcopy(datos)
+                    self._documentos[ruta] = {
+                        'datos': nuevos,
+                        'creado': existente['creado'] if existente else momento,
+                        'actualizado': momento
+                    }
+                else:  # update (admite rutas con puntos)
+                    nuevos = copy.deepcopy(existente['datos'])
+                    for campo, valor in datos.items():
+                        _escribir_campo(nuevos, campo, copy.deepcopy(valor))
+                    existente['datos'] = nuevos
+                    existente['actualizado'] = momento
+                rutas_cambiadas.append((ruta, existente is not None))
+
+            self._notificar(rutas_cambiadas)
+        return [momento] * len(operaciones)
+
+    # ---------- Listeners ----------
+    def _suscribir(self, consulta, callback):
+        vigilancia = Vigilancia(self, consulta, callback)
+        with self._lock:
+            self._vigilancias.append(vigilancia)
+            docs = consulta._resolver()
+            cambios = [CambioDocumento(TipoCambio.ADDED, doc) for doc in docs]
+            self._encolar(vigilancia, docs, cambios)
+        return vigilancia
+
+    def _notificar(self, rutas_cambiadas):
+        for vigilancia in self._vigilancias:
+            afectadas = [(r, existia) for r, existia in rutas_cambiadas if vigilancia.consulta.incluye_ruta(r)]
+            if not afectadas:
+                continue
+            docs = vigilancia.consulta._resolver()
+            por_ruta = {doc.reference._ruta: doc for doc in docs}
+            cambios = []
+            for ruta, existia in afectadas:
+                doc = por_ruta.get(ruta)
+                if doc is None:
+                    cambios.append(CambioDocumento(TipoCambio.REMOVED, self._leer(ruta)))
+                else:
+                    cambios.append(CambioDocumento(TipoCambio.MODIFIED if existia else TipoCambio.ADDED, doc))
+            self._encolar(vigilancia, docs, cambios)
+
+    def _encolar(self, vigilancia, docs, cambios):
+        """Los callbacks se ejecutan en un hilo aparte, como en el cliente real."""
+        self._eventos.put((vigilancia, docs, cambios, _ahora()))
+        if self._despachador is None:
+            self._despachador = threading.Thread(target=self._despachar, daemon=True)
+            self._despachador.start()
+
+    def _despachar(self):
+        while True:
+            vigilancia, docs, cambios, momento = self._eventos.get()
+            if not vigilancia.activa:
+                continue
+            try:
+                vigilancia.callback(docs, cambios, momento)
+            except Exception as e:
+                print(f"⚠️ Error en callback de on_snapshot: {e}")
+
+
+# ==================== CAMPUS SINTÉTICO ====================
+NOMBRES = ['ANA', 'CARLOS', 'DIANA', 'JUAN', 'LAURA', 'MIGUEL', 'SOFIA', 'ANDRES',
+           'VALENTINA', 'SANTIAGO', 'CAMILA', 'DAVID', 'ISABELLA', 'FELIPE', 'MARIA']
+APELLIDOS = ['GOMEZ', 'RODRIGUEZ', 'MARTINEZ', 'LOPEZ', 'GARCIA', 'PEREZ', 'SANCHEZ',
+             'RAMIREZ', 'TORRES', 'FLOREZ', 'RIVERA', 'MORALES', 'ORTIZ', 'CASTRO']
+DIAS = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado']
+
+
+def sembrar_campus(cliente, cursos=CURSOS_POR_DEFECTO, estudiantes=ESTUDIANTES_POR_DEFECTO,
+                   salones=None, estudiantes_por_curso=30, proporcion_con_grupos=0.5, semilla=0):
+    """
+    Llena el cliente con un campus sintético.
+
+    Args:
+        cliente: ClienteLocal a sembrar
+        cursos: Número de cursos
+        estudiantes: Número de estudiantes ('person' con type 'Estudiante')
+        salones: Número de salones distintos (por defecto, uno por cada 4 cursos)
+        estudiantes_por_curso: Inscritos por curso (o todos si hay menos)
+        proporcion_con_grupos: Fracción de cursos con subcolección 'groups'
+        semilla: Semilla aleatoria (mismo valor = mismo campus)
+
+    Returns:
+        dict: {'cursos', 'estudiantes', 'salones'}
+    """
+    aleatorio = random.Random(semilla)
+    salones = salones or max(1, cursos // 4)
+    nombres_salones = [f"Salón {101 + i}" for i in range(salones)]
+
+    lote = cliente.batch()
+
+    # Estudiantes (nombres únicos, ya normalizados)
+    ids_estudiantes = []
+    usados = set()
+    for i in range(estudiantes):
+        nombre = f"{aleatorio.choice(NOMBRES)} {aleatorio.choice(APELLIDOS)} {aleatorio.choice(APELLIDOS)}"
+        if nombre in usados:
+            nombre = f"{nombre} {i}"
+        usados.add(nombre)
+        estudiante_id = str(1000000000 + i)
+        ids_estudiantes.append(estudiante_id)
+        lote.set(cliente.collection('person').document(estudiante_id), {
+            'namePerson': nombre,
+            'type': 'Estudiante',
+            'courses': []
+        })
+
+    # Cursos con horario directo o por grupos
+    cursos_por_estudiante = {e: [] for e in ids_estudiantes}
+    for j in range(cursos):
+        curso_id = f"CUR{j:04d}"
+        inscritos = aleatorio.sample(ids_estudiantes, min(estudiantes_por_curso, len(ids_estudiantes)))
+        for estudiante_id in inscritos:
+            cursos_por_estudiante[estudiante_id].append(curso_id)
+
+        def sesiones():
+            inicio = aleatorio.randrange(6, 20)
+            return [{
+                'day': dia,
+                'iniTime': f"{inicio:02d}:00",
+                'endTime': f"{inicio + 2:02d}:00",
+                'classroom': aleatorio.choice(nombres_salones)
+            } for dia in aleatorio.sample(DIAS, 2)]
+
+        datos_curso = {
+            'nameCourse': f"Curso {j + 1}",
+            'profesorID': f"PROF{j % 10:02d}",
+            'estudianteID': inscritos
+        }
+        curso_ref = cliente.collection('courses').document(curso_id)
+        if aleatorio.random() < proporcion_con_grupos:
+            for g in range(aleatorio.randint(1, 2)):
+                lote.set(curso_ref.collection('groups').document(f"G{g + 1}"), {'schedule': sesiones()})
+        else:
+            datos_curso['schedule'] = sesiones()
+        lote.set(curso_ref, datos_curso)
+
+    for estudiante_id, cursos_estudiante in cursos_por_estudiante.items():
+        lote.update(cliente.collection('person').document(estudiante_id), {'courses': cursos_estudiante})
+
+    # Sembrar sin latencia
+    latencia = (cliente.latencia_ms, cliente.variacion_ms)
+    cliente.configurar_latencia(0, 0)
+    lote.commit()
+    cliente.configurar_latencia(*latencia)
+
+    print(f"🌱 Campus sintético: {cursos} cursos, {estudiantes} estudiantes, {salones} salones")
+    return {'cursos': cursos, 'estudiantes': estudiantes, 'salones': salones}
+
+
+def crear_cliente_desde_entorno():
+    """
+    Cliente local configurado con variables de entorno:
+    FIRESTORE_LOCAL_CURSOS, FIRESTORE_LOCAL_ESTUDIANTES, FIRESTORE_LOCAL_SEMILLA,
+    FIRESTORE_LOCAL_LATENCIA_MS, FIRESTORE_LOCAL_VARIACION_MS
+    """
+    cliente = ClienteLocal(
+        latencia_ms=float(os.environ.get('FIRESTORE_LOCAL_LATENCIA_MS', 0)),
+        variacion_ms=float(os.environ.get('FIRESTORE_LOCAL_VARIACION_MS', 0))
+    )
+    sembrar_campus(
+        cliente,
+        cursos=int(os.environ.get('FIRESTORE_LOCAL_CURSOS', CURSOS_POR_DEFECTO)),
+        estudiantes=int(os.environ.get('FIRESTORE_LOCAL_ESTUDIANTES', ESTUDIANTES_POR_DEFECTO)),
+        semilla=int(os.environ.get('FIRESTORE_LOCAL_SEMILLA', 0))
+    )
+    print(f"🧪 Firestore LOCAL (latencia {cliente.latencia_ms} ± {cliente.variacion_ms} ms)")
+    return cliente
@@ -0,0 +1,166 @@
+"""
+herramienta_cifrado.py
+Herramienta de línea de comandos para el cifrado de Data/ (Ley 1581).
+Recorre las carpetas de estudiantes con un pool de hilos y distingue los
+archivos en claro de los tokens Fernet por su prefijo.
+
+Uso:
+    python herramienta_cifrado.py verificar              # ¿todo descifra con las claves actuales?
+    python herramienta_cifrado.py encriptar              # cifrar lo capturado antes del cifrado
+    python herramienta_cifrado.py reencriptar [--rotar]  # pasar todo a la clave primaria
+    Opciones: --carpeta Data --estudiante NOMBRE --workers 8
+
+Se puede ejecutar con el servidor en marcha: tras --rotar, el servidor
+recarga las claves en su siguiente cifrado o descifrado (seguridad_config
+vigila los archivos de claves), así que las capturas nuevas ya usan la
+clave primaria nueva.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cryptography.fernet import InvalidToken
+
+import seguridad_config
+from seguridad_config import es_token_fernet
+
+WORKERS_POR_DEFECTO = 8
+
+# Estados que cuentan como fallo en el informe de cada operación
+FALLOS = {
+    'verificar': {'sin_encriptar', 'clave_desconocida', 'error'},
+    'encriptar': {'clave_desconocida', 'error'},
+    'reencriptar': {'sin_encriptar', 'error'},
+}
+
+
+def _listar(carpeta, estudiante=None):
+    """[(estudiante, ruta)] de todos los archivos bajo 'carpeta'."""
+    archivos = []
+    estudiantes = [estudiante] if estudiante else sorted(os.listdir(carpeta))
+    for nombre in estudiantes:
+        carpeta_estudiante = os.path.join(carpeta, nombre)
+        if not os.path.isdir(carpeta_estudiante):
+            continue
+        for raiz, _, nombres in os.walk(carpeta_estudiante):
+            for archivo in sorted(nombres):
+                if not archivo.endswith('.tmp'):
+                    archivos.append((nombre, os.path.join(raiz, archivo)))
+    return archivos
+
+
+def _verificar(ruta):
+    """
+    Returns:
+        tuple: (estado, bytes) con estado 'ok', 'sin_encriptar',
+               'clave_desconocida' o 'error'
+    """
+    try:
+        with open(ruta, 'rb') as f:
+            datos = f.read()
+        if not es_token_fernet(datos):
+            return 'sin_encriptar', len(datos)
+        try:
+            seguridad_config.obtener_cipher().decrypt(datos)
+        except InvalidToken:
+            return 'clave_desconocida', len(datos)
+        return 'ok', len(datos)
+    except Exception as e:
+        print(f"Error verificando {ruta}: {e}")
+        return 'error', 0
+
+
+def _encriptar(ruta):
+    """
+    Returns:
+        tuple: (estado, bytes) con estado 'encriptado', 'ya_encriptado',
+               'clave_desconocida' o 'error'
+    """
+    estado, tamano = _verificar(ruta)
+    if estado == 'ok':
+        return 'ya_encriptado', tamano
+    if estado != 'sin_encriptar':
+        return estado, tamano
+    return ('encriptado' if seguridad_config.encriptar_archivo(ruta) else 'error'), tamano
+
+
+def _ejecutar(operacion, archivos, workers):
+    """Aplica 'operacion' a cada archivo con el pool y agrupa por estudiante."""
+    por_estudiante = {}
+    total_bytes = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for (estudiante, _), (estado, tamano) in zip(archivos, pool.map(lambda a: operacion(a[1]), archivos)):
+            contadores = por_estudiante.setdefault(estudiante, {})
+            contadores[estado] = contadores.get(estado, 0) + 1
+            total_bytes += tamano
+    return por_estudiante, total_bytes
+
+
+def _sumar(lista_contadores):
+    total = {}
+    for contadores in lista_contadores:
+        for estado, n in contadores.items():
+            total[estado] = total.get(estado, 0) + n
+    return total
+
+
+def _informe(nombre_operacion, por_estudiante, segundos, total_archivos, total_bytes=None):
+    """Imprime el resumen por estudiante y devuelve el número de fallos."""
+    fallos_operacion = FALLOS[nombre_operacion]
+    fallos = 0
+    print(f"\n{'Estudiante':<40} {'Archivos':>8}  Detalle")
+    for estudiante in sorted(por_estudiante):
+        contadores = por_estudiante[estudiante]
+        fallos_estudiante = sum(n for estado, n in contadores.items() if estado in fallos_operacion)
+        fallos += fallos_estudiante
+        detalle = ', '.join(f"{estado}={n}" for estado, n in sorted(contadores.items()))
+        marca = '✖' if fallos_estudiante else '✔'
+        print(f"{marca} {estudiante:<38} {sum(contadores.values()):>8}  {detalle}")
+
+    velocidad = total_archivos / segundos if segundos else 0
+    resumen = f"\n{total_archivos} archivos en {segundos:.2f} s ({velocidad:.0f} archivos/s"
+    if total_bytes is not None:
+        resumen += f", {total_bytes / (1024 * 1024) / segundos if segundos else 0:.1f} MB/s"
+    print(resumen + f") — {fallos} fallos")
+    return fallos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cifrado de las imágenes de Data/')
+    parser.add_argument('operacion', choices=['verificar', 'encriptar', 'reencriptar'])
+    parser.add_argument('--carpeta', default='Data', help='Carpeta raíz de los estudiantes')
+    parser.add_argument('--estudiante', help='Solo la carpeta de este estudiante')
+    parser.add_argument('--workers', type=int, default=WORKERS_POR_DEFECTO, help='Hilos en paralelo')
+    parser.add_argument('--rotar', action='store_true', help='(reencriptar) generar antes una clave nueva')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.carpeta):
+        print(f"✖ No existe la carpeta {args.carpeta}")
+        return 2
+
+    inicio = time.time()
+    if args.operacion == 'reencriptar':
+        if args.rotar:
+            seguridad_config.rotar_clave()
+        carpeta = os.path.join(args.carpeta, args.estudiante) if args.estudiante else args.carpeta
+        resultado = seguridad_config.reencriptar_datos(carpeta, workers=args.workers)
+        por_estudiante = resultado['por_carpeta']
+        if args.estudiante:
+            # Dentro de un estudiante, el primer nivel ya son sus archivos
+            por_estudiante = {args.estudiante: _sumar(por_estudiante.values())}
+        fallos = _informe('reencriptar', por_estudiante, time.time() - inicio, resultado['total'])
+    else:
+        archivos = _listar(args.carpeta, args.estudiante)
+        operacion = _verificar if args.operacion == 'verificar' else _encriptar
+        print(f"🔍 {args.operacion}: {len(archivos)} archivos con {args.workers} hilos")
+        por_estudiante, total_bytes = _ejecutar(operacion, archivos, args.workers)
+        fallos = _informe(args.operacion, por_estudiante, time.time() - inicio, len(archivos), total_bytes)
+
+    return 1 if fallos else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,524 @@
+"""
+horarios.py
+Capa compartida de carga del horario de clases.
+Un barrido completo cuesta dos consultas: los cursos (solo 'nameCourse' y
+'schedule') y todos los grupos con collection_group('groups') (solo
+'schedule'), sin descargar los arreglos 'estudianteID'.
+El resultado se guarda en caché y se invalida cuando Firestore avisa de un
+cambio en 'courses' o 'groups'.
+Para la consulta frecuente de los kioscos, el horario del día de cada salón
+se precalcula en un arreglo ordenado que se resuelve con una búsqueda binaria.
+"""
+
+import bisect
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime
+
+import repositorio
+
+# Campos que se leen de cada documento (proyecciones)
+CAMPOS_CURSO = ['nameCourse', 'schedule']
+CAMPOS_GRUPO = ['schedule']
+
+# Ventana de registro (igual que verificar_horario_salon)
+MINUTOS_APERTURA_ANTICIPADA = 5    # Abre antes del inicio
+MINUTOS_CIERRE_REGISTRO = 30       # Cierra después del inicio
+
+# El contador de "próximo curso" se muestra cuando falta esto para la apertura
+MINUTOS_AVISO_PROXIMO = 5
+
+# Tope de caché HTTP para el estado del kiosco (por si cambia el horario)
+MAX_VIGENCIA_ESTADO_SEGUNDOS = 300
+
+DIAS_ESPANOL_A_INGLES = {
+    'Lunes': 'Monday',
+    'Martes': 'Tuesday',
+    'Miércoles': 'Wednesday',
+    'Jueves': 'Thursday',
+    'Viernes': 'Friday',
+    'Sábado': 'Saturday',
+    'Domingo': 'Sunday'
+}
+
+DIAS_INGLES_A_ESPANOL = {v: k for k, v in DIAS_ESPANOL_A_INGLES.items()}
+
+# Sin listeners activos la caché caduca sola pasado este tiempo
+VIGENCIA_SIN_VIGILANCIA_SEGUNDOS = 300
+
+# Si Firestore no responde, se sigue con la copia local y se reintenta tras esto
+ESPERA_REINTENTO_SEGUNDOS = 30
+
+# ==================== CACHÉ ====================
+_cache = {
+    'entradas': None,   # Resultado de cargar_horarios()
+    'salones': None,    # Catálogo de salones
+    'etag': None,       # Huella del catálogo
+    'marca': 0.0,       # Momento de la última carga o reconciliación
+    'vigente': False,   # False cuando un listener avisó de un cambio
+    'reintento': 0.0    # No volver a intentar antes de este momento
+}
+
+# Documentos de origen, para reconciliar por update_time y para la instantánea:
+# {'cursos': {curso_id: {'datos', 'marca'}},
+#  'grupos': {ruta: {'curso_id', 'grupo_id', 'datos', 'marca'}}}
+_documentos = {'cursos': None, 'grupos': None}
+
+_lock = threading.RLock()
+_refrescando = False
+_suscriptores = []
+_watches = []
+
+# Índice del día: {'fecha': date, 'por_salon': {salon: (aperturas, sesiones)}}
+_indice = {'fecha': None, 'por_salon': {}}
+
+
+def _registro_grupo(group_doc):
+    """Registro de un grupo, o None si la subcolección 'groups' no cuelga de 'courses'."""
+    curso_ref = group_doc.reference.parent.parent
+    if curso_ref is None or curso_ref.parent.id != repositorio.COLECCION_CURSOS:
+        return None
+    return {
+        'curso_id': curso_ref.id,
+        'grupo_id': group_doc.id,
+        'datos': group_doc.to_dict() or {},
+        'marca': repositorio.marca_tiempo(group_doc.update_time)
+    }
+
+
+def _leer_documentos(profesor_id=None):
+    """
+    Lee cursos y grupos (con proyección). Las dos consultas son independientes:
+    se lanzan a la vez.
+
+    Returns:
+        tuple: (cursos, grupos) en el formato de _documentos
+    """
+    docs_cursos, docs_grupos = repositorio.leer_en_paralelo(
+        lambda: repositorio.consultar_cursos(CAMPOS_CURSO, profesor_id),
+        lambda: repositorio.consultar_grupos(CAMPOS_GRUPO)
+    )
+
+    cursos = {
+        curso_doc.id: {'datos': curso_doc.to_dict() or {}, 'marca': repositorio.marca_tiempo(curso_doc.update_time)}
+        for curso_doc in docs_cursos
+    }
+    grupos = {}
+    for group_doc in docs_grupos:
+        registro = _registro_grupo(group_doc)
+        if registro:
+            grupos[group_doc.reference.path] = registro
+    return cursos, grupos
+
+
+def _construir_entradas(cursos, grupos):
+    """
+    Entradas de horario a partir de los documentos.
+
+    Maneja los dos casos de siempre:
+    1. Cursos con subcolección 'groups' (se usa el horario de los grupos)
+    2. Cursos con campo 'schedule' directo
+    """
+    grupos_por_curso = {}
+    for registro in sorted(grupos.values(), key=lambda r: (r['curso_id'], r['grupo_id'])):
+        grupos_por_curso.setdefault(registro['curso_id'], []).append(
+            (registro['grupo_id'], registro['datos'].get('schedule', []))
+        )
+
+    entradas = []
+    for curso_id in sorted(cursos):
+        curso_data = cursos[curso_id]['datos']
+        nombre_curso = curso_data.get('nameCourse', 'Sin nombre')
+
+        if curso_id in grupos_por_curso:
+            # CASO 1: Horario de los grupos
+            for group_id, schedule in grupos_por_curso[curso_id]:
+                for horario in schedule:
+                    entradas.append({
+                        'course_id': curso_id,
+                        'nombre_curso': nombre_curso,
+                        'group_id': group_id,
+                        'horario': horario
+                    })
+        else:
+            # CASO 2: Schedule directo
+            for horario in curso_data.get('schedule', []):
+                entradas.append({
+                    'course_id': curso_id,
+                    'nombre_curso': nombre_curso,
+                    'group_id': None,
+                    'horario': horario
+                })
+
+    return entradas
+
+
+def cargar_horarios(profesor_id=None):
+    """
+    Carga todas las entradas de horario directamente de Firestore (sin caché).
+
+    Args:
+        profesor_id: Limitar a los cursos de un profesor (opcional)
+
+    Returns:
+        list: Entradas {'course_id', 'nombre_curso', 'group_id', 'horario'},
+              donde 'horario' es el diccionario original (day, iniTime, endTime, classroom)
+              y 'group_id' es None para el schedule directo
+    """
+    return _construir_entradas(*_leer_documentos(profesor_id))
+
+
+def extraer_salones(entradas):
+    """Salones únicos (ordenados) presentes en las entradas de horario."""
+    salones = set()
+    for entrada in entradas:
+        classroom = entrada['horario'].get('classroom', '').strip()
+        if classroom:
+            salones.add(classroom)
+    return sorted(salones)
+
+
+def _calcular_etag(salones):
+    """Huella estable del catálogo (no cambia entre reinicios si el contenido es el mismo)."""
+    contenido = json.dumps(salones, ensure_ascii=False).encode('utf-8')
+    return hashlib.blake2b(contenido, digest_size=12).hexdigest()
+
+
+def _actualizar_cache(cursos, grupos):
+    """
+    Sustituye documentos y entradas (llamar con _lock tomado).
+
+    Returns:
+        bool: True si las entradas cambiaron
+    """
+    entradas = _construir_entradas(cursos, grupos)
+    salones = extraer_salones(entradas)
+    cambio = entradas != _cache['entradas']
+    _documentos['cursos'] = cursos
+    _documentos['grupos'] = grupos
+    _cache.update({
+        'entradas': entradas,
+        'salones': salones,
+        'etag': _calcular_etag(salones),
+        'marca': time.time(),
+        'vigente': True
+    })
+    if cambio:
+        _indice['fecha'] = None
+    return cambio
+
+
+def _cache_vigente():
+    if _cache['entradas'] is None or not _cache['vigente']:
+        return False
+    if _watches:
+        return True
+    return time.time() - _cache['marca'] < VIGENCIA_SIN_VIGILANCIA_SEGUNDOS
+
+
+def reconciliar():
+    """
+    Pone la caché al día leyendo solo lo que cambió: un listado sin campos
+    (IDs + update_time) de cursos y grupos, y get_all de los documentos nuevos
+    o modificados. Las lecturas se hacen sin bloquear a quien consulta la caché.
+    Avisa a los suscriptores si el horario cambió.
+
+    Returns:
+        int: Número de documentos añadidos, modificados o eliminados
+    """
+    with _lock:
+        cursos = dict(_documentos['cursos']) if _documentos['cursos'] is not None else None
+        grupos = dict(_documentos['grupos']) if _documentos['grupos'] is not None else None
+
+    if cursos is None:
+        # Sin copia previa: carga completa
+        cursos, grupos = _leer_documentos()
+        cambios = len(cursos) + len(grupos)
+    else:
+        versiones_cursos, versiones_grupos = repositorio.leer_en_paralelo(
+            repositorio.versiones_cursos,
+            repositorio.versiones_grupos
+        )
+        # Solo los grupos de cursos ('courses/<curso>/groups/<grupo>')
+        versiones_grupos = {
+            ruta: marca for ruta, marca in versiones_grupos.items()
+            if ruta.split('/')[0] == repositorio.COLECCION_CURSOS and len(ruta.split('/')) == 4
+        }
+
+        cursos_cambiados = [c for c, marca in versiones_cursos.items()
+                            if c not in cursos or cursos[c]['marca'] != marca]
+        grupos_cambiados = [r for r, marca in versiones_grupos.items()
+                            if r not in grupos or grupos[r]['marca'] != marca]
+        eliminados = [c for c in cursos if c not in versiones_cursos] + \
+                     [r for r in grupos if r not in versiones_grupos]
+
+        docs_cursos, docs_grupos = repositorio.leer_en_paralelo(
+            lambda: repositorio.obtener_cursos(cursos_cambiados, CAMPOS_CURSO),
+            lambda: repositorio.obtener_documentos(grupos_cambiados, CAMPOS_GRUPO)
+        )
+        for curso_doc in docs_cursos:
+            if curso_doc.exists:
+                cursos[curso_doc.id] = {'datos': curso_doc.to_dict() or {},
+                                        'marca': repositorio.marca_tiempo(curso_doc.update_time)}
+        for group_doc in docs_grupos:
+            registro = _registro_grupo(group_doc) if group_doc.exists else None
+            if registro:
+                grupos[group_doc.reference.path] = registro
+        for clave in eliminados:
+            cursos.pop(clave, None)
+            grupos.pop(clave, None)
+
+        cambios = len(cursos_cambiados) + len(grupos_cambiados) + len(eliminados)
+
+    with _lock:
+        cambio = _actualizar_cache(cursos, grupos)
+        entradas, salones = len(_cache['entradas']), len(_cache['salones'])
+
+    print(f"📚 Horario al día: {entradas} entradas, {salones} salones ({cambios} documentos leídos)")
+    if cambio:
+        _notificar()
+    return cambios
+
+
+def _refrescar():
+    """Reconciliación en segundo plano; mientras tanto se sirve la copia anterior."""
+    global _refrescando
+    try:
+        reconciliar()
+    except Exception as e:
+        print(f"⚠️ No se pudo actualizar el horario (se usa la copia local): {e}")
+        with _lock:
+            _cache['reintento'] = time.time() + ESPERA_REINTENTO_SEGUNDOS
+    finally:
+        with _lock:
+            _refrescando = False
+
+
+def obtener_horarios():
+    """
+    Entradas de horario desde la caché.
+    La primera carga es síncrona; después, si la copia dejó de estar vigente,
+    se sirve igualmente mientras se reconcilia en segundo plano.
+
+    Returns:
+        list: Mismo formato que cargar_horarios()
+    """
+    global _refrescando
+    with _lock:
+        if _cache['entradas'] is None:
+            _actualizar_cache(*_leer_documentos())
+            print(f"📚 Horario cargado: {len(_cache['entradas'])} entradas, {len(_cache['salones'])} salones")
+        elif not _cache_vigente() and not _refrescando and time.time() >= _cache['reintento']:
+            _refrescando = True
+            threading.Thread(target=_refrescar, daemon=True).start()
+        return _cache['entradas']
+
+
+def obtener_catalogo_salones():
+    """
+    Catálogo de salones desde la caché.
+
+    Returns:
+        tuple: (lista de salones, etag)
+    """
+    obtener_horarios()
+    with _lock:
+        return list(_cache['salones']), _cache['etag']
+
+
+def invalidar():
+    """Marca la caché como desactualizada; la reconciliación avisará a los suscriptores."""
+    with _lock:
+        _cache['vigente'] = False
+        _cache['reintento'] = 0.0
+    if _cache['entradas'] is not None:
+        obtener_horarios()
+
+
+def _notificar():
+    for callback in list(_suscriptores):
+        try:
+            callback()
+        except Exception as e:
+            print(f"⚠️ Error notificando cambio de horario: {e}")
+
+
+def exportar():
+    """Documentos de origen del horario, para la instantánea en disco (o None)."""
+    with _lock:
+        if _documentos['cursos'] is None:
+            return None
+        return {'cursos': dict(_documentos['cursos']), 'grupos': dict(_documentos['grupos'])}
+
+
+def importar(documentos):
+    """
+    Restaura la caché desde la instantánea, sin leer Firestore.
+    Queda marcada como no vigente: la próxima consulta la reconcilia en segundo plano.
+    """
+    with _lock:
+        _actualizar_cache(documentos['cursos'], documentos['grupos'])
+        _cache['vigente'] = False
+        print(f"📚 Horario desde instantánea: {len(_cache['entradas'])} entradas, {len(_cache['salones'])} salones")
+
+
+def suscribir(callback):
+    """Registra una función sin argumentos que se llama cada vez que cambia el horario."""
+    if callback not in _suscriptores:
+        _suscriptores.append(callback)
+
+
+def vigilar():
+    """
+    Escucha cambios en 'courses' y en las subcolecciones 'groups' para
+    invalidar la caché (y avisar a los suscriptores) cuando cambia el horario.
+    Llamarlo más de una vez no crea listeners duplicados.
+
+    Returns:
+        list: Watches activos (para poder cancelarlos con .unsubscribe())
+    """
+    def crear_callback():
+        # La primera notificación es la carga inicial, no un cambio
+        estado = {'inicial': True}
+        def al_cambiar(docs, cambios, momento):
+            if estado['inicial']:
+                estado['inicial'] = False
+                return
+            invalidar()
+        return al_cambiar
+
+    with _lock:
+        if _watches:
+            return list(_watches)
+        try:
+            _watches.extend([
+                repositorio.vigilar_cursos(crear_callback()),
+                repositorio.vigilar_grupos(crear_callback())
+            ])
+        except Exception as e:
+            print(f"⚠️ No se pudo vigilar el horario: {e}")
+        return list(_watches)
+
+
+# ==================== ÍNDICE DEL DÍA ====================
+def _a_minutos(hora_str):
+    """'HH:MM' → minutos desde medianoche."""
+    hora = datetime.strptime(hora_str, '%H:%M')
+    return hora.hour * 60 + hora.minute
+
+
+def _construir_indice(fecha):
+    """
+    Agrupa las sesiones del día por salón.
+    Cada sesión es (apertura, inicio, cierre, course_id, nombre_curso) en minutos,
+    ordenadas por apertura; 'aperturas' es la columna usada por bisect.
+    """
+    dia_ingles = fecha.strftime('%A')
+    dia_espanol = DIAS_INGLES_A_ESPANOL.get(dia_ingles, dia_ingles)
+
+    sesiones_por_salon = {}
+    for entrada in obtener_horarios():
+        horario = entrada['horario']
+        if horario.get('day', '') not in (dia_espanol, dia_ingles):
+            continue
+        classroom = horario.get('classroom', '').strip()
+        if not classroom:
+            continue
+        try:
+            inicio = _a_minutos(horario.get('iniTime', ''))
+        except ValueError:
+            continue
+        sesiones_por_salon.setdefault(classroom, set()).add((
+            inicio - MINUTOS_APERTURA_ANTICIPADA,
+            inicio,
+            inicio + MINUTOS_CIERRE_REGISTRO,
+            entrada['course_id'],
+            entrada['nombre_curso']
+        ))
+
+    por_salon = {}
+    for salon, sesiones in sesiones_por_salon.items():
+        sesiones = sorted(sesiones)
+        por_salon[salon] = ([sesion[0] for sesion in sesiones], sesiones)
+    return por_salon
+
+
+def indice_salon(salon, fecha):
+    """
+    Sesiones del día de un salón.
+
+    Returns:
+        tuple: (aperturas, sesiones) - listas ordenadas por apertura
+    """
+    obtener_horarios()
+    with _lock:
+        if _indice['fecha'] != fecha:
+            _indice['por_salon'] = _construir_indice(fecha)
+            _indice['fecha'] = fecha
+        return _indice['por_salon'].get(salon, ([], []))
+
+
+def consultar_salon(salon, ahora=None):
+    """
+    Estado de un salón en un instante, con una sola búsqueda binaria.
+
+    Args:
+        salon: Nombre del salón
+        ahora: datetime a consultar (por defecto, ahora)
+
+    Returns:
+        dict: {'activo': {'curso_id', 'nombre_curso', 'hora_inicio'} o None,
+               'proximo': {'curso_id', 'nombre_curso', 'hora_inicio',
+                           'minutos_para_inicio', 'salon'} o None,
+               'segundos_vigencia': segundos hasta el próximo cambio de estado}
+    """
+    ahora = ahora or datetime.now()
+    aperturas, sesiones = indice_salon(salon, ahora.date())
+    minuto = ahora.hour * 60 + ahora.minute
+
+    # Última sesión que ya abrió y la primera que aún no
+    i = bisect.bisect_right(aperturas, minuto) - 1
+    actual = sesiones[i] if i >= 0 else None
+    siguiente = sesiones[i + 1] if i + 1 < len(sesiones) else None
+
+    activo = None
+    proximo = None
+    # Todas las ventanas duran lo mismo: si la última abierta ya cerró, las anteriores también
+    if actual and minuto <= actual[2]:
+        activo = {
+            'curso_id': actual[3],
+            'nombre_curso': actual[4],
+            'hora_inicio': _formatear(actual[1])
+        }
+    elif siguiente and siguiente[0] - minuto <= MINUTOS_AVISO_PROXIMO:
+        proximo = {
+            'curso_id': siguiente[3],
+            'nombre_curso': siguiente[4],
+            'hora_inicio': _formatear(siguiente[1]),
+            'minutos_para_inicio': siguiente[0] - minuto,  # Minutos para que ABRA el registro
+            'salon': salon
+        }
+
+    # Próximo minuto en que la respuesta cambia
+    cambios = [24 * 60]
+    if activo:
+        cambios.append(actual[2] + 1)
+    if siguiente:
+        cambios.append(siguiente[0])
+        if siguiente[0] - minuto > MINUTOS_AVISO_PROXIMO:
+            cambios.append(siguiente[0] - MINUTOS_AVISO_PROXIMO)
+        else:
+            cambios.append(minuto + 1)  # El contador avanza cada minuto
+
+    segundos = min(cambios) * 60 - (minuto * 60 + ahora.second)
+    return {
+        'activo': activo,
+        'proximo': proximo,
+        'segundos_vigencia': max(1, min(segundos, MAX_VIGENCIA_ESTADO_SEGUNDOS))
+    }
+
+
+def _formatear(minutos):
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
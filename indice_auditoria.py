@@ -0,0 +1,241 @@
+"""
+indice_auditoria.py
+Índice SQLite de los eventos de auditoría.
+El log JSONL sigue siendo el registro original; esta base permite filtrar por
+tipo, usuario, curso y rango de fechas sin recorrerlo, paginar con cursor y
+exportar por bloques sin cargarlo todo en memoria.
+Los eventos que ya están en segmentos sellados y son antiguos se podan de la
+tabla; de esos segmentos solo se guarda su rango de ids y fechas.
+"""
+
+import json
+import sqlite3
+import threading
+
+ARCHIVO_INDICE = 'indice_auditoria.db'
+
+# Filas por consulta al recorrer una exportación
+TAMANO_BLOQUE_EXPORTACION = 1000
+
+ESQUEMA = '''
+CREATE TABLE IF NOT EXISTS eventos (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    usuario TEXT,
+    curso TEXT,
+    descripcion TEXT,
+    datos TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_eventos_timestamp ON eventos(timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_eventos_tipo ON eventos(tipo, id);
+CREATE INDEX IF NOT EXISTS idx_eventos_usuario ON eventos(usuario, id);
+CREATE INDEX IF NOT EXISTS idx_eventos_curso ON eventos(curso, id);
+CREATE TABLE IF NOT EXISTS segmentos (
+    archivo TEXT PRIMARY KEY,
+    primer_id INTEGER,
+    ultimo_id INTEGER,
+    desde TEXT,
+    hasta TEXT,
+    eventos INTEGER,
+    bytes INTEGER
+);
+'''
+
+_local = threading.local()
+_lock_esquema = threading.Lock()
+_esquema_creado = False
+
+
+def _conexion():
+    """Una conexión por hilo (WAL: las lecturas no esperan a las escrituras)."""
+    global _esquema_creado
+    conexion = getattr(_local, 'conexion', None)
+    if conexion is None:
+        conexion = sqlite3.connect(ARCHIVO_INDICE, timeout=30)
+        conexion.row_factory = sqlite3.Row
+        conexion.execute('PRAGMA journal_mode=WAL')
+        conexion.execute('PRAGMA synchronous=NORMAL')
+        with _lock_esquema:
+            if not _esquema_creado:
+                conexion.executescript(ESQUEMA)
+                _esquema_creado = True
+        _local.conexion = conexion
+    return conexion
+
+
+def _fila(evento):
+    datos = evento.get('datos_adicionales') or {}
+    curso = datos.get('curso') if isinstance(datos, dict) else None
+    usuario = evento.get('usuario')
+    return (
+        evento.get('id'),
+        evento.get('timestamp') or '',
+        evento.get('tipo') or '',
+        str(usuario) if usuario is not None else None,
+        str(curso) if curso is not None else None,
+        evento.get('descripcion'),
+        json.dumps(datos, ensure_ascii=False)
+    )
+
+
+def _evento(fila):
+    return {
+        'id': fila['id'],
+        'timestamp': fila['timestamp'],
+        'tipo': fila['tipo'],
+        'descripcion': fila['descripcion'],
+        'usuario': fila['usuario'],
+        'datos_adicionales': json.loads(fila['datos']) if fila['datos'] else {}
+    }
+
+
+def insertar(eventos):
+    """Inserta un lote de eventos (los ya presentes se ignoran)."""
+    conexion = _conexion()
+    with conexion:
+        conexion.executemany(
+            'INSERT OR IGNORE INTO eventos (id, timestamp, tipo, usuario, curso, descripcion, datos) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [_fila(evento) for evento in eventos]
+        )
+
+
+def ultimo_id():
+    fila = _conexion().execute('SELECT MAX(id) FROM eventos').fetchone()
+    return fila[0] or 0
+
+
+def primer_id():
+    """Menor id presente en la tabla: lo anterior solo está en segmentos sellados."""
+    fila = _conexion().execute('SELECT MIN(id) FROM eventos').fetchone()
+    return fila[0]
+
+
+# ==================== SEGMENTOS SELLADOS ====================
+def registrar_segmento(archivo, primer_id, ultimo_id, desde, hasta, eventos, bytes):
+    conexion = _conexion()
+    with conexion:
+        conexion.execute(
+            'INSERT OR REPLACE INTO segmentos (archivo, primer_id, ultimo_id, desde, hasta, eventos, bytes) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (archivo, primer_id, ultimo_id, desde, hasta, eventos, bytes)
+        )
+
+
+def ultimo_id_sellado():
+    fila = _conexion().execute('SELECT MAX(ultimo_id) FROM segmentos').fetchone()
+    return fila[0] or 0
+
+
+def segmentos(desde=None, hasta=None, antes_de_id=None, descendente=False):
+    """
+    Segmentos sellados cuyo rango cruza [desde, hasta) y que tienen ids
+    menores que 'antes_de_id'.
+
+    Returns:
+        list: dicts con archivo, primer_id, ultimo_id, desde, hasta, eventos, bytes
+    """
+    condiciones = []
+    parametros = []
+    if desde:
+        condiciones.append('hasta >= ?')
+        parametros.append(desde)
+    if hasta:
+        condiciones.append('desde < ?')
+        parametros.append(hasta)
+    if antes_de_id is not None:
+        condiciones.append('primer_id < ?')
+        parametros.append(antes_de_id)
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ''
+    orden = 'DESC' if descendente else 'ASC'
+    filas = _conexion().execute(
+        f'SELECT * FROM segmentos {where} ORDER BY primer_id {orden}', parametros
+    ).fetchall()
+    return [dict(fila) for fila in filas]
+
+
+def podar(limite_timestamp):
+    """
+    Quita de la tabla los eventos anteriores a 'limite_timestamp' que ya están
+    sellados. Siempre se quita un prefijo de ids, para que primer_id() marque
+    la frontera entre tabla y segmentos.
+
+    Returns:
+        int: Filas eliminadas
+    """
+    conexion = _conexion()
+    with conexion:
+        cursor = conexion.execute(
+            'DELETE FROM eventos WHERE id <= MIN('
+            '(SELECT MAX(ultimo_id) FROM segmentos), '
+            '(SELECT MAX(id) FROM eventos WHERE timestamp < ?))',
+            (limite_timestamp,)
+        )
+    return cursor.rowcount
+
+
+def _filtros(tipo=None, usuario=None, curso=None, desde=None, hasta=None):
+    """Cláusula WHERE y parámetros. 'desde' es inclusivo y 'hasta' exclusivo (ISO)."""
+    condiciones = []
+    parametros = []
+    for columna, valor in (('tipo', tipo), ('usuario', usuario), ('curso', curso)):
+        if valor is not None:
+            condiciones.append(f'{columna} = ?')
+            parametros.append(str(valor))
+    if desde:
+        condiciones.append('timestamp >= ?')
+        parametros.append(desde)
+    if hasta:
+        condiciones.append('timestamp < ?')
+        parametros.append(hasta)
+    return condiciones, parametros
+
+
+def consultar(tipo=None, usuario=None, curso=None, desde=None, hasta=None, cursor=None, limite=100):
+    """
+    Página de eventos, del más reciente al más antiguo.
+
+    Args:
+        tipo, usuario, curso: Filtros exactos (opcionales)
+        desde, hasta: Rango de timestamp ISO, [desde, hasta)
+        cursor: 'siguiente_cursor' de la página anterior (None = la primera)
+        limite: Eventos por página
+
+    Returns:
+        tuple: (eventos, siguiente_cursor o None si no hay más)
+    """
+    condiciones, parametros = _filtros(tipo, usuario, curso, desde, hasta)
+    if cursor is not None:
+        condiciones.append('id < ?')
+        parametros.append(int(cursor))
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ''
+
+    filas = _conexion().execute(
+        f'SELECT * FROM eventos {where} ORDER BY id DESC LIMIT ?',
+        parametros + [limite + 1]
+    ).fetchall()
+
+    eventos = [_evento(fila) for fila in filas[:limite]]
+    siguiente = eventos[-1]['id'] if len(filas) > limite else None
+    return eventos, siguiente
+
+
+def iterar(tipo=None, usuario=None, curso=None, desde=None, hasta=None):
+    """
+    Recorre los eventos que cumplen los filtros en orden cronológico, por
+    bloques de TAMANO_BLOQUE_EXPORTACION (memoria constante).
+    """
+    condiciones, parametros = _filtros(tipo, usuario, curso, desde, hasta)
+    ultimo = 0
+    while True:
+        where = ' AND '.join(condiciones + ['id > ?'])
+        filas = _conexion().execute(
+            f'SELECT * FROM eventos WHERE {where} ORDER BY id LIMIT ?',
+            parametros + [ultimo, TAMANO_BLOQUE_EXPORTACION]
+        ).fetchall()
+        if not filas:
+            return
+        for fila in filas:
+            yield _evento(fila)
+        ultimo = filas[-1]['id']
@@ -0,0 +1,155 @@
+"""
+instantanea.py
+Instantánea en disco (msgpack) del horario, el índice de estudiantes y el
+estado de asistencia del día.
+Al arrancar, el kiosco se prepara leyendo este archivo en lugar de recorrer
+Firestore, y después se reconcilia en segundo plano comparando update_time.
+Si Firestore no responde al arrancar, se trabaja con lo guardado.
+"""
+
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+import cache_asistencia
+import estudiantes
+import horarios
+import scheduler_asistencia
+
+ARCHIVO_INSTANTANEA = 'instantanea_kiosco.msgpack'
+VERSION_FORMATO = 1
+
+# Cada cuánto se reconcilia con Firestore y se vuelve a guardar
+INTERVALO_GUARDADO_SEGUNDOS = 300
+
+# Espera antes de reintentar si Firestore no está disponible
+ESPERA_REINTENTO_SEGUNDOS = 30
+
+_hilo = None
+
+
+def _serializar(valor):
+    """Tipos que msgpack no conoce (p. ej. marcas de tiempo de Firestore)."""
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return str(valor)
+
+
+def guardar():
+    """
+    Escribe la instantánea (escritura atómica: archivo temporal + os.replace).
+
+    Returns:
+        bool: True si se guardó
+    """
+    if msgpack is None:
+        return False
+
+    hoy = datetime.now().strftime('%Y-%m-%d')
+    contenido = {
+        'version': VERSION_FORMATO,
+        'guardado': datetime.now().isoformat(),
+        'horario': horarios.exportar(),
+        'estudiantes': estudiantes.exportar(),
+        'asistencia': {
+            'fecha': hoy,
+            'inicializados': sorted(
+                doc for doc in scheduler_asistencia.documentos_inicializados if doc.endswith(hoy)
+            ),
+            'sesiones': cache_asistencia.exportar(hoy)
+        }
+    }
+
+    try:
+        datos = msgpack.packb(contenido, use_bin_type=True, default=_serializar)
+        ruta_temporal = ARCHIVO_INSTANTANEA + '.tmp'
+        with open(ruta_temporal, 'wb') as f:
+            f.write(datos)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(ruta_temporal, ARCHIVO_INSTANTANEA)
+        print(f"💾 Instantánea guardada ({len(datos) / 1024:.1f} KB)")
+        return True
+    except Exception as e:
+        print(f"⚠️ Error guardando instantánea: {e}")
+        return False
+
+
+def cargar():
+    """
+    Restaura horario, índice de estudiantes y asistencia del día desde el archivo.
+
+    Returns:
+        bool: True si se cargó una instantánea válida
+    """
+    if msgpack is None:
+        print("ℹ️ msgpack no está instalado: arranque sin instantánea")
+        return False
+    if not os.path.exists(ARCHIVO_INSTANTANEA):
+        return False
+
+    try:
+        with open(ARCHIVO_INSTANTANEA, 'rb') as f:
+            contenido = msgpack.unpackb(f.read(), raw=False, strict_map_key=False)
+
+        if contenido.get('version') != VERSION_FORMATO:
+            print(f"⚠️ Instantánea con formato {contenido.get('version')} ignorada")
+            return False
+
+        if contenido.get('horario'):
+            horarios.importar(contenido['horario'])
+        if contenido.get('estudiantes') is not None:
+            estudiantes.importar(contenido['estudiantes'])
+
+        asistencia = contenido.get('asistencia') or {}
+        if asistencia.get('fecha') == datetime.now().strftime('%Y-%m-%d'):
+            scheduler_asistencia.documentos_inicializados.update(asistencia.get('inicializados', []))
+            cache_asistencia.importar(asistencia['fecha'], asistencia.get('sesiones') or {})
+
+        print(f"⚡ Instantánea cargada (guardada {contenido.get('guardado')})")
+        return True
+    except Exception as e:
+        print(f"⚠️ Instantánea ilegible, se ignora: {e}")
+        return False
+
+
+def reconciliar():
+    """Pone horario e índice al día con Firestore (solo lo cambiado) y guarda."""
+    horarios.reconciliar()
+    estudiantes.reconciliar()
+    guardar()
+
+
+def _mantener():
+    """Hilo de fondo: reconcilia y guarda periódicamente."""
+    while True:
+        try:
+            reconciliar()
+            espera = INTERVALO_GUARDADO_SEGUNDOS
+        except Exception as e:
+            print(f"⚠️ Firestore no disponible, se sigue con la instantánea: {e}")
+            espera = ESPERA_REINTENTO_SEGUNDOS
+        time.sleep(espera)
+
+
+def iniciar():
+    """
+    Carga la instantánea y arranca la reconciliación en segundo plano.
+
+    Returns:
+        bool: True si se partió de una instantánea
+    """
+    global _hilo
+    cargada = cargar()
+    if _hilo is None:
+        _hilo = threading.Thread(target=_mantener, daemon=True)
+        _hilo.start()
+        atexit.register(guardar)
+    return cargada
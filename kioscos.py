@@ -0,0 +1,145 @@
+"""
+kioscos.py
+Registro de kioscos y salones.
+Cada kiosco (identificado por un ID) tiene su salón configurado, y cada salón
+su propio estado de reconocimiento. Así un solo proceso, con un solo modelo y
+un solo cliente de Firebase, atiende todos los salones de un edificio.
+"""
+
+import json
+import os
+import threading
+
+KIOSCOS_FILE = 'kioscos_config.json'
+
+# Formato anterior: un único salón por servidor
+SALON_CONFIG_FILE = 'salon_config.txt'
+
+# Kiosco usado cuando la solicitud no trae identificador
+KIOSCO_POR_DEFECTO = 'principal'
+
+# {kiosco_id: nombre_salon}
+_salones_por_kiosco = {}
+
+# {nombre_salon: {'reconocidos': set(), 'tiempos': {}}}
+_estado_por_salon = {}
+
+_lock = threading.RLock()
+_cargado = False
+
+
+def cargar():
+    """
+    Carga la configuración de kioscos desde archivo.
+    Si solo existe el 'salon_config.txt' anterior, lo migra como kiosco por defecto.
+    """
+    global _salones_por_kiosco, _cargado
+    with _lock:
+        try:
+            if os.path.exists(KIOSCOS_FILE):
+                with open(KIOSCOS_FILE, 'r', encoding='utf-8') as f:
+                    _salones_por_kiosco = json.load(f)
+            elif os.path.exists(SALON_CONFIG_FILE):
+                with open(SALON_CONFIG_FILE, 'r', encoding='utf-8') as f:
+                    salon = f.read().strip()
+                if salon:
+                    _salones_por_kiosco = {KIOSCO_POR_DEFECTO: salon}
+                    _guardar()
+                    print(f"🔁 '{SALON_CONFIG_FILE}' migrado: kiosco '{KIOSCO_POR_DEFECTO}' → '{salon}'")
+        except Exception as e:
+            print(f"⚠️ Error cargando kioscos: {e}")
+        _cargado = True
+        print(f"✔ Kioscos cargados: {_salones_por_kiosco}")
+        return dict(_salones_por_kiosco)
+
+
+def _asegurar_cargado():
+    if not _cargado:
+        cargar()
+
+
+def _guardar():
+    """Persiste la configuración de kioscos (escritura atómica)."""
+    ruta_temporal = KIOSCOS_FILE + '.tmp'
+    with open(ruta_temporal, 'w', encoding='utf-8') as f:
+        json.dump(_salones_por_kiosco, f, indent=2, ensure_ascii=False)
+    os.replace(ruta_temporal, KIOSCOS_FILE)
+
+
+def obtener_salon(kiosco):
+    """Retorna el salón configurado para el kiosco, o None."""
+    with _lock:
+        _asegurar_cargado()
+        return _salones_por_kiosco.get(kiosco)
+
+
+def configurar_salon(kiosco, salon):
+    """
+    Asigna un salón a un kiosco y lo persiste.
+    Si el kiosco cambia de salón, el estado de reconocimiento de un salón solo
+    se reinicia cuando ningún otro kiosco sigue en él: el nuevo para que se
+    reintente la asistencia, el anterior para no dejar estado sin uso. Así
+    reconfigurar un kiosco no hace que los demás del mismo salón vuelvan a
+    registrar a quien ya procesaron.
+
+    Returns:
+        bool: True si se configuró exitosamente
+    """
+    salon = salon.strip()
+    with _lock:
+        _asegurar_cargado()
+        try:
+            anterior = _salones_por_kiosco.get(kiosco)
+            _salones_por_kiosco[kiosco] = salon
+            _guardar()
+            if anterior != salon:
+                for afectado in (anterior, salon):
+                    if afectado and not _otros_kioscos_en(afectado, kiosco):
+                        limpiar_estado(afectado)
+            print(f"💾 Kiosco '{kiosco}' → salón '{salon}'")
+            return True
+        except Exception as e:
+            print(f"❌ Error guardando kiosco: {e}")
+            return False
+
+
+def _otros_kioscos_en(salon, kiosco):
+    """True si algún kiosco distinto de 'kiosco' tiene asignado 'salon'."""
+    return any(s == salon for k, s in _salones_por_kiosco.items() if k != kiosco)
+
+
+def estado_salon(salon):
+    """
+    Estado de reconocimiento del salón (se crea si no existe):
+    {'reconocidos': set de estudiantes ya procesados,
+     'tiempos': {estudiante: primer instante en que se le vio}}
+    """
+    with _lock:
+        estado = _estado_por_salon.get(salon)
+        if estado is None:
+            estado = {'reconocidos': set(), 'tiempos': {}}
+            _estado_por_salon[salon] = estado
+        return estado
+
+
+def limpiar_estado(salon=None):
+    """Limpia el estado de reconocimiento de un salón (o de todos si salon es None)."""
+    with _lock:
+        if salon is None:
+            _estado_por_salon.clear()
+        else:
+            _estado_por_salon.pop(salon, None)
+
+
+def salones_configurados():
+    """Conjunto de salones que tienen al menos un kiosco asignado."""
+    with _lock:
+        _asegurar_cargado()
+        return {salon for salon in _salones_por_kiosco.values() if salon}
+
+
+def listar():
+    """Copia del mapa {kiosco: salón}."""
+    with _lock:
+        _asegurar_cargado()
+        return dict(_salones_por_kiosco)
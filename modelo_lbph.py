@@ -0,0 +1,355 @@
+"""
+modelo_lbph.py
+Manifiesto de etiquetas del modelo LBPH y operaciones sobre sus muestras.
+El manifiesto (JSON junto al modelo) guarda carpeta → etiqueta, las etiquetas
+retiradas y la siguiente libre; una etiqueta nunca se reutiliza. Sustituye al
+mapeo derivado de os.listdir(Data), que cambiaba al añadir o borrar carpetas.
+Quitar a un estudiante reescribe el modelo sin sus histogramas (mismo formato
+'opencv_lbphfaces' que LBPHFaceRecognizer.write) en lugar de reentrenar.
+La compactación quita muestras repetidas y limita las de cada etiqueta, para
+que el coste de predict() no crezca con cada reinscripción.
+
+Uso (mantenimiento):
+    python modelo_lbph.py estado                 # muestras por etiqueta
+    python modelo_lbph.py compactar [--max 60]   # deduplicar y limitar
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+VERSION_MANIFIESTO = 1
+
+# Muestras que se conservan por etiqueta (un registro captura 100 fotos)
+MAX_MUESTRAS_POR_ETIQUETA = int(os.environ.get('MODELO_MAX_MUESTRAS', 60))
+
+# Serializa entrenamiento, retirada y compactación sobre el reconocedor del proceso
+lock = threading.RLock()
+
+_ruta_manifiesto = None
+_manifiesto = {
+    'version': VERSION_MANIFIESTO,
+    'etiquetas': {},     # {carpeta: etiqueta}
+    'retiradas': {},     # {etiqueta (texto): {'carpeta': ..., 'fecha': ...}}
+    'siguiente': 0
+}
+_por_etiqueta = {}
+
+
+def ruta_manifiesto(ruta_modelo):
+    return ruta_modelo[:-len('.xml')] + '_manifiesto.json'
+
+
+def ruta_temporal(ruta_modelo):
+    """
+    Temporal propio de este proceso e hilo para escribir el modelo antes del
+    os.replace: el servidor y la herramienta de mantenimiento nunca comparten
+    uno a medio escribir. Termina en .xml (FileStorage elige el formato por la
+    extensión).
+    """
+    return f"{ruta_modelo[:-len('.xml')]}.{os.getpid()}.{threading.get_ident()}.tmp.xml"
+
+
+def _guardar():
+    """Escritura atómica del manifiesto."""
+    temporal = _ruta_manifiesto + '.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(_manifiesto, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, _ruta_manifiesto)
+
+
+def _reindexar():
+    _por_etiqueta.clear()
+    for carpeta, etiqueta in _manifiesto['etiquetas'].items():
+        _por_etiqueta[etiqueta] = carpeta
+
+
+def inicializar(ruta_modelo, carpeta_datos):
+    """
+    Carga el manifiesto. Si no existe pero hay modelo, lo crea una única vez con
+    el mapeo que usaba la versión anterior (posición en os.listdir(Data)).
+    """
+    global _ruta_manifiesto, _manifiesto
+    _ruta_manifiesto = ruta_manifiesto(ruta_modelo)
+
+    with lock:
+        if os.path.exists(_ruta_manifiesto):
+            with open(_ruta_manifiesto, 'r', encoding='utf-8') as f:
+                _manifiesto = json.load(f)
+        elif os.path.exists(ruta_modelo):
+            nombres = os.listdir(carpeta_datos)
+            _manifiesto['etiquetas'] = {nombre: idx for idx, nombre in enumerate(nombres)}
+            _manifiesto['siguiente'] = len(nombres)
+            _guardar()
+            print(f"📋 Manifiesto de etiquetas creado desde Data/ ({len(nombres)} personas)")
+        _reindexar()
+
+
+def asignar_etiqueta(carpeta):
+    """Etiqueta de la carpeta; si es nueva, se le da la siguiente libre."""
+    with lock:
+        if carpeta not in _manifiesto['etiquetas']:
+            etiqueta = _manifiesto['siguiente']
+            _manifiesto['etiquetas'][carpeta] = etiqueta
+            _manifiesto['siguiente'] = etiqueta + 1
+            _por_etiqueta[etiqueta] = carpeta
+            _guardar()
+        return _manifiesto['etiquetas'][carpeta]
+
+
+def etiqueta(carpeta):
+    return _manifiesto['etiquetas'].get(carpeta)
+
+
+def nombre(etiqueta):
+    """Carpeta de una etiqueta activa (None si no existe o está retirada)."""
+    return _por_etiqueta.get(etiqueta)
+
+
+def personas():
+    """Carpetas con etiqueta activa, por orden de etiqueta."""
+    return [_por_etiqueta[e] for e in sorted(_por_etiqueta)]
+
+
+def retirar(carpeta):
+    """
+    Retira la etiqueta de una carpeta: deja de reconocerse en el acto y su
+    número no se vuelve a asignar.
+
+    Returns:
+        int o None si la carpeta no tenía etiqueta
+    """
+    with lock:
+        etiqueta = _manifiesto['etiquetas'].pop(carpeta, None)
+        if etiqueta is None:
+            return None
+        _por_etiqueta.pop(etiqueta, None)
+        _manifiesto['retiradas'][str(etiqueta)] = {
+            'carpeta': carpeta,
+            'fecha': datetime.now().isoformat()
+        }
+        _guardar()
+        return etiqueta
+
+
+# ==================== MUESTRAS DEL MODELO ====================
+def leer_muestras(reconocedor):
+    """
+    Returns:
+        tuple: (histogramas, etiquetas) — lista de matrices 1xN float32 y
+               array int32 de la misma longitud
+    """
+    histogramas = list(reconocedor.getHistograms())
+    etiquetas = np.asarray(reconocedor.getLabels(), dtype=np.int32).reshape(-1)
+    return histogramas, etiquetas
+
+
+def escribir_modelo(reconocedor, histogramas, etiquetas, ruta):
+    """
+    Escribe un modelo LBPH con los parámetros de 'reconocedor' y las muestras
+    indicadas, en el formato de LBPHFaceRecognizer.write() (nodo
+    'opencv_lbphfaces'), sin recalcular ningún histograma.
+    """
+    fs = cv2.FileStorage(ruta, cv2.FILE_STORAGE_WRITE)
+    try:
+        fs.startWriteStruct('opencv_lbphfaces', cv2.FileNode_MAP)
+        fs.write('threshold', float(reconocedor.getThreshold()))
+        fs.write('radius', int(reconocedor.getRadius()))
+        fs.write('neighbors', int(reconocedor.getNeighbors()))
+        fs.write('grid_x', int(reconocedor.getGridX()))
+        fs.write('grid_y', int(reconocedor.getGridY()))
+
+        fs.startWriteStruct('histograms', cv2.FileNode_SEQ)
+        for histograma in histogramas:
+            fs.write('', histograma)
+        fs.endWriteStruct()
+
+        fs.write('labels', np.asarray(etiquetas, dtype=np.int32).reshape(-1, 1))
+
+        # Sin información de etiquetas (no se usa setLabelInfo)
+        fs.startWriteStruct('labelsInfo', cv2.FileNode_SEQ)
+        fs.endWriteStruct()
+        fs.endWriteStruct()
+    finally:
+        fs.release()
+
+
+def cargar(ruta):
+    """
+    Reconocedor nuevo con el modelo de 'ruta'. read() sobre uno ya entrenado
+    añade los histogramas a los que tenía (y reemplaza las etiquetas), así que
+    siempre se lee en uno recién creado.
+    """
+    reconocedor = cv2.face.LBPHFaceRecognizer_create()
+    reconocedor.read(ruta)
+    return reconocedor
+
+
+def quitar_etiquetas(reconocedor, etiquetas_quitar, ruta):
+    """
+    Escribe en 'ruta' el modelo sin las muestras de esas etiquetas.
+
+    Returns:
+        tuple: (reconocedor con el modelo resultante o None si no queda
+                ninguna muestra, muestras quitadas, muestras restantes)
+    """
+    histogramas, etiquetas = leer_muestras(reconocedor)
+    conservar = ~np.isin(etiquetas, list(etiquetas_quitar))
+    quitadas = int(len(etiquetas) - conservar.sum())
+    restantes = [h for h, c in zip(histogramas, conservar) if c]
+
+    escribir_modelo(reconocedor, restantes, etiquetas[conservar], ruta)
+    return (cargar(ruta) if restantes else None), quitadas, len(restantes)
+
+
+# ==================== COMPACTACIÓN ====================
+def _distancias_chi2(histogramas, referencia):
+    """Distancia chi-cuadrado (la de LBPH en predict) de cada fila a 'referencia'."""
+    suma = histogramas + referencia
+    diferencia = histogramas - referencia
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terminos = np.where(suma > 0, diferencia * diferencia / suma, 0.0)
+    return terminos.sum(axis=1)
+
+
+def seleccionar_diversas(histogramas, maximo):
+    """
+    Selección por punto más lejano: empieza por la muestra más cercana a la
+    media y añade cada vez la más alejada de las ya elegidas, para conservar
+    la variedad (poses, luz) con menos muestras.
+
+    Args:
+        histogramas: Matriz NxD float32 (una fila por muestra)
+        maximo: Muestras a conservar
+
+    Returns:
+        list: Índices elegidos, en orden ascendente
+    """
+    n = len(histogramas)
+    if n <= maximo:
+        return list(range(n))
+
+    primera = int(np.argmin(_distancias_chi2(histogramas, histogramas.mean(axis=0))))
+    elegidas = [primera]
+    minimas = _distancias_chi2(histogramas, histogramas[primera])
+    minimas[primera] = -1
+    while len(elegidas) < maximo:
+        siguiente = int(np.argmax(minimas))
+        elegidas.append(siguiente)
+        minimas = np.minimum(minimas, _distancias_chi2(histogramas, histogramas[siguiente]))
+        minimas[elegidas] = -1
+    return sorted(elegidas)
+
+
+def compactar_muestras(histogramas, etiquetas, maximo=None):
+    """
+    Quita histogramas idénticos dentro de cada etiqueta (la misma foto
+    entrenada en varias reinscripciones) y deja como mucho 'maximo' por
+    etiqueta.
+
+    Returns:
+        tuple: (histogramas, etiquetas, estadísticas) o (None, None,
+               estadísticas) si no hay nada que quitar
+    """
+    maximo = maximo or MAX_MUESTRAS_POR_ETIQUETA
+    conservar = []
+    duplicadas = 0
+
+    for etiqueta in np.unique(etiquetas):
+        indices = np.flatnonzero(etiquetas == etiqueta)
+
+        unicos = []
+        vistos = set()
+        for i in indices:
+            huella = hashlib.blake2b(histogramas[i].tobytes(), digest_size=16).digest()
+            if huella not in vistos:
+                vistos.add(huella)
+                unicos.append(i)
+        duplicadas += len(indices) - len(unicos)
+
+        if len(unicos) > maximo:
+            matriz = np.vstack([histogramas[i].reshape(1, -1) for i in unicos]).astype(np.float64)
+            unicos = [unicos[j] for j in seleccionar_diversas(matriz, maximo)]
+        conservar.extend(unicos)
+
+    conservar.sort()
+    estadisticas = {
+        'muestras_antes': len(etiquetas),
+        'muestras_despues': len(conservar),
+        'duplicadas': duplicadas,
+        'limitadas': len(etiquetas) - duplicadas - len(conservar),
+        'max_por_etiqueta': maximo
+    }
+    if len(conservar) == len(etiquetas):
+        return None, None, estadisticas
+    return [histogramas[i] for i in conservar], etiquetas[conservar], estadisticas
+
+
+def compactar_reconocedor(reconocedor, ruta, maximo=None):
+    """
+    Compacta las muestras de 'reconocedor'; si cambia algo, escribe el modelo
+    en 'ruta'.
+
+    Returns:
+        tuple: (reconocedor con el modelo resultante — el mismo si no hubo
+                cambios —, estadísticas con 'reescrito' (bool))
+    """
+    histogramas, etiquetas = leer_muestras(reconocedor)
+    nuevos_histogramas, nuevas_etiquetas, estadisticas = compactar_muestras(histogramas, etiquetas, maximo)
+    estadisticas['reescrito'] = nuevos_histogramas is not None
+    if nuevos_histogramas is None:
+        return reconocedor, estadisticas
+    escribir_modelo(reconocedor, nuevos_histogramas, nuevas_etiquetas, ruta)
+    return cargar(ruta), estadisticas
+
+
+# ==================== LÍNEA DE COMANDOS ====================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mantenimiento del modelo LBPH')
+    parser.add_argument('operacion', choices=['estado', 'compactar'])
+    parser.add_argument('--modelo', default=os.path.join('backend', 'modeloLBPHReconocimientoOpencv.xml'))
+    parser.add_argument('--datos', default='Data', help='Carpeta de estudiantes (para crear el manifiesto)')
+    parser.add_argument('--max', type=int, default=MAX_MUESTRAS_POR_ETIQUETA, help='Muestras por etiqueta')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.modelo):
+        print(f"✖ No existe el modelo {args.modelo}")
+        return 2
+
+    inicializar(args.modelo, args.datos)
+    reconocedor = cargar(args.modelo)
+    _, etiquetas = leer_muestras(reconocedor)
+
+    if args.operacion == 'estado':
+        valores, cuentas = np.unique(etiquetas, return_counts=True)
+        print(f"\n{'Etiqueta':>8}  {'Muestras':>8}  Carpeta")
+        for valor, cuenta in zip(valores, cuentas):
+            print(f"{int(valor):>8}  {int(cuenta):>8}  {nombre(int(valor)) or '(retirada)'}")
+        print(f"\n{len(etiquetas)} muestras, {len(valores)} etiquetas")
+        return 0
+
+    inicio = time.time()
+    temporal = ruta_temporal(args.modelo)
+    _, estadisticas = compactar_reconocedor(reconocedor, temporal, args.max)
+    if estadisticas['reescrito']:
+        # Mismo publicado atómico que el servidor: los procesos de visión lo recargan solos
+        os.replace(temporal, args.modelo)
+    print(f"🗜️ {estadisticas['muestras_antes']} → {estadisticas['muestras_despues']} muestras "
+          f"({estadisticas['duplicadas']} duplicadas, {estadisticas['limitadas']} por encima de "
+          f"{estadisticas['max_por_etiqueta']}/etiqueta) en {time.time() - inicio:.2f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, redirect, Response, send_file
+from flask import Flask, render_template, request, jsonify, redirect, Response, send_file, has_request_context
 import cv2
 import os
 import numpy as np
@@ -8,16 +8,34 @@ import re
 import requests
 import json
 from flask_cors import CORS
-from firebase_config import db
+try:
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+except ImportError:  # Sin flask-sock el kiosco sigue funcionando por HTTP
+    Sock = None
 from datetime import datetime
 import sys
+import threading
 import scheduler_asistencia
-from seguridad_config import encriptar_archivo
+from seguridad_config import guardar_encriptado, desencriptar_archivo
+import auditoria
 from auditoria import registrar_evento
+import detector_cambios
+import vision_pool
+import kioscos
+import horarios
+import repositorio
+import estudiantes
+import cache_asistencia
+import cache_rostros
+import modelo_lbph
+import instantanea
+from estudiantes import normalizar_nombre
 
 
 app = Flask(__name__)
 CORS(app)
+sock = Sock(app) if Sock else None
 
 # Rutas
 dataPath = os.path.join(os.path.dirname(__file__), 'Data')
@@ -26,30 +44,47 @@ model_path = os.path.join('backend', 'modeloLBPHReconocimientoOpencv.xml')
 # Asegurar que existe la carpeta Data
 os.makedirs(dataPath, exist_ok=True)
 
-# Clasificadores
-faceClassif = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+# Reconocedor del proceso principal (solo para entrenar); la detección y el
+# reconocimiento de fotogramas corren en el pool de visión
 face_recognizer = cv2.face.LBPHFaceRecognizer_create()
 
-# Carga del modelo
-if os.path.exists(model_path):
-    face_recognizer.read(model_path)
-    imagePaths = os.listdir(dataPath)
-    label_dict = {name: idx for idx, name in enumerate(imagePaths)}
-    next_label = len(imagePaths)
-else:
-    imagePaths = []
-    label_dict = {}
-    next_label = 0
 
-print("Model loaded. Persons:", imagePaths)
-print("Label dict:", label_dict, " Next label:", next_label)
+def iniciar():
+    """
+    Carga el modelo y el manifiesto de etiquetas (carpeta → etiqueta) y
+    configura el pool de visión.
+    """
+    global face_recognizer
+    vision_pool.configurar_pool(model_path)
+    if os.path.exists(model_path):
+        face_recognizer = modelo_lbph.cargar(model_path)
+    modelo_lbph.inicializar(model_path, dataPath)
+    print("Model loaded. Persons:", modelo_lbph.personas())
+
+
+# Al importar la app (python recFacial.py, flask run, WSGI, cliente de pruebas).
+# No en los procesos de visión: con 'spawn' vuelven a ejecutar este script como
+# '__mp_main__' y no necesitan el modelo del proceso principal ni el manifiesto
+if not vision_pool.es_proceso_de_vision():
+    iniciar()
 
 # Para evitar registros duplicados
 cap = None
 duracion_reconocimiento = 3
-estudiantes_reconocidos = set()
-tiempos_reconocimiento = {}
-salon_anterior = None  # Para detectar cambios de salón
+
+# Cookie con la que cada navegador recuerda su ID de kiosco
+COOKIE_KIOSCO = 'kiosco_id'
+
+# ==================== RITMO ADAPTATIVO DE FOTOGRAMAS ====================
+# El kiosco programa su siguiente fotograma con la pista 'next_frame_ms'
+# que acompaña cada respuesta de /registro.
+INTERVALO_RASTREO_MS = 500         # Hay un rostro en seguimiento
+INTERVALO_ESCENA_VACIA_MS = 2000   # No hay nadie frente a la cámara
+INTERVALO_MAXIMO_MS = 8000         # Tope del retroceso por carga
+UMBRAL_COLA_SOLICITUDES = 2        # Solicitudes simultáneas toleradas sin retroceso
+
+solicitudes_en_curso = 0
+lock_solicitudes = threading.Lock()
 
 # ==================== MAPEO DE DÍAS ====================
 DIAS_ESPANOL_A_INGLES = {
@@ -64,33 +99,6 @@ DIAS_ESPANOL_A_INGLES = {
 
 DIAS_INGLES_A_ESPANOL = {v: k for k, v in DIAS_ESPANOL_A_INGLES.items()}
 
-# ==================== FUNCIÓN: NORMALIZAR NOMBRE ====================
-def normalizar_nombre(nombre):
-    """
-    Normaliza un nombre para búsqueda en Firebase.
-    - Quita espacios extras
-    - Convierte a mayúsculas
-    - Quita tildes y acentos
-    - Mantiene espacios simples entre palabras
-    """
-    # Quitar espacios extras
-    nombre = nombre.strip()
-    nombre = ' '.join(nombre.split())
-    
-    # Quitar tildes y acentos
-    replacements = {
-        'Á': 'A', 'É': 'E', 'Í': 'I', 'Ó': 'O', 'Ú': 'U',
-        'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u',
-        'Ñ': 'N', 'ñ': 'n'
-    }
-    for orig, repl in replacements.items():
-        nombre = nombre.replace(orig, repl)
-    
-    # Convertir a mayúsculas
-    nombre = nombre.upper()
-    
-    return nombre
-
 # ==================== FUNCIÓN: SANITIZAR PARA FILESYSTEM ====================
 def sanitizar_nombre_filesystem(nombre):
     """
@@ -145,11 +153,7 @@ def obtener_curso_activo(profesor_id=None):
         print(f"Día (inglés): {dia_ingles}")
         print(f"Hora actual: {hora_actual_str}")
         
-        cursos_ref = db.collection('courses')
-        if profesor_id:
-            cursos_ref = cursos_ref.where('profesorID', '==', profesor_id)
-        
-        cursos = cursos_ref.get()
+        cursos = repositorio.consultar_cursos(profesor_id=profesor_id)
         
         for curso_doc in cursos:
             curso_id = curso_doc.id
@@ -206,7 +210,7 @@ def obtener_curso_activo(profesor_id=None):
 
 
 # ==================== FUNCIÓN: REGISTRAR ASISTENCIA CON SALÓN ====================
-def registrar_asistencia(nombre_estudiante, courseID=None, hora_inicio_clase=None):
+def registrar_asistencia(nombre_estudiante, courseID=None, hora_inicio_clase=None, salon=None):
     """
     Actualiza la asistencia de un estudiante de 'Ausente' a 'Presente'.
     Si el documento no existe, lo crea automáticamente.
@@ -214,8 +218,8 @@ def registrar_asistencia(nombre_estudiante, courseID=None, hora_inicio_clase=Non
     try:
         from datetime import timedelta
         
-        # Obtener salón configurado
-        salon_actual = obtener_salon_actual()
+        # Salón del kiosco (si no se indica, el de la solicitud actual)
+        salon_actual = salon or obtener_salon_actual()
         
         # Si no se proporciona courseID, obtenerlo automáticamente CON SALÓN
         if not courseID:
@@ -239,25 +243,13 @@ def registrar_asistencia(nombre_estudiante, courseID=None, hora_inicio_clase=Non
         print(f"Hora: {hora_actual_str}")
         print(f"Curso: {courseID}")
         
-        # Buscar estudiante en Firebase
-        personas_ref = db.collection('person')
-        query = personas_ref.where('type', '==', 'Estudiante').get()
+        # Buscar estudiante (índice en memoria nombre → ID)
+        estudianteID = estudiantes.buscar_id(nombre_normalizado)
         
-        estudiante_doc = None
-        for doc in query:
-            data = doc.to_dict()
-            nombre_db = data.get('namePerson', '')
-            nombre_db_normalizado = normalizar_nombre(nombre_db)
-            
-            if nombre_db_normalizado == nombre_normalizado:
-                estudiante_doc = doc
-                break
-        
-        if not estudiante_doc:
+        if not estudianteID:
             print(f"[✖] ERROR: Estudiante no encontrado")
             return False
         
-        estudianteID = estudiante_doc.id
         print(f"ID encontrado: {estudianteID}")
         
         # ========== CALCULAR TARDANZA ==========
@@ -276,17 +268,14 @@ def registrar_asistencia(nombre_estudiante, courseID=None, hora_inicio_clase=Non
             except:
                 pass
         
-        # Referencia al documento
-        asistencia_ref = db.collection('courses').document(courseID).collection('assistances').document(fecha_hoy)
-        asistencia_doc = asistencia_ref.get()
+        existe_documento, registro_actual = cache_asistencia.obtener_registro(courseID, fecha_hoy, estudianteID)
         
         # ========== NUEVO: CREAR DOCUMENTO SI NO EXISTE ==========
-        if not asistencia_doc.exists:
+        if not existe_documento:
             print(f"[!] Documento no existe - Creando automáticamente...")
             
             # Obtener estudiantes del curso
-            curso_ref = db.collection('courses').document(courseID)
-            curso_doc = curso_ref.get()
+            curso_doc = repositorio.obtener_curso(courseID, campos=['estudianteID'])
             
             if not curso_doc.exists:
                 print(f"[✖] ERROR: Curso no existe")
@@ -296,25 +285,26 @@ def registrar_asistencia(nombre_estudiante, courseID=None, hora_inicio_clase=Non
             estudiantes_ids = curso_data.get('estudianteID', [])
             
             # Crear documento con todos los estudiantes en "Ausente"
-            datos_iniciales = {}
-            for est_id in estudiantes_ids:
-                datos_iniciales[est_id] = {
-                    'estadoAsistencia': 'Ausente',
-                    'horaRegistro': None,
-                    'late': False
-                }
-            
-            asistencia_ref.set(datos_iniciales)
-            print(f"[✔] Documento creado con {len(estudiantes_ids)} estudiantes")
+            datos_iniciales = scheduler_asistencia.crear_datos_asistencia_iniciales(estudiantes_ids)
             
-            # Obtener el documento recién creado
-            asistencia_doc = asistencia_ref.get()
+            creado = repositorio.crear_asistencia(courseID, fecha_hoy, datos_iniciales)
+            scheduler_asistencia.documentos_inicializados.add(f"{courseID}_{fecha_hoy}")
+            if creado:
+                cache_asistencia.guardar_documento(courseID, fecha_hoy, datos_iniciales)
+                print(f"[✔] Documento creado con {len(estudiantes_ids)} estudiantes")
+                
+                # El documento recién creado ya está en la caché: no se vuelve a leer
+                registro_actual = datos_iniciales.get(estudianteID)
+            else:
+                # Otro proceso lo creó entre medias: vale el suyo, no el inicial
+                print(f"[!] El documento ya lo creó otro proceso - Releyendo...")
+                existe_documento, registro_actual = cache_asistencia.recargar_registro(
+                    courseID, fecha_hoy, estudianteID
+                )
         
         # ========== CONTINUAR CON REGISTRO NORMAL ==========
-        datos_existentes = asistencia_doc.to_dict() or {}
-        
         # Verificar si el estudiante está en el documento
-        if estudianteID not in datos_existentes:
+        if registro_actual is None:
             print(f"[!] ADVERTENCIA: Estudiante no está registrado en este curso")
              
             # ⚠️ CÓDIGO TEMPORAL - ELIMINAR DESPUÉS DE LA PRESENTACIÓN
@@ -322,8 +312,7 @@ def registrar_asistencia(nombre_estudiante, courseID=None, hora_inicio_clase=Non
             print(f"🔧 AGREGANDO ESTUDIANTE AL DOCUMENTO (TEMPORAL)")
             
             # Verificar si el estudiante tiene el curso "00000"
-            estudiante_ref = db.collection('person').document(estudianteID)
-            estudiante_doc = estudiante_ref.get()
+            estudiante_doc = repositorio.obtener_persona(estudianteID, campos=['courses'])
             
             if estudiante_doc.exists:
                 estudiante_data = estudiante_doc.to_dict()
@@ -335,16 +324,17 @@ def registrar_asistencia(nombre_estudiante, courseID=None, hora_inicio_clase=Non
                     print(f"   ✓ Agregando al registro de asistencia...")
                     
                     # Agregar el estudiante al documento con estado "Ausente"
-                    datos_existentes[estudianteID] = {
+                    registro_actual = {
                         'estadoAsistencia': 'Ausente',
                         'horaRegistro': None,
                         'late': False
                     }
                     
                     # Actualizar el documento en Firebase
-                    asistencia_ref.update({
-                        estudianteID: datos_existentes[estudianteID]
+                    repositorio.actualizar_asistencia(courseID, fecha_hoy, {
+                        estudianteID: registro_actual
                     })
+                    cache_asistencia.actualizar_registro(courseID, fecha_hoy, estudianteID, registro_actual)
                     
                     print(f"   ✅ Estudiante agregado al registro")
                     print(f"   ℹ️ Continuando con actualización de asistencia...")
@@ -356,7 +346,6 @@ def registrar_asistencia(nombre_estudiante, courseID=None, hora_inicio_clase=Non
                 return False
             # ⚠️ FIN CÓDIGO TEMPORAL
             
-        registro_actual = datos_existentes[estudianteID]
         estado_actual = registro_actual.get('estadoAsistencia')
         
         print(f"Estado actual: {estado_actual}")
@@ -364,13 +353,15 @@ def registrar_asistencia(nombre_estudiante, courseID=None, hora_inicio_clase=Non
         # Solo actualizar si está en "Ausente"
         if estado_actual == 'Ausente':
             # ACTUALIZAR de Ausente a Presente
-            asistencia_ref.update({
-                estudianteID: {
-                    'estadoAsistencia': 'Presente',
-                    'horaRegistro': hora_actual_str,
-                    'late': llegada_tarde
-                }
+            registro_nuevo = {
+                'estadoAsistencia': 'Presente',
+                'horaRegistro': hora_actual_str,
+                'late': llegada_tarde
+            }
+            repositorio.actualizar_asistencia(courseID, fecha_hoy, {
+                estudianteID: registro_nuevo
             })
+            cache_asistencia.actualizar_registro(courseID, fecha_hoy, estudianteID, registro_nuevo)
             
             print(f"[✔] ACTUALIZADO: Ausente → Presente")
             print(f"    Hora: {hora_actual_str}")
@@ -388,34 +379,30 @@ def registrar_asistencia(nombre_estudiante, courseID=None, hora_inicio_clase=Non
         return False
 
 # ==================== FUNCIONES DE ENTRENAMIENTO ====================
+def cargar_rostro(img_path):
+    """Descifra y decodifica en grises una imagen de Data/ (None si falla)."""
+    datos_imagen = desencriptar_archivo(img_path)
+    if datos_imagen is None:
+        print(f"⚠️ No se pudo desencriptar {img_path}")
+        return None
+    
+    # Convertir bytes a imagen
+    nparr = np.frombuffer(datos_imagen, np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
+
+
 def entrenar_incremental(nuevos_registros):
     """Entrenamiento incremental del modelo."""
-    global face_recognizer, label_dict, next_label, imagePaths
+    global face_recognizer
 
     facesData, labels = [], []
 
     for persona, rutas in nuevos_registros.items():
-        if persona not in label_dict:
-            label_dict[persona] = next_label
-            imagePaths.append(persona)
-            next_label += 1
-
-        lbl = label_dict[persona]
+        lbl = modelo_lbph.asignar_etiqueta(persona)
         for img_path in rutas:
             try:
-               
-                # ========== NUEVO: DESENCRIPTAR ANTES DE LEER ==========
-                from seguridad_config import desencriptar_archivo
-                
-                datos_imagen = desencriptar_archivo(img_path)
-                if datos_imagen is None:
-                    print(f"⚠️ No se pudo desencriptar {img_path}")
-                    continue
-                
-                # Convertir bytes a imagen
-                nparr = np.frombuffer(datos_imagen, np.uint8)
-                img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
-                # ====================================================
+                # Descifrado + decodificación, o la copia ya decodificada en memoria
+                img = cache_rostros.obtener(img_path, cargar_rostro)
                 if img is not None:
                     facesData.append(img)
                     labels.append(lbl)
@@ -423,8 +410,17 @@ def entrenar_incremental(nuevos_registros):
                 print(f"Error leyendo imagen {img_path}: {e}")
 
     if facesData:
-        face_recognizer.update(facesData, np.array(labels))
-        face_recognizer.write(model_path)
+        with modelo_lbph.lock:
+            face_recognizer.update(facesData, np.array(labels))
+            # Reinscribir vuelve a añadir las mismas fotos: deduplicar y limitar
+            # muestras por etiqueta antes de publicar (una sola escritura)
+            face_recognizer, compactacion = modelo_lbph.compactar_reconocedor(
+                face_recognizer, ruta_temporal_modelo()
+            )
+            publicar_modelo(ya_escrito=compactacion['reescrito'])
+        if compactacion['reescrito']:
+            print(f"🗜️ Modelo compactado: {compactacion['muestras_antes']} → "
+                  f"{compactacion['muestras_despues']} muestras")
         print(f"Entrenamiento incremental: {len(facesData)} imágenes añadidas.")
         return True
     else:
@@ -432,155 +428,133 @@ def entrenar_incremental(nuevos_registros):
         return False
 
 
-# ==================== FUNCIÓN MEJORADA: DETECTAR ROSTRO ====================
-def detectar_rostro_mejorado(imagen_gray):
+# ==================== ANÁLISIS DE FOTOGRAMAS (POOL DE VISIÓN) ====================
+def analizar_fotograma(image_bytes):
     """
-    Detecta rostros con múltiples estrategias.
-    Retorna (faces, metodo_usado) o (None, None) si falla.
+    Decodifica un fotograma JPEG, detecta el rostro principal y lo reconoce
+    en el pool de visión.
+    
+    Returns:
+        dict: {'estado': 'invalido'} | {'estado': 'sin_rostro'} |
+              {'estado': 'rostro', 'box': [x, y, w, h], 'label': int, 'confianza': float}
     """
-    try:
-        # Estrategia 1: Detección normal
-        faces = faceClassif.detectMultiScale(
-            imagen_gray,
-            scaleFactor=1.1,
-            minNeighbors=3,
-            minSize=(30, 30)
-        )
-        if len(faces) > 0:
-            return faces, "normal"
-        
-        # Estrategia 2: Más permisivo
-        faces = faceClassif.detectMultiScale(
-            imagen_gray,
-            scaleFactor=1.05,
-            minNeighbors=2,
-            minSize=(20, 20)
-        )
-        if len(faces) > 0:
-            return faces, "permisivo"
-        
-        # Estrategia 3: Ecualizar histograma
-        imagen_eq = cv2.equalizeHist(imagen_gray)
-        faces = faceClassif.detectMultiScale(
-            imagen_eq,
-            scaleFactor=1.1,
-            minNeighbors=3,
-            minSize=(30, 30)
-        )
-        if len(faces) > 0:
-            return faces, "ecualizado"
-        
-    except Exception as e:
-        print(f"Error en detección: {e}")
+    return vision_pool.ejecutar(
+        vision_pool.tarea_analizar_fotograma,
+        image_bytes,
+        vision_pool.version_modelo(model_path)
+    )
+
+
+def analizar_recorte(rostro_b64, box):
+    """
+    Reconoce un rostro que el kiosco ya recortó y pasó a escala de grises
+    (vision_pool.TAMANO_RECORTE de lado). Se salta decodificación en color,
+    conversión y búsqueda de la cascada.
     
-    return None, None
-
-# Variable global para almacenar el salón configurado (persistente)
-salon_configurado = None
-def obtener_salon_configurado_para_scheduler():
-     """
-     Función callback para que el scheduler obtenga el salón actual.
-     """
-     return obtener_salon_actual()
-SALON_CONFIG_FILE = 'salon_config.txt'
-
-def cargar_salon_persistente():
-    """Carga el salón configurado desde archivo."""
-    global salon_configurado
+    Returns:
+        dict: Mismo formato que analizar_fotograma()
+    """
     try:
-        if os.path.exists(SALON_CONFIG_FILE):
-            with open(SALON_CONFIG_FILE, 'r', encoding='utf-8') as f:
-                salon_configurado = f.read().strip()
-                print(f"✔ Salón cargado desde archivo: '{salon_configurado}'")
-                return salon_configurado
-    except Exception as e:
-        print(f"⚠️ Error cargando salón: {e}")
-    return None
+        if not isinstance(box, (list, tuple)) or len(box) != 4:
+            return {'estado': 'invalido'}
+        box = [int(v) for v in box]
 
-def guardar_salon_persistente(salon):
-    """Guarda el salón configurado en archivo."""
-    try:
-        with open(SALON_CONFIG_FILE, 'w', encoding='utf-8') as f:
-            f.write(salon)
-        print(f"💾 Salón guardado: '{salon}'")
-        return True
+        encoded = rostro_b64.split(',', 1)[1] if ',' in rostro_b64 else rostro_b64
+        rostro_bytes = base64.b64decode(encoded)
     except Exception as e:
-        print(f"❌ Error guardando salón: {e}")
-        return False
+        print(f"⚠️ Recorte inválido: {e}")
+        return {'estado': 'invalido'}
+
+    return vision_pool.ejecutar(
+        vision_pool.tarea_analizar_recorte,
+        rostro_bytes,
+        box,
+        vision_pool.version_modelo(model_path)
+    )
+
+
+def ruta_temporal_modelo():
+    return modelo_lbph.ruta_temporal(model_path)
+
+
+def publicar_modelo(ya_escrito=False):
+    """
+    Escribe el modelo de forma atómica (archivo temporal + rename) para que
+    los procesos de visión nunca lean un archivo a medio escribir; al cambiar
+    la versión en disco, cada proceso lo recarga en su próxima tarea.
+
+    Args:
+        ya_escrito: El temporal ya contiene el modelo (p. ej. lo reescribió
+                    modelo_lbph); solo falta publicarlo
+    """
+    ruta_temporal = ruta_temporal_modelo()
+    if not ya_escrito:
+        face_recognizer.write(ruta_temporal)
+    os.replace(ruta_temporal, model_path)
+    # Los análisis guardados ya no reflejan el modelo actualizado
+    detector_cambios.reiniciar()
+
+
+def quitar_del_modelo(carpeta):
+    """
+    Quita a una persona del modelo sin reentrenar: retira su etiqueta en el
+    manifiesto (deja de reconocerse en el acto) y publica el modelo sin sus
+    histogramas por la misma ruta atómica que el entrenamiento.
+
+    Returns:
+        dict: {'etiqueta', 'muestras_quitadas', 'muestras_restantes', 'ms'}
+              o None si la carpeta no estaba en el modelo
+    """
+    global face_recognizer
+    with modelo_lbph.lock:
+        etiqueta = modelo_lbph.retirar(carpeta)
+        if etiqueta is None or not os.path.exists(model_path):
+            return None
+
+        inicio = time.time()
+        ruta_temporal = ruta_temporal_modelo()
+        reconocedor, quitadas, restantes = modelo_lbph.quitar_etiquetas(
+            face_recognizer, [etiqueta], ruta_temporal
+        )
+        if reconocedor is not None:
+            face_recognizer = reconocedor
+            publicar_modelo(ya_escrito=True)
+        else:
+            # Sin muestras no queda modelo: los procesos de visión pasan a versión 0
+            os.remove(ruta_temporal)
+            os.remove(model_path)
+            face_recognizer = cv2.face.LBPHFaceRecognizer_create()
+            detector_cambios.reiniciar()
+
+        ms = (time.time() - inicio) * 1000
+        print(f"🧹 Etiqueta {etiqueta} ('{carpeta}') retirada: {quitadas} muestras quitadas, "
+              f"{restantes} restantes ({ms:.1f} ms)")
+        return {
+            'etiqueta': etiqueta,
+            'muestras_quitadas': quitadas,
+            'muestras_restantes': restantes,
+            'ms': round(ms, 1)
+        }
+
+def obtener_salones_para_scheduler():
+    """
+    Función callback para que el scheduler obtenga los salones de todos los kioscos.
+    """
+    return kioscos.salones_configurados()
 
 # ==================== FUNCIÓN: OBTENER TODOS LOS SALONES ====================
 def obtener_salones_disponibles():
     """
-    Extrae todos los salones únicos de la colección 'courses'.
-    Maneja dos casos:
-    1. Cursos con subcolección 'groups'
-    2. Cursos con campo 'schedule' directo
+    Retorna todos los salones únicos de la colección 'courses'.
+    Sale del catálogo en caché de horarios.py: solo se consulta Firestore
+    cuando el horario cambió desde la última carga.
     
     Returns:
         list: Lista de salones únicos disponibles
     """
     try:
-        salones = set()  # Usar set para evitar duplicados
-        
-        print("\n=== EXTRAYENDO SALONES DISPONIBLES ===")
-        
-        # Obtener todos los cursos
-        cursos_ref = db.collection('courses')
-        cursos = cursos_ref.get()
-        
-        for curso_doc in cursos:
-            curso_id = curso_doc.id
-            curso_data = curso_doc.to_dict()
-            
-            print(f"\nProcesando curso: {curso_id}")
-            print(f"  Nombre: {curso_data.get('nameCourse', 'Sin nombre')}")
-            
-            # CASO 1: Verificar si tiene subcolección 'groups'
-            try:
-                groups_ref = db.collection('courses').document(curso_id).collection('groups')
-                groups = groups_ref.get()
-                
-                if groups:  # Si hay grupos
-                    print(f"  ✓ Tiene {len(groups)} grupos")
-                    
-                    for group_doc in groups:
-                        group_id = group_doc.id
-                        group_data = group_doc.to_dict()
-                        schedule = group_data.get('schedule', [])
-                        
-                        print(f"    Grupo: {group_id}")
-                        
-                        for horario in schedule:
-                            classroom = horario.get('classroom', '').strip()
-                            if classroom:
-                                salones.add(classroom)
-                                print(f"      → Salón: {classroom}")
-                    
-                    continue  # Si procesó grupos, pasar al siguiente curso
-                    
-            except Exception as e:
-                print(f"  [!] No tiene subcolección groups o error: {e}")
-            
-            # CASO 2: Campo 'schedule' directo en el curso
-            schedule = curso_data.get('schedule', [])
-            
-            if schedule:
-                print(f"  ✓ Tiene schedule directo con {len(schedule)} horarios")
-                
-                for horario in schedule:
-                    classroom = horario.get('classroom', '').strip()
-                    if classroom:
-                        salones.add(classroom)
-                        print(f"    → Salón: {classroom}")
-        
-        salones_lista = sorted(list(salones))  # Convertir a lista ordenada
-        
-        print(f"\n=== SALONES ENCONTRADOS: {len(salones_lista)} ===")
-        for salon in salones_lista:
-            print(f"  • {salon}")
-        print("=" * 50 + "\n")
-        
-        return salones_lista
+        salones, _ = horarios.obtener_catalogo_salones()
+        return salones
         
     except Exception as e:
         print(f"[✖] ERROR obteniendo salones: {e}")
@@ -590,37 +564,56 @@ def obtener_salones_disponibles():
 
 
 # ==================== FUNCIÓN: CONFIGURAR SALÓN ====================
-def configurar_salon(nombre_salon):
+def configurar_salon(nombre_salon, kiosco=None):
     """
-    Configura el salón activo para el sistema y lo persiste.
+    Configura el salón de un kiosco y lo persiste.
     
     Args:
         nombre_salon: Nombre del salón a configurar
+        kiosco: ID del kiosco (por defecto, el de la solicitud actual)
         
     Returns:
         bool: True si se configuró exitosamente
     """
-    global salon_configurado
+    kiosco = kiosco or obtener_id_kiosco()
     
     try:
-        salon_configurado = nombre_salon.strip()
-        guardar_salon_persistente(salon_configurado)
-        print(f"\n✅ SALÓN CONFIGURADO: '{salon_configurado}'")
-        return True
+        exito = kioscos.configurar_salon(kiosco, nombre_salon)
+        if exito:
+            # Puede haber un salón nuevo que el scheduler debe planificar
+            scheduler_asistencia.notificar_cambio_horario()
+            # El último análisis de sus cámaras pertenece al salón anterior
+            detector_cambios.olvidar_kiosco(kiosco)
+            print(f"\n✅ SALÓN CONFIGURADO: '{nombre_salon.strip()}' (kiosco '{kiosco}')")
+        return exito
     except Exception as e:
         print(f"[✖] ERROR configurando salón: {e}")
         return False
 
 
+# ==================== FUNCIÓN: CLAVE DE CÁMARA ====================
+def clave_camara(kiosco):
+    """
+    Clave de la cámara para el detector de cambios: 'kiosco@ip', porque
+    varios equipos pueden compartir el ID de kiosco.
+    """
+    return f"{kiosco}@{request.remote_addr}" if has_request_context() else kiosco
+
+
 # ==================== FUNCIÓN: OBTENER SALÓN ACTUAL ====================
-def obtener_salon_actual():
+def obtener_salon_actual(kiosco=None):
     """
-    Retorna el salón actualmente configurado.
+    Retorna el salón configurado para un kiosco.
+    
+    Args:
+        kiosco: ID del kiosco (por defecto, el de la solicitud actual)
     
     Returns:
         str: Nombre del salón configurado o None
     """
-    return salon_configurado
+    if kiosco is None:
+        kiosco = obtener_id_kiosco() if has_request_context() else kioscos.KIOSCO_POR_DEFECTO
+    return kioscos.obtener_salon(kiosco)
 
 
 # ==================== FUNCIÓN MODIFICADA: OBTENER CURSO ACTIVO CON SALÓN ====================
@@ -656,66 +649,32 @@ def obtener_curso_activo_con_salon(profesor_id=None, salon_requerido=None):
             print(f"[!] No hay salón configurado - no se puede buscar curso")
             return (None, None)
         
-        cursos_ref = db.collection('courses')
-        if profesor_id:
-            cursos_ref = cursos_ref.where('profesorID', '==', profesor_id)
-        
-        cursos = cursos_ref.get()
+        # Sin filtro de profesor: índice precalculado del día (una búsqueda binaria)
+        if not profesor_id:
+            activo = horarios.consultar_salon(salon_requerido, ahora)['activo']
+            if activo:
+                print(f"  [✔] ¡CURSO ACTIVO ENCONTRADO: {activo['curso_id']}!")
+                return (activo['curso_id'], activo['hora_inicio'])
+            print(f"[!] No se encontró curso activo en {salon_requerido}")
+            return (None, None)
         
-        for curso_doc in cursos:
-            curso_id = curso_doc.id
-            curso_data = curso_doc.to_dict()
-            
-            print(f"\n  Verificando curso: {curso_id}")
-            print(f"  Nombre: {curso_data.get('nameCourse')}")
-            
-            # CASO 1: Verificar grupos (subcolección)
-            try:
-                groups_ref = db.collection('courses').document(curso_id).collection('groups')
-                groups = groups_ref.get()
-                
-                if groups:
-                    print(f"    → Buscando en {len(groups)} grupos...")
-                    
-                    for group_doc in groups:
-                        group_id = group_doc.id
-                        group_data = group_doc.to_dict()
-                        schedule = group_data.get('schedule', [])
-                        
-                        resultado = verificar_horario_salon(
-                            schedule, 
-                            dia_espanol, 
-                            dia_ingles, 
-                            hora_actual_str, 
-                            salon_requerido,
-                            f"Grupo {group_id}"
-                        )
-                        
-                        if resultado:
-                            print(f"  [✔] ¡CURSO ACTIVO ENCONTRADO: {curso_id} - Grupo {group_id}!")
-                            return (curso_id, resultado)
-                    
-                    continue
-                    
-            except Exception as e:
-                print(f"    [!] No tiene grupos: {e}")
+        for entrada in horarios.cargar_horarios(profesor_id):
+            curso_id = entrada['course_id']
+            group_id = entrada['group_id']
+            origen = f"Grupo {group_id}" if group_id else "Schedule directo"
             
-            # CASO 2: Schedule directo
-            schedule = curso_data.get('schedule', [])
+            resultado = verificar_horario_salon(
+                [entrada['horario']], 
+                dia_espanol, 
+                dia_ingles, 
+                hora_actual_str, 
+                salon_requerido,
+                origen
+            )
             
-            if schedule:
-                resultado = verificar_horario_salon(
-                    schedule, 
-                    dia_espanol, 
-                    dia_ingles, 
-                    hora_actual_str, 
-                    salon_requerido,
-                    "Schedule directo"
-                )
-                
-                if resultado:
-                    print(f"  [✔] ¡CURSO ACTIVO ENCONTRADO: {curso_id}!")
-                    return (curso_id, resultado)
+            if resultado:
+                print(f"  [✔] ¡CURSO ACTIVO ENCONTRADO: {curso_id} - {origen}!")
+                return (curso_id, resultado)
         
         print(f"\n[!] No se encontró curso activo para:")
         print(f"    • Día: {dia_espanol}")
@@ -792,8 +751,8 @@ def index():
     Ruta principal.
     Carga el salón persistente automáticamente.
     """
-    # Cargar salón desde archivo
-    salon_actual = cargar_salon_persistente()
+    # Salón del kiosco que abre la página
+    salon_actual = obtener_salon_actual()
     
     if not salon_actual:
         # No hay salón configurado, ir a configuración
@@ -849,62 +808,152 @@ def calcular_categoria_llegada(hora_inicio_str):
         print(f"Error calculando categoría: {e}")
         return "llego"  # Por defecto
 
+def obtener_id_kiosco():
+    """
+    Identifica al kiosco que hace la solicitud, en este orden:
+    cabecera 'X-Kiosco-ID', parámetro '?kiosco=' de la URL, cookie 'kiosco_id'.
+    Sin identificador se usa el kiosco por defecto (instalación de un solo salón).
+    """
+    return (
+        request.headers.get('X-Kiosco-ID')
+        or request.args.get('kiosco')
+        or request.cookies.get(COOKIE_KIOSCO)
+        or kioscos.KIOSCO_POR_DEFECTO
+    ).strip()
+
+
+@app.after_request
+def recordar_kiosco(respuesta):
+    """
+    Si la URL trae '?kiosco=ID', lo guarda en una cookie para que las páginas,
+    las llamadas a la API y el WebSocket de ese navegador lo envíen solos.
+    """
+    kiosco = request.args.get('kiosco')
+    if kiosco:
+        respuesta.set_cookie(COOKIE_KIOSCO, kiosco.strip(), max_age=365 * 24 * 3600, samesite='Lax')
+    return respuesta
+
+
+def calcular_siguiente_fotograma_ms(estado):
+    """
+    Calcula en cuántos milisegundos debe enviar el kiosco su próximo fotograma.
+    
+    - Rápido mientras hay un rostro en seguimiento
+    - Lento cuando la escena está vacía (o hubo un error)
+    - Con retroceso exponencial cuando hay demasiadas solicitudes en curso
+    
+    Returns:
+        int: Milisegundos hasta el siguiente fotograma
+    """
+    if estado in ('reconocido', 'desconocido'):
+        intervalo = INTERVALO_RASTREO_MS
+    else:
+        intervalo = INTERVALO_ESCENA_VACIA_MS
+    
+    # La cola tolerada crece con el número de procesos de visión
+    en_cola = max(solicitudes_en_curso, vision_pool.tareas_pendientes())
+    exceso = en_cola - UMBRAL_COLA_SOLICITUDES * vision_pool.capacidad()
+    if exceso > 0:
+        intervalo *= 2 ** exceso
+    
+    return int(min(intervalo, INTERVALO_MAXIMO_MS))
+
+
 @app.route('/registro', methods=['POST'])
 def registro():
-    """Endpoint para reconocimiento en tiempo real CON SALÓN"""
-    global estudiantes_reconocidos, tiempos_reconocimiento, salon_anterior
+    """
+    Endpoint para reconocimiento en tiempo real CON SALÓN.
+    Cada respuesta incluye 'next_frame_ms' para que el kiosco regule su ritmo.
+    """
+    respuesta, codigo = atender_fotograma(request.get_json(silent=True), obtener_id_kiosco())
+    return jsonify(respuesta), codigo
+
+
+def atender_fotograma(data, kiosco, image_bytes=None):
+    """
+    Procesa un fotograma contabilizándolo en la cola de solicitudes y
+    añade la pista 'next_frame_ms' a la respuesta.
+    
+    Returns:
+        tuple: (respuesta_dict, codigo_http)
+    """
+    global solicitudes_en_curso
+    
+    with lock_solicitudes:
+        solicitudes_en_curso += 1
+    try:
+        respuesta, codigo = procesar_registro(data, kiosco, image_bytes)
+    finally:
+        with lock_solicitudes:
+            solicitudes_en_curso -= 1
+    
+    respuesta['next_frame_ms'] = calcular_siguiente_fotograma_ms(respuesta.get('estado'))
+    return respuesta, codigo
+
+
+def procesar_registro(data, kiosco, image_bytes=None):
+    """
+    Procesa un fotograma del kiosco: detecta, reconoce y registra asistencia.
+    
+    Args:
+        data: Cuerpo JSON recibido. Acepta el fotograma completo
+              ({"image": "data:image/jpeg;base64,..."}) o, en modo recorte,
+              el rostro ya recortado en grises ({"rostro": "...", "box": [x, y, w, h]})
+        kiosco: Identificador del kiosco que envía el fotograma
+        image_bytes: Bytes JPEG ya recibidos en binario (WebSocket); si se
+                     pasan, se ignora 'data'
     
+    Returns:
+        tuple: (respuesta_dict, codigo_http)
+    """
     try:
-        # Verificar que haya salón configurado
-        salon_actual = obtener_salon_actual()
+        # Verificar que el kiosco tenga salón configurado
+        salon_actual = obtener_salon_actual(kiosco)
         
         if not salon_actual:
-            return jsonify({
+            return {
                 "estado": "error",
                 "mensaje": "No hay salón configurado. Configura el salón primero."
-            }), 400
-        
-        # DETECTAR CAMBIO DE SALÓN Y LIMPIAR REGISTROS
-        if salon_anterior is not None and salon_anterior != salon_actual:
-            print(f"\n🔄 CAMBIO DE SALÓN DETECTADO:")
-            print(f"   Anterior: '{salon_anterior}'")
-            print(f"   Nuevo: '{salon_actual}'")
-            print(f"   Limpiando registros previos...")
-            estudiantes_reconocidos.clear()
-            tiempos_reconocimiento.clear()
-            print(f"   ✅ Registros limpiados - se reintentará asistencia\n")
+            }, 400
         
-        # Actualizar salón anterior
-        salon_anterior = salon_actual
+        # Estado de reconocimiento propio del salón
+        estado_salon = kioscos.estado_salon(salon_actual)
+        estudiantes_reconocidos = estado_salon['reconocidos']
+        tiempos_reconocimiento = estado_salon['tiempos']
         
-        data = request.get_json()
-        if not data or 'image' not in data:
-            return jsonify({"estado": "error", "mensaje": "No se recibió imagen"}), 400
-
-        image_data = re.sub(r'^data:image/.+;base64,', '', data['image'])
-        image_bytes = base64.b64decode(image_data)
-        np_arr = np.frombuffer(image_bytes, np.uint8)
-        frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-
-        if frame is None:
-            return jsonify({"estado": "error", "mensaje": "Imagen inválida"}), 400
-
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        auxFrame = gray.copy()
-        faces, metodo = detectar_rostro_mejorado(gray)
-
-        if faces is None or len(faces) == 0:
-            return jsonify({"estado": "sin_rostro"})
-
-        x, y, w, h = faces[0]
-        rostro = auxFrame[y:y+h, x:x+w]
-        rostro = cv2.resize(rostro, (150, 150), interpolation=cv2.INTER_CUBIC)
-        label, confianza = face_recognizer.predict(rostro)
+        if image_bytes is None and (not data or ('image' not in data and 'rostro' not in data)):
+            return {"estado": "error", "mensaje": "No se recibió imagen"}, 400
 
-        box = [int(x), int(y), int(w), int(h)]
-        
-        if confianza < 70 and label < len(imagePaths):
-            nombre_carpeta = imagePaths[label]
+        if image_bytes is None and 'rostro' in data:
+            # MODO RECORTE: el kiosco ya detectó el rostro, ir directo a predict
+            analisis = analizar_recorte(data['rostro'], data.get('box'))
+        else:
+            if image_bytes is None:
+                image_data = re.sub(r'^data:image/.+;base64,', '', data['image'])
+                image_bytes = base64.b64decode(image_data)
+
+            # Si la escena no cambió, reutilizar el análisis anterior del kiosco
+            # (por cámara: varios equipos pueden compartir el ID de kiosco)
+            camara = clave_camara(kiosco)
+            analisis, firma = detector_cambios.buscar_resultado_previo(camara, image_bytes)
+            if analisis is None:
+                analisis = analizar_fotograma(image_bytes)
+                if analisis['estado'] != 'invalido':
+                    detector_cambios.guardar_resultado(camara, firma, analisis)
+
+        if analisis['estado'] == 'invalido':
+            return {"estado": "error", "mensaje": "Imagen inválida"}, 400
+
+        if analisis['estado'] == 'sin_rostro':
+            return {"estado": "sin_rostro"}, 200
+
+        box = analisis['box']
+        label = analisis['label']
+        confianza = analisis['confianza']
+        
+        # Las etiquetas retiradas (consentimiento revocado) no devuelven nombre
+        nombre_carpeta = modelo_lbph.nombre(label) if confianza < 70 else None
+        if nombre_carpeta:
             nombre_estudiante = nombre_carpeta.replace('_', ' ')
             
             if nombre_estudiante not in tiempos_reconocimiento:
@@ -917,7 +966,7 @@ def registro():
                     courseID, hora_inicio = obtener_curso_activo_con_salon(salon_requerido=salon_actual)
                     
                     if courseID:
-                        registrado = registrar_asistencia(nombre_estudiante, courseID, hora_inicio)
+                        registrado = registrar_asistencia(nombre_estudiante, courseID, hora_inicio, salon_actual)
                         
                         # Registrar en auditoría
                         registrar_evento(
@@ -930,7 +979,7 @@ def registro():
                         # CALCULAR CATEGORÍA DE LLEGADA
                         categoria = calcular_categoria_llegada(hora_inicio)
                         
-                        return jsonify({
+                        return {
                             "estado": "reconocido",
                             "estudiante": nombre_estudiante,
                             "confianza": float(confianza),
@@ -938,28 +987,103 @@ def registro():
                             "salon": salon_actual,
                             "registrado": registrado,
                             "categoria_llegada": categoria  # ← NUEVO
-                        })
+                        }, 200
                     else:
                         print(f"[!] Reconocido '{nombre_estudiante}' pero NO hay curso activo en {salon_actual}")
             
-            return jsonify({
+            return {
                 "estado": "reconocido",
                 "estudiante": nombre_estudiante,
                 "confianza": float(confianza),
                 "box": box,
                 "salon": salon_actual
-            })
+            }, 200
         else:
-            return jsonify({
+            return {
                 "estado": "desconocido",
-                "confianza": float(confianza),
+                # Sin modelo entrenado no hay distancia (JSON no admite infinito)
+                "confianza": None if confianza == vision_pool.CONFIANZA_SIN_MODELO else float(confianza),
                 "box": box
-            })
+            }, 200
     except Exception as e:
         print(f"Error en /registro: {e}")
         import traceback
         traceback.print_exc()
-        return jsonify({"estado": "error", "mensaje": str(e)}), 500
+        return {"estado": "error", "mensaje": str(e)}, 500
+
+
+@app.route('/api/estadisticas_fotogramas', methods=['GET'])
+def api_estadisticas_fotogramas():
+    """
+    Contadores del detector de cambios: fotogramas analizados vs. reutilizados.
+    """
+    return jsonify({
+        "success": True,
+        "estadisticas": detector_cambios.obtener_estadisticas()
+    }), 200
+
+
+@app.route('/api/estadisticas_auditoria', methods=['GET'])
+def api_estadisticas_auditoria():
+    """
+    Contadores del escritor de auditoría: encolados, escritos y descartados.
+    """
+    return jsonify({
+        "success": True,
+        "estadisticas": auditoria.obtener_estadisticas()
+    }), 200
+
+
+@app.route('/api/auditoria', methods=['GET'])
+def api_auditoria():
+    """
+    Consulta del log de auditoría (p. ej. los accesos a los datos de un
+    estudiante para una solicitud de la Ley 1581).
+    Parámetros: tipo, usuario, curso, desde, hasta (ISO), cursor, limite.
+    """
+    try:
+        resultado = auditoria.consultar_logs(
+            tipo=request.args.get('tipo'),
+            usuario=request.args.get('usuario'),
+            curso=request.args.get('curso'),
+            desde=request.args.get('desde'),
+            hasta=request.args.get('hasta'),
+            cursor=request.args.get('cursor', type=int),
+            limite=min(request.args.get('limite', 100, type=int), 1000)
+        )
+        return jsonify({"success": True, **resultado}), 200
+    except Exception as e:
+        print(f"Error en /api/auditoria: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/api/auditoria/exportar', methods=['GET'])
+def api_auditoria_exportar():
+    """
+    Exportación completa del log de auditoría en JSON Lines, en streaming
+    (los segmentos sellados se descomprimen al vuelo).
+    Parámetros: tipo, usuario, curso, desde, hasta (ISO).
+    """
+    eventos = auditoria.exportar_logs(
+        tipo=request.args.get('tipo'),
+        usuario=request.args.get('usuario'),
+        curso=request.args.get('curso'),
+        desde=request.args.get('desde'),
+        hasta=request.args.get('hasta')
+    )
+
+    def generar():
+        for evento in eventos:
+            yield json.dumps(evento, ensure_ascii=False) + '\n'
+
+    registrar_evento(
+        'ACCESO_DATOS',
+        'Exportación del log de auditoría',
+        datos_adicionales={k: v for k, v in request.args.items()}
+    )
+    return Response(generar(), mimetype='application/x-ndjson', headers={
+        'Content-Disposition': f'attachment; filename=auditoria_{datetime.now().strftime("%Y%m%d_%H%M%S")}.jsonl'
+    })
 
 
 @app.route('/detectar_rostro', methods=['POST'])
@@ -972,24 +1096,9 @@ def detectar_rostro():
 
         image_data = re.sub(r'^data:image/.+;base64,', '', data['image'])
         image_bytes = base64.b64decode(image_data)
-        np_arr = np.frombuffer(image_bytes, np.uint8)
-        frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-
-        if frame is None:
-            return jsonify({"rostro_detectado": False}), 200
 
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces, metodo = detectar_rostro_mejorado(gray)
-
-        if faces is not None and len(faces) > 0:
-            x, y, w, h = faces[0]
-            return jsonify({
-                "rostro_detectado": True,
-                "box": [int(x), int(y), int(w), int(h)],
-                "metodo": metodo
-            }), 200
-        else:
-            return jsonify({"rostro_detectado": False}), 200
+        resultado = vision_pool.ejecutar(vision_pool.tarea_detectar_rostro, image_bytes)
+        return jsonify(resultado), 200
 
     except Exception as e:
         print(f"Error en /detectar_rostro: {e}")
@@ -1036,59 +1145,30 @@ def guardar_foto():
                 encoded = foto_b64
                 
             img_bytes = base64.b64decode(encoded)
-            nparr = np.frombuffer(img_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
-            if img is None:
+            # Decodificar, detectar y recortar en el pool de visión
+            preparada = vision_pool.ejecutar(vision_pool.tarea_preparar_foto, img_bytes)
+
+            if preparada['estado'] == 'invalido':
                 return jsonify({"ok": False, "error": "Imagen inválida"}), 400
             
         except Exception as e:
             print(f"❌ Error decodificando imagen: {e}")
             return jsonify({"ok": False, "error": f"Error decodificando: {str(e)}"}), 500
 
-        # Convertir a escala de grises
-        try:
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        except Exception as e:
-            return jsonify({"ok": False, "error": f"Error en conversión: {str(e)}"}), 500
-
-        # Detectar rostro
-        faces = None
-        metodo = "ninguno"
-        try:
-            faces, metodo = detectar_rostro_mejorado(gray)
-        except Exception as e:
-            print(f"⚠️ Error en detección (continuando): {e}")
+        rostro_jpeg = preparada['jpeg']
+        tipo = preparada['tipo']
+        metodo = preparada['metodo']
 
         # Preparar imagen
         timestamp = int(time.time() * 1000000)
         filename = f'rostro_{timestamp}.jpg'
         ruta = os.path.join(personPath, filename)
 
-        # Guardar
+        # Encriptar en memoria y guardar (una sola escritura atómica)
         try:
-            if faces is not None and len(faces) > 0:
-                x, y, w, h = faces[0]
-                rostro = gray[y:y+h, x:x+w]
-                rostro_final = cv2.resize(rostro, (150, 150), interpolation=cv2.INTER_CUBIC)
-                tipo = "recorte"
-            else:
-                rostro_final = cv2.resize(gray, (150, 150), interpolation=cv2.INTER_CUBIC)
-                tipo = "completa"
-            
-            success = cv2.imwrite(ruta, rostro_final)
-            
-            if not success or not os.path.exists(ruta):
-                return jsonify({"ok": False, "error": "Error al guardar archivo"}), 500
-            
-            file_size = os.path.getsize(ruta)
-            print(f"✅ Foto guardada: {file_size} bytes ({tipo})")
-
-            print(f"🔒 Encriptando imagen...")
-            if encriptar_archivo(ruta):
-                print(f"✔ Imagen encriptada exitosamente")
-            else:
-                print(f"⚠️ No se pudo encriptar la imagen")
+            file_size = guardar_encriptado(ruta, rostro_jpeg)
+            print(f"✅ Foto guardada encriptada: {file_size} bytes ({tipo})")
 
             # Registrar en auditoría
             registrar_evento(
@@ -1232,24 +1312,17 @@ def registrar_estudiante_en_firebase(nombre_estudiante):
         print(f"Nombre normalizado: '{nombre_normalizado}'")
         
         # Verificar si ya existe
-        personas_ref = db.collection('person')
-        query = personas_ref.where('type', '==', 'Estudiante').get()
-        
-        for doc in query:
-            data = doc.to_dict()
-            nombre_db = data.get('namePerson', '')
-            nombre_db_normalizado = normalizar_nombre(nombre_db)
-            
-            if nombre_db_normalizado == nombre_normalizado:
-                print(f"[!] Estudiante ya existe en Firebase con ID: {doc.id}")
-                print(f"{'='*60}\n")
-                return doc.id
+        estudiante_existente = estudiantes.buscar_id(nombre_normalizado)
+        if estudiante_existente:
+            print(f"[!] Estudiante ya existe en Firebase con ID: {estudiante_existente}")
+            print(f"{'='*60}\n")
+            return estudiante_existente
         
         # Generar ID aleatorio entre 2000000000 y 2999999999
         nuevo_id = str(random.randint(2000000000, 2999999999))
         
         # Verificar que el ID no exista (muy raro, pero por seguridad)
-        while personas_ref.document(nuevo_id).get().exists:
+        while repositorio.obtener_persona(nuevo_id, campos=[]).exists:
             nuevo_id = str(random.randint(2000000000, 2999999999))
         
         # Crear el documento
@@ -1259,7 +1332,8 @@ def registrar_estudiante_en_firebase(nombre_estudiante):
             'courses': ['00000']  # Curso por defecto para pruebas
         }
         
-        personas_ref.document(nuevo_id).set(datos_estudiante)
+        repositorio.crear_persona(nuevo_id, datos_estudiante)
+        estudiantes.agregar(nuevo_id, nombre_normalizado)
         
         print(f"✅ ESTUDIANTE REGISTRADO EXITOSAMENTE")
         print(f"   ID: {nuevo_id}")
@@ -1302,8 +1376,7 @@ def test_curso():
             "salon": salon_actual
         })
     
-    curso_ref = db.collection('courses').document(curso_id)
-    curso_doc = curso_ref.get()
+    curso_doc = repositorio.obtener_curso(curso_id)
     
     if curso_doc.exists:
         curso_data = curso_doc.to_dict()
@@ -1327,189 +1400,201 @@ def test_curso():
 def obtener_proximo_curso(salon_requerido):
     """
     Obtiene información del próximo curso que iniciará en el salón configurado.
-    SOLO retorna cursos que inicien en 5 MINUTOS O MENOS.
+    SOLO retorna cursos cuyo registro abre en 5 MINUTOS O MENOS.
     
     Returns:
         dict: Información del próximo curso o None
     """
     try:
-        from datetime import timedelta
-        
-        ahora = datetime.now()
-        dia_ingles = ahora.strftime('%A')
-        dia_espanol = DIAS_INGLES_A_ESPANOL.get(dia_ingles, dia_ingles)
-        hora_actual = ahora.strftime('%H:%M')
-        
-        print(f"\n=== BUSCANDO PRÓXIMO CURSO (CONTADOR) ===")
-        print(f"Día: {dia_espanol}")
-        print(f"Hora actual: {hora_actual}")
-        print(f"Salón: {salon_requerido}")
-        
-        cursos_ref = db.collection('courses')
-        cursos = cursos_ref.get()
-        
-        proximos_cursos = []
-        
-        for curso_doc in cursos:
-            curso_id = curso_doc.id
-            curso_data = curso_doc.to_dict()
-            
-            # CASO 1: Verificar grupos
-            try:
-                groups_ref = db.collection('courses').document(curso_id).collection('groups')
-                groups = groups_ref.get()
-                
-                if groups:
-                    for group_doc in groups:
-                        group_data = group_doc.to_dict()
-                        schedule = group_data.get('schedule', [])
-                        
-                        for horario in schedule:
-                            resultado = buscar_proximo_horario(
-                                horario, dia_espanol, dia_ingles,
-                                hora_actual, salon_requerido,
-                                curso_id, curso_data
-                            )
-                            if resultado:
-                                proximos_cursos.append(resultado)
-                    continue
-            except:
-                pass
-            
-            # CASO 2: Schedule directo
-            schedule = curso_data.get('schedule', [])
-            for horario in schedule:
-                resultado = buscar_proximo_horario(
-                    horario, dia_espanol, dia_ingles,
-                    hora_actual, salon_requerido,
-                    curso_id, curso_data
-                )
-                if resultado:
-                    proximos_cursos.append(resultado)
-        
-        if proximos_cursos:
-            # Ordenar por tiempo de espera (más cercano primero)
-            proximos_cursos.sort(key=lambda x: x['minutos_para_inicio'])
-            proximo = proximos_cursos[0]
-            
-            print(f"✔ Próximo curso encontrado:")
-            print(f"   Curso: {proximo['nombre_curso']}")
-            print(f"   Inicia: {proximo['hora_inicio']}")
-            print(f"   En: {proximo['minutos_para_inicio']} minutos")
-            
-            return proximo
-        
-        print(f"[!] No hay cursos próximos (≤5 min) en {salon_requerido}")
-        return None
+        return horarios.consultar_salon(salon_requerido)['proximo']
         
     except Exception as e:
         print(f"[✖] ERROR buscando próximo curso: {e}")
         import traceback
         traceback.print_exc()
         return None
-
-def buscar_proximo_horario(horario, dia_espanol, dia_ingles, hora_actual_str, salon_requerido, curso_id, curso_data):
-    """
-    Busca si un horario está próximo a iniciar (para mostrar contador).
-    Retorna información del curso si falta entre 0 y 5 minutos para que ABRA EL REGISTRO.
-    
-    Como el registro abre 5 min antes del inicio, buscamos cursos que inicien en 5-10 minutos.
-    """
-    try:
-        dia_horario = horario.get('day', '')
-        hora_inicio_str = horario.get('iniTime', '00:00')
-        classroom = horario.get('classroom', '').strip()
-        
-        # Verificar salón
-        if classroom != salon_requerido:
-            return None
-        
-        # Verificar día
-        if dia_horario != dia_espanol and dia_horario != dia_ingles:
-            return None
-        
-        # Verificar si es posterior a la hora actual
-        hora_actual = datetime.strptime(hora_actual_str, '%H:%M')
-        hora_inicio = datetime.strptime(hora_inicio_str, '%H:%M')
-        
-        # Calcular minutos hasta el INICIO de la clase
-        diferencia_minutos = (hora_inicio - hora_actual).total_seconds() / 60
-        
-        # ⭐ MODIFICADO: Para activar el CONTADOR
-        # El registro se abre 5 min antes del inicio
-        # Entonces, si el inicio es en 5-10 minutos, el registro abre en 0-5 minutos
-        # Solo mostrar contador si falta entre 0 y 5 minutos para que ABRA el registro
-        
-        minutos_para_apertura = diferencia_minutos - 5
-        
-        # Si ya pasó la hora de apertura o falta más de 5 min para la apertura, no mostrar
-        if minutos_para_apertura < 0 or minutos_para_apertura > 5:
-            return None
-        
-        return {
-            'curso_id': curso_id,
-            'nombre_curso': curso_data.get('nameCourse', 'Sin nombre'),
-            'hora_inicio': hora_inicio_str,
-            'minutos_para_inicio': int(minutos_para_apertura),  # Minutos para que ABRA el registro
-            'salon': salon_requerido
-        }
-        
-    except Exception as e:
-        return None
     
 @app.route('/api/verificar_curso_activo', methods=['GET'])
 def api_verificar_curso_activo():
     """
     Verifica si hay un curso activo en este momento.
     Retorna información sobre si el sistema debe estar en modo espera o reconocimiento.
+    La respuesta se puede cachear hasta el próximo cambio de estado del salón.
+    """
+    estado, codigo = calcular_estado_curso(obtener_salon_actual())
+    respuesta = jsonify(estado)
+    
+    if codigo == 200 and estado.get('siguiente_cambio_segundos'):
+        respuesta.headers['Cache-Control'] = f"private, max-age={estado['siguiente_cambio_segundos']}"
+    else:
+        respuesta.headers['Cache-Control'] = 'no-store'
+    return respuesta, codigo
+
+
+def calcular_estado_curso(salon_actual):
+    """
+    Calcula el estado del kiosco: curso activo, próximo curso o espera.
+    Lo comparten el sondeo HTTP y los avisos del WebSocket.
+    
+    Returns:
+        tuple: (estado_dict, codigo_http)
     """
     try:
-        salon_actual = obtener_salon_actual()
-        
         if not salon_actual:
-            return jsonify({
+            return {
                 "curso_activo": False,
                 "salon_configurado": False,
                 "mensaje": "No hay salón configurado"
-            }), 200
+            }, 200
         
-        curso_id, hora_inicio = obtener_curso_activo_con_salon(salon_requerido=salon_actual)
+        consulta = horarios.consultar_salon(salon_actual)
+        activo = consulta['activo']
         
-        if curso_id:
+        if activo:
             # Hay curso activo
-            curso_ref = db.collection('courses').document(curso_id)
-            curso_doc = curso_ref.get()
-            
-            if curso_doc.exists:
-                curso_data = curso_doc.to_dict()
-                return jsonify({
-                    "curso_activo": True,
-                    "salon_configurado": True,
-                    "courseID": curso_id,
-                    "hora_inicio": hora_inicio,
-                    "salon": salon_actual,
-                    "nombre_curso": curso_data.get('nameCourse', 'Sin nombre')
-                }), 200
-        
-        # No hay curso activo - calcular próximo curso
-        proximo_curso = obtener_proximo_curso(salon_actual)
-        
-        return jsonify({
+            return {
+                "curso_activo": True,
+                "salon_configurado": True,
+                "courseID": activo['curso_id'],
+                "hora_inicio": activo['hora_inicio'],
+                "salon": salon_actual,
+                "nombre_curso": activo['nombre_curso'],
+                "siguiente_cambio_segundos": consulta['segundos_vigencia']
+            }, 200
+        
+        # No hay curso activo - próximo curso (si abre en 5 min o menos)
+        return {
             "curso_activo": False,
             "salon_configurado": True,
             "salon": salon_actual,
-            "proximo_curso": proximo_curso
-        }), 200
+            "proximo_curso": consulta['proximo'],
+            "siguiente_cambio_segundos": consulta['segundos_vigencia']
+        }, 200
         
     except Exception as e:
         print(f"[✖] ERROR en /api/verificar_curso_activo: {e}")
         import traceback
         traceback.print_exc()
-        return jsonify({
+        return {
             "curso_activo": False,
             "error": str(e)
-        }), 500
+        }, 500
+
+
+# ==================== WEBSOCKET: RECONOCIMIENTO CONTINUO ====================
+# Cada segundo sin mensajes se revisa si toca recalcular el estado del curso
+INTERVALO_ESTADO_WS_SEGUNDOS = 30
+
+# Inicio de todo JPEG: un fotograma binario sin número de secuencia delante
+MARCA_JPEG = b'\xff\xd8'
+
+def ws_kiosco(ws):
+    """
+    Conexión persistente del kiosco.
+    
+    Cliente → servidor:
+        - Mensaje binario: número de secuencia (4 bytes, big-endian) + fotograma
+          JPEG completo (sin prefijo, si empieza por la marca JPEG FF D8)
+        - Texto JSON {"tipo": "recorte", "seq": n, "rostro": ..., "box": [...]}: modo recorte
+        - Texto JSON {"tipo": "estado"}: pedir el estado del curso ya
     
+    Servidor → cliente (texto JSON):
+        - {"tipo": "resultado", "seq": n, ...}: misma respuesta que /registro,
+          con la secuencia del fotograma al que responde (el cliente descarta
+          las respuestas tardías de fotogramas que ya dio por perdidos)
+        - {"tipo": "estado_curso", ...}: misma respuesta que
+          /api/verificar_curso_activo, enviada al conectar y cuando cambia
+    """
+    kiosco = obtener_id_kiosco()
+    print(f"🔌 Kiosco conectado por WebSocket: {kiosco}")
+    
+    ultimo_estado = None
+    ultima_verificacion = 0
+    
+    try:
+        while True:
+            if time.time() - ultima_verificacion >= INTERVALO_ESTADO_WS_SEGUNDOS:
+                estado, _ = calcular_estado_curso(obtener_salon_actual(kiosco))
+                ultima_verificacion = time.time()
+                if estado != ultimo_estado:
+                    ws.send(json.dumps({"tipo": "estado_curso", **estado}))
+                    ultimo_estado = estado
+            
+            mensaje = ws.receive(timeout=1)
+            if mensaje is None:
+                continue
+            
+            if isinstance(mensaje, (bytes, bytearray)):
+                mensaje = bytes(mensaje)
+                seq = None
+                if len(mensaje) >= 4 and not mensaje.startswith(MARCA_JPEG):
+                    seq = int.from_bytes(mensaje[:4], 'big')
+                    mensaje = mensaje[4:]
+                respuesta, _ = atender_fotograma(None, kiosco, image_bytes=mensaje)
+            else:
+                try:
+                    datos = json.loads(mensaje)
+                except ValueError:
+                    ws.send(json.dumps({"tipo": "resultado", "estado": "error", "mensaje": "Mensaje inválido"}))
+                    continue
+                
+                if datos.get('tipo') == 'estado':
+                    ultima_verificacion = 0
+                    ultimo_estado = None
+                    continue
+                
+                seq = datos.get('seq')
+                respuesta, _ = atender_fotograma(datos, kiosco)
+            
+            ws.send(json.dumps({"tipo": "resultado", "seq": seq, **respuesta}))
+    
+    except ConnectionClosed:
+        pass
+    finally:
+        detector_cambios.olvidar_kiosco(clave_camara(kiosco))
+        print(f"🔌 Kiosco desconectado: {kiosco}")
+
+if sock:
+    sock.route('/ws/kiosco')(ws_kiosco)
+    
+@app.route('/api/inicializar_asistencias_dia', methods=['POST'])
+def api_inicializar_asistencias_dia():
+    """
+    Crea en bloque los documentos de asistencia del día para todos los salones.
+    
+    Body (opcional):
+        {
+            "fecha": "YYYY-MM-DD"
+        }
+    
+    Returns:
+        JSON con cuántos documentos se crearon y cuántos se omitieron
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        fecha = None
+        if data.get('fecha'):
+            fecha = datetime.strptime(data['fecha'], '%Y-%m-%d').date()
+        
+        reporte = scheduler_asistencia.inicializar_documentos_del_dia(fecha)
+        
+        return jsonify({
+            "success": True,
+            "reporte": reporte
+        }), 200
+        
+    except ValueError:
+        return jsonify({
+            "success": False,
+            "error": "Fecha inválida (formato YYYY-MM-DD)"
+        }), 400
+    except Exception as e:
+        print(f"[✖] ERROR en /api/inicializar_asistencias_dia: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
 @app.route('/configuracion')
 def configuracion():
     """Página de configuración inicial del salón"""
@@ -1520,18 +1605,23 @@ def configuracion():
 def api_obtener_salones():
     """
     Endpoint para obtener la lista de salones disponibles.
+    Responde con ETag: si el catálogo no cambió, If-None-Match → 304.
     
     Returns:
         JSON con lista de salones
     """
     try:
-        salones = obtener_salones_disponibles()
+        salones, etag = horarios.obtener_catalogo_salones()
         
-        return jsonify({
+        # Si el navegador ya tiene esta versión del catálogo, responde 304 sin cuerpo
+        respuesta = jsonify({
             "success": True,
             "salones": salones,
             "total": len(salones)
-        }), 200
+        })
+        respuesta.set_etag(etag)
+        respuesta.headers['Cache-Control'] = 'no-cache'
+        return respuesta.make_conditional(request)
         
     except Exception as e:
         print(f"[✖] ERROR en /api/salones: {e}")
@@ -1623,16 +1713,15 @@ def api_salon_actual():
 @app.route('/api/limpiar_registros', methods=['POST'])
 def api_limpiar_registros():
     """
-    Limpia los registros de estudiantes reconocidos.
+    Limpia los registros de estudiantes reconocidos en el salón del kiosco.
     Se llama cuando se cambia de salón.
     """
-    global estudiantes_reconocidos, tiempos_reconocimiento
-    
     try:
-        estudiantes_reconocidos.clear()
-        tiempos_reconocimiento.clear()
+        salon = obtener_salon_actual()
+        if salon:
+            kioscos.limpiar_estado(salon)
         
-        print(f"\n🧹 REGISTROS LIMPIADOS MANUALMENTE")
+        print(f"\n🧹 REGISTROS LIMPIADOS MANUALMENTE ({salon})")
         print(f"   Se reintentará el registro de asistencia")
         
         return jsonify({
@@ -1675,8 +1764,7 @@ def api_buscar_estudiante_cedula():
         print(f"Cédula buscada: {cedula}")
         
         # Buscar documento directamente por ID (la cédula ES el ID del documento)
-        personas_ref = db.collection('person')
-        doc = personas_ref.document(cedula).get()
+        doc = repositorio.obtener_persona(cedula)
         
         if not doc.exists:
             print(f"[✖] No se encontró documento con ID: {cedula}")
@@ -1755,16 +1843,22 @@ def api_eliminar_consentimiento():
                 "error": "La carpeta de datos no existe"
             }), 404
         
+        # Primero fuera del modelo (sin reentrenar), luego sus imágenes
+        resultado_modelo = quitar_del_modelo(carpeta)
+
         # Eliminar carpeta completa
         import shutil
         shutil.rmtree(carpeta_path)
+        
+        # Y cualquier copia descifrada suya que quede en memoria
+        cache_rostros.vaciar(carpeta_path)
 
         # Registrar en auditoría
         registrar_evento(
             'ELIMINACION_CONSENTIMIENTO',
             f'Consentimiento revocado y datos eliminados',
             usuario=cedula,
-            datos_adicionales={'carpeta': carpeta}
+            datos_adicionales={'carpeta': carpeta, 'modelo': resultado_modelo}
         )
         
         print(f"✔ Carpeta eliminada: {carpeta_path}")
@@ -1790,24 +1884,29 @@ if __name__ == '__main__':
     print("="*60)
     print(f"📁 Data Path: {dataPath}")
     print(f"🤖 Model Path: {model_path}")
-    print(f"👥 Personas cargadas: {len(imagePaths)}")
+    print(f"👥 Personas cargadas: {len(modelo_lbph.personas())}")
     print(f"Python: {sys.version}")
     print(f"OpenCV: {cv2.__version__}")
     
-    # Cargar salón persistente al inicio
-    salon_inicial = cargar_salon_persistente()
-    if salon_inicial:
-        print(f"🏫 Salón configurado: {salon_inicial}")
+    # Cargar kioscos y sus salones al inicio
+    kioscos_iniciales = kioscos.cargar()
+    if kioscos_iniciales:
+        for kiosco_id, salon in kioscos_iniciales.items():
+            print(f"🏫 Kiosco '{kiosco_id}': {salon}")
     else:
-        print(f"⚠️ No hay salón configurado")
+        print(f"⚠️ No hay salones configurados")
     
     print("="*60 + "\n")
     
+    # Horario e índice de estudiantes desde la instantánea local (si existe);
+    # la reconciliación con Firestore sigue en segundo plano
+    instantanea.iniciar()
+    
     # Iniciar scheduler de asistencia
     print("\n" + "="*60)
     print("⏰ INICIANDO SCHEDULER DE ASISTENCIA")
     print("="*60)
-    scheduler_thread = scheduler_asistencia.iniciar_scheduler(obtener_salon_configurado_para_scheduler)
+    scheduler_thread = scheduler_asistencia.iniciar_scheduler(obtener_salones_para_scheduler)
     print("✅ Scheduler iniciado en hilo separado")
     print("="*60 + "\n")
     
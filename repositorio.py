@@ -0,0 +1,337 @@
+"""
+repositorio.py
+Capa de acceso a datos: cursos, grupos, personas y asistencias.
+El resto de la aplicación no usa 'db' directamente; el backend (Firestore real
+o el local de firestore_local.py) se elige una sola vez en firebase_config.py.
+Las lecturas independientes se lanzan a la vez con leer_en_paralelo(), en un
+pool de hilos acotado y con lecturas de cobertura para las que tardan de más.
+El cliente se crea en el primer uso: los procesos de visión (spawn) vuelven a
+importar recFacial y con él este módulo, y no deben inicializar Firebase.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+# Colecciones
+COLECCION_CURSOS = 'courses'
+COLECCION_GRUPOS = 'groups'
+COLECCION_PERSONAS = 'person'
+COLECCION_ASISTENCIAS = 'assistances'
+
+# Máximo de lecturas simultáneas contra el backend
+MAX_LECTURAS_CONCURRENTES = int(os.environ.get('FIRESTORE_CONCURRENCIA', 8))
+
+# Si una lectura tarda más que el percentil 95 reciente, se lanza una copia
+# y gana la primera en responder (0 = sin coberturas)
+PERCENTIL_COBERTURA = 0.95
+RETRASO_COBERTURA_INICIAL_MS = float(os.environ.get('FIRESTORE_COBERTURA_MS', 250))
+RETRASO_COBERTURA_MINIMO_MS = 20
+MUESTRAS_LATENCIA = 200
+
+# Proyección sin campos: solo ID y update_time de cada documento
+SOLO_ID = ['__name__']
+
+_db = None
+_lock_db = threading.Lock()
+
+
+def _cliente():
+    """Cliente del backend (firebase_config se importa aquí, en el primer uso)."""
+    global _db
+    if _db is None:
+        with _lock_db:
+            if _db is None:
+                from firebase_config import db
+                _db = db
+    return _db
+
+
+def marca_tiempo(momento):
+    """update_time de Firestore → texto comparable (y serializable)."""
+    return momento.isoformat() if momento is not None else None
+
+
+def _versiones(documentos, clave):
+    return {clave(doc): marca_tiempo(doc.update_time) for doc in documentos}
+
+
+def obtener_documentos(rutas, campos=None):
+    """Snapshots de documentos por ruta ('coleccion/id/...') en una sola llamada."""
+    if not rutas:
+        return []
+    return list(_cliente().get_all([_cliente().document(ruta) for ruta in rutas], field_paths=campos))
+
+
+# ==================== CURSOS Y GRUPOS ====================
+def referencia_curso(course_id):
+    return _cliente().collection(COLECCION_CURSOS).document(course_id)
+
+
+def obtener_curso(course_id, campos=None):
+    """Snapshot del curso (solo 'campos' si se indican)."""
+    return referencia_curso(course_id).get(field_paths=campos)
+
+
+def obtener_cursos(course_ids, campos=None):
+    """Snapshots de varios cursos en una sola llamada (get_all)."""
+    referencias = [referencia_curso(c) for c in course_ids]
+    if not referencias:
+        return []
+    return list(_cliente().get_all(referencias, field_paths=campos))
+
+
+def consultar_cursos(campos=None, profesor_id=None):
+    """
+    Todos los cursos (o los de un profesor).
+
+    Args:
+        campos: Proyección de campos (None = documento completo)
+        profesor_id: Filtrar por 'profesorID' (opcional)
+    """
+    consulta = _cliente().collection(COLECCION_CURSOS)
+    if profesor_id:
+        consulta = consulta.where('profesorID', '==', profesor_id)
+    if campos is not None:
+        consulta = consulta.select(campos)
+    return consulta.get()
+
+
+def consultar_grupos(campos=None):
+    """Todos los grupos de todos los cursos (collection_group)."""
+    consulta = _cliente().collection_group(COLECCION_GRUPOS)
+    if campos is not None:
+        consulta = consulta.select(campos)
+    return consulta.get()
+
+
+def versiones_cursos():
+    """{curso_id: update_time} sin descargar el contenido."""
+    return _versiones(_cliente().collection(COLECCION_CURSOS).select(SOLO_ID).get(), lambda doc: doc.id)
+
+
+def versiones_grupos():
+    """{ruta_grupo: update_time} de todos los grupos, sin descargar el contenido."""
+    return _versiones(_cliente().collection_group(COLECCION_GRUPOS).select(SOLO_ID).get(),
+                      lambda doc: doc.reference.path)
+
+
+def vigilar_cursos(callback):
+    """on_snapshot sobre 'courses'."""
+    return _cliente().collection(COLECCION_CURSOS).on_snapshot(callback)
+
+
+def vigilar_grupos(callback):
+    """on_snapshot sobre todas las subcolecciones 'groups'."""
+    return _cliente().collection_group(COLECCION_GRUPOS).on_snapshot(callback)
+
+
+# ==================== PERSONAS ====================
+def referencia_persona(persona_id):
+    return _cliente().collection(COLECCION_PERSONAS).document(persona_id)
+
+
+def obtener_persona(persona_id, campos=None):
+    return referencia_persona(persona_id).get(field_paths=campos)
+
+
+def obtener_personas(persona_ids, campos=None):
+    """Snapshots de varias personas en una sola llamada (get_all)."""
+    referencias = [referencia_persona(p) for p in persona_ids]
+    if not referencias:
+        return []
+    return list(_cliente().get_all(referencias, field_paths=campos))
+
+
+def crear_persona(persona_id, datos):
+    referencia_persona(persona_id).set(datos)
+
+
+def consultar_estudiantes(campos=None):
+    """Todas las personas de tipo 'Estudiante'."""
+    consulta = _cliente().collection(COLECCION_PERSONAS).where('type', '==', 'Estudiante')
+    if campos is not None:
+        consulta = consulta.select(campos)
+    return consulta.get()
+
+
+def versiones_estudiantes():
+    """{estudiante_id: update_time} sin descargar el contenido."""
+    return _versiones(consultar_estudiantes(SOLO_ID), lambda doc: doc.id)
+
+
+# ==================== ASISTENCIAS ====================
+def referencia_asistencia(course_id, fecha):
+    """Documento de asistencia de un curso en una fecha ('YYYY-MM-DD')."""
+    return referencia_curso(course_id).collection(COLECCION_ASISTENCIAS).document(fecha)
+
+
+def obtener_asistencia(course_id, fecha, campos=None):
+    return referencia_asistencia(course_id, fecha).get(field_paths=campos)
+
+
+def obtener_asistencias(course_ids, fecha, campos=None):
+    """Snapshots de asistencia de varios cursos en una sola llamada (get_all)."""
+    referencias = [referencia_asistencia(c, fecha) for c in course_ids]
+    if not referencias:
+        return []
+    return list(_cliente().get_all(referencias, field_paths=campos))
+
+
+def crear_asistencia(course_id, fecha, datos):
+    """
+    Crea el documento de asistencia solo si no existe (create(), no set()):
+    si otro proceso lo creó después de comprobarlo, sus marcas 'Presente'
+    no se pisan con el estado inicial.
+
+    Returns:
+        bool: True si se creó, False si ya existía
+    """
+    try:
+        referencia_asistencia(course_id, fecha).create(datos)
+        return True
+    except Exception as e:
+        if es_ya_existe(e):
+            return False
+        raise
+
+
+def es_ya_existe(error):
+    """True si 'error' es el AlreadyExists del backend activo (create() sobre un documento existente)."""
+    from firebase_config import FIRESTORE_BACKEND
+    if FIRESTORE_BACKEND == 'local':
+        from firestore_local import DocumentoYaExiste
+        return isinstance(error, DocumentoYaExiste)
+    from google.api_core.exceptions import AlreadyExists
+    return isinstance(error, AlreadyExists)
+
+
+def actualizar_asistencia(course_id, fecha, cambios):
+    referencia_asistencia(course_id, fecha).update(cambios)
+
+
+def vigilar_asistencia(course_id, fecha, callback):
+    """on_snapshot sobre el documento de asistencia de un curso en una fecha."""
+    return referencia_asistencia(course_id, fecha).on_snapshot(callback)
+
+
+# ==================== LOTES ====================
+def nuevo_lote():
+    """WriteBatch del backend activo."""
+    return _cliente().batch()
+
+
+# ==================== LECTURAS CONCURRENTES ====================
+_pool_lecturas = None
+_lock_lecturas = threading.Lock()
+_latencias_ms = deque(maxlen=MUESTRAS_LATENCIA)
+_en_vuelo = 0
+
+contadores_lecturas = {
+    'lecturas': 0,               # Lecturas pedidas con leer_en_paralelo()
+    'coberturas': 0,             # Copias lanzadas por lentitud
+    'coberturas_ganadoras': 0    # Copias que respondieron antes que la original
+}
+
+
+def _obtener_pool():
+    global _pool_lecturas
+    with _lock_lecturas:
+        if _pool_lecturas is None:
+            _pool_lecturas = ThreadPoolExecutor(
+                max_workers=MAX_LECTURAS_CONCURRENTES,
+                thread_name_prefix='lectura-firestore'
+            )
+        return _pool_lecturas
+
+
+def _retraso_cobertura_segundos():
+    """Percentil 95 de las últimas lecturas (o el valor inicial si hay pocas muestras)."""
+    if not RETRASO_COBERTURA_INICIAL_MS:
+        return None
+    with _lock_lecturas:
+        muestras = sorted(_latencias_ms)
+    if len(muestras) < 20:
+        retraso_ms = RETRASO_COBERTURA_INICIAL_MS
+    else:
+        retraso_ms = muestras[int(PERCENTIL_COBERTURA * (len(muestras) - 1))]
+    return max(RETRASO_COBERTURA_MINIMO_MS, retraso_ms) / 1000
+
+
+def _medir(lectura):
+    """Ejecuta la lectura en el pool registrando su latencia."""
+    global _en_vuelo
+    with _lock_lecturas:
+        _en_vuelo += 1
+    inicio = time.perf_counter()
+    try:
+        return lectura()
+    finally:
+        with _lock_lecturas:
+            _en_vuelo -= 1
+            _latencias_ms.append((time.perf_counter() - inicio) * 1000)
+
+
+def _primer_resultado(tareas):
+    """Resultado de la primera tarea que termine bien (o el error si fallan todas)."""
+    pendientes = set(tareas)
+    error = None
+    while pendientes:
+        hechos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+        for tarea in hechos:
+            if tarea.exception() is None:
+                if tarea is not tareas[0]:
+                    with _lock_lecturas:
+                        contadores_lecturas['coberturas_ganadoras'] += 1
+                return tarea.result()
+            error = tarea.exception()
+    raise error
+
+
+def leer_en_paralelo(*lecturas):
+    """
+    Ejecuta lecturas independientes a la vez: la latencia total es la de la
+    más lenta, no la suma. Solo para lecturas (las coberturas las repiten).
+    No llamar desde dentro de una lectura: el pool es acotado.
+
+    Args:
+        *lecturas: Funciones sin argumentos, p. ej. lambda: obtener_curso(c)
+
+    Returns:
+        list: Resultados en el mismo orden
+    """
+    pool = _obtener_pool()
+    with _lock_lecturas:
+        contadores_lecturas['lecturas'] += len(lecturas)
+
+    # Cada lectura es una lista de tareas: la original y, si hace falta, su copia
+    tareas = [[pool.submit(_medir, lectura)] for lectura in lecturas]
+
+    retraso = _retraso_cobertura_segundos()
+    if retraso is not None:
+        wait([grupo[0] for grupo in tareas], timeout=retraso)
+        for lectura, grupo in zip(lecturas, tareas):
+            if grupo[0].done():
+                continue
+            # Solo si hay hueco: una copia encolada detrás de la original no ayuda
+            with _lock_lecturas:
+                if _en_vuelo >= MAX_LECTURAS_CONCURRENTES:
+                    break
+                contadores_lecturas['coberturas'] += 1
+            grupo.append(pool.submit(_medir, lectura))
+
+    return [_primer_resultado(grupo) for grupo in tareas]
+
+
+def estadisticas_lecturas():
+    """Contadores de lecturas concurrentes y coberturas."""
+    with _lock_lecturas:
+        muestras = sorted(_latencias_ms)
+    return {
+        **contadores_lecturas,
+        'latencia_p50_ms': round(muestras[len(muestras) // 2], 1) if muestras else None,
+        'retraso_cobertura_ms': round((_retraso_cobertura_segundos() or 0) * 1000, 1)
+    }
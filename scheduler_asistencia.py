@@ -1,13 +1,15 @@
 """
 scheduler_asistencia.py
 Sistema de inicialización automática de documentos de asistencia.
-Verifica cada minuto si debe crear documentos de asistencia para cursos activos.
+Calcula los inicios de clase del día, los guarda en un heap y duerme hasta
+la próxima inicialización pendiente (sin sondeo cada minuto).
 """
 
-import time
+import heapq
 import threading
 from datetime import datetime, timedelta
-from firebase_config import db
+import repositorio
+import horarios
 
 
 # Mapeo de días
@@ -26,130 +28,150 @@ DIAS_INGLES_A_ESPANOL = {v: k for k, v in DIAS_ESPANOL_A_INGLES.items()}
 # Diccionario para rastrear qué documentos ya fueron inicializados
 documentos_inicializados = set()  # Formato: "courseID_fecha"
 
-def obtener_cursos_proximos_a_iniciar(salon_configurado):
+# Minutos antes del inicio de la clase en que se crea el documento de asistencia
+MINUTOS_ANTICIPACION = 6
+
+# Si el servidor arranca tarde, se inicializan clases que empezaron hace hasta
+# este número de minutos (coincide con el cierre de la ventana de registro)
+MINUTOS_TOLERANCIA_INICIO = 30
+
+# Se activa para que el scheduler vuelva a planificar el día
+_evento_replanificar = threading.Event()
+
+# Crear de una vez, al empezar cada día, los documentos de todos los salones
+INICIALIZACION_MASIVA_DIARIA = True
+
+# Límite de operaciones por WriteBatch de Firestore
+MAX_OPERACIONES_LOTE = 500
+
+def obtener_inicios_del_dia(salones_configurados, fecha=None):
     """
-    Obtiene los cursos que iniciarán en los próximos 5 minutos.
-    Esta función se ejecuta en el minuto :54, por lo que busca clases que empiecen en :00
+    Obtiene todos los inicios de clase de un día en los salones configurados.
     
     Args:
-        salon_configurado: Salón actualmente configurado
+        salones_configurados: Salón o conjunto de salones con kiosco asignado
+                              (None = todos los salones)
+        fecha: date del día a planificar (por defecto, hoy)
         
     Returns:
-        list: Lista de tuplas (courseID, fecha, hora_inicio)
+        list: Lista de tuplas (courseID, hora_inicio) sin duplicados
     """
     try:
-        ahora = datetime.now()
-        dia_ingles = ahora.strftime('%A')
+        fecha = fecha or datetime.now().date()
+        dia_ingles = fecha.strftime('%A')
         dia_espanol = DIAS_INGLES_A_ESPANOL.get(dia_ingles, dia_ingles)
-        hora_actual = ahora.strftime('%H:%M')
-        fecha_actual = ahora.strftime('%Y-%m-%d')
         
-        # En el minuto :54, buscamos clases que empiecen en :00 (5 minutos después)
-        hora_proxima = (ahora + timedelta(minutes=6)).strftime('%H:%M')
-        
-        cursos_a_inicializar = []
+        if isinstance(salones_configurados, str):
+            salones_configurados = {salones_configurados}
         
         print(f"   📅 Día: {dia_espanol} ({dia_ingles})")
-        print(f"   🕐 Hora actual: {hora_actual}")
-        print(f"   🎯 Buscando clases que inicien a las: {hora_proxima}")
-        print(f"   🏫 Salón configurado: {salon_configurado}")
+        if salones_configurados is None:
+            print(f"   🏫 Salones: todos")
+        else:
+            print(f"   🏫 Salones configurados: {', '.join(sorted(salones_configurados))}")
         
-        if not salon_configurado:
-            print("   [!] No hay salón configurado - saltando verificación")
+        if salones_configurados is not None and not salones_configurados:
+            print("   [!] No hay salón configurado - saltando planificación")
             return []
         
-        # Obtener todos los cursos
-        cursos_ref = db.collection('courses')
-        cursos = cursos_ref.get()
+        inicios = set()
         
-        for curso_doc in cursos:
-            curso_id = curso_doc.id
-            curso_data = curso_doc.to_dict()
-            
-            # CASO 1: Verificar grupos (subcolección)
-            try:
-                groups_ref = db.collection('courses').document(curso_id).collection('groups')
-                groups = groups_ref.get()
-                
-                if groups:
-                    for group_doc in groups:
-                        group_data = group_doc.to_dict()
-                        schedule = group_data.get('schedule', [])
-                        
-                        for horario in schedule:
-                            resultado = verificar_horario_exacto(
-                                horario, dia_espanol, dia_ingles, 
-                                hora_proxima, salon_configurado
-                            )
-                            
-                            if resultado:
-                                cursos_a_inicializar.append((curso_id, fecha_actual, resultado))
-                                nombre_curso = curso_data.get('nameCourse', 'Sin nombre')
-                                print(f"   ✅ Encontrado: {nombre_curso} ({curso_id}) - Inicia a las {resultado}")
-                    
-                    continue
-            except Exception as e:
-                pass
-            
-            # CASO 2: Schedule directo
-            schedule = curso_data.get('schedule', [])
-            
-            for horario in schedule:
-                resultado = verificar_horario_exacto(
-                    horario, dia_espanol, dia_ingles,
-                    hora_proxima, salon_configurado
-                )
-                
-                if resultado:
-                    cursos_a_inicializar.append((curso_id, fecha_actual, resultado))
-                    nombre_curso = curso_data.get('nameCourse', 'Sin nombre')
-                    print(f"   ✅ Encontrado: {nombre_curso} ({curso_id}) - Inicia a las {resultado}")
-        
-        if not cursos_a_inicializar:
-            print(f"   ℹ️ No hay cursos iniciando a las {hora_proxima} en {salon_configurado}")
-        
-        return cursos_a_inicializar
+        for entrada in horarios.obtener_horarios():
+            hora_inicio = verificar_horario_del_dia(
+                entrada['horario'], dia_espanol, dia_ingles, salones_configurados
+            )
+            if hora_inicio:
+                inicios.add((entrada['course_id'], hora_inicio))
+        
+        return sorted(inicios, key=lambda inicio: inicio[1])
         
     except Exception as e:
-        print(f"   ❌ ERROR obteniendo cursos: {e}")
-        return []
+        print(f"   ❌ ERROR obteniendo horarios: {e}")
+        raise  # El scheduler reintentará la planificación
 
-def verificar_horario_exacto(horario, dia_espanol, dia_ingles, hora_buscada, salon_requerido):
+def verificar_horario_del_dia(horario, dia_espanol, dia_ingles, salones_requeridos):
     """
-    Verifica si un horario coincide EXACTAMENTE con la hora buscada, día y salón.
+    Verifica si un horario corresponde al día y a alguno de los salones.
     
     Args:
         horario: Diccionario con day, iniTime, classroom
         dia_espanol: Día en español (ej: "Lunes")
         dia_ingles: Día en inglés (ej: "Monday")
-        hora_buscada: Hora exacta a buscar (formato "HH:MM")
-        salon_requerido: Salón configurado
+        salones_requeridos: Conjunto de salones configurados (None = cualquiera)
         
     Returns:
-        str: Hora de inicio si coincide exactamente, None si no
+        str: Hora de inicio ("HH:MM") si coincide, None si no
     """
     try:
         dia_horario = horario.get('day', '')
-        hora_inicio_str = horario.get('iniTime', '00:00')
+        hora_inicio_str = horario.get('iniTime', '')
         classroom = horario.get('classroom', '').strip()
         
         # 1. Verificar salón
-        if classroom != salon_requerido:
+        if salones_requeridos is not None and classroom not in salones_requeridos:
             return None
         
         # 2. Verificar día
         if dia_horario != dia_espanol and dia_horario != dia_ingles:
             return None
         
-        # 3. Verificar hora EXACTA
-        if hora_inicio_str == hora_buscada:
-            return hora_inicio_str
-        
-        return None
+        # 3. Validar formato de la hora
+        datetime.strptime(hora_inicio_str, '%H:%M')
+        return hora_inicio_str
         
     except Exception as e:
         return None
 
+def planificar_dia(salones_configurados, ahora=None):
+    """
+    Construye el heap de inicializaciones pendientes del día.
+    Cada clase se inicializa MINUTOS_ANTICIPACION minutos antes de empezar;
+    las que ya empezaron (hasta MINUTOS_TOLERANCIA_INICIO) se inicializan de inmediato.
+    
+    Returns:
+        list: Heap de tuplas (momento_inicializacion, courseID, fecha, hora_inicio)
+    """
+    ahora = ahora or datetime.now()
+    fecha_str = ahora.strftime('%Y-%m-%d')
+    
+    heap = []
+    for curso_id, hora_inicio in obtener_inicios_del_dia(salones_configurados, ahora.date()):
+        inicio = datetime.combine(ahora.date(), datetime.strptime(hora_inicio, '%H:%M').time())
+        
+        if ahora > inicio + timedelta(minutes=MINUTOS_TOLERANCIA_INICIO):
+            continue  # Clase ya pasada
+        if f"{curso_id}_{fecha_str}" in documentos_inicializados:
+            continue
+        
+        momento = inicio - timedelta(minutes=MINUTOS_ANTICIPACION)
+        heap.append((momento, curso_id, fecha_str, hora_inicio))
+    
+    heapq.heapify(heap)
+    
+    print(f"   🗓️ Inicializaciones planificadas para hoy: {len(heap)}")
+    for momento, curso_id, _, hora_inicio in sorted(heap):
+        print(f"      • {momento.strftime('%H:%M')} → {curso_id} (inicia {hora_inicio})")
+    
+    return heap
+
+def notificar_cambio_horario():
+    """
+    Pide al scheduler que vuelva a planificar el día.
+    Llamar cuando cambia el horario o la configuración de salones.
+    """
+    _evento_replanificar.set()
+
+def vigilar_horarios():
+    """
+    Replanifica automáticamente cuando cambia el horario en Firestore.
+    Los listeners los mantiene horarios.py, que además invalida su caché.
+    
+    Returns:
+        list: Watches activos (para poder cancelarlos con .unsubscribe())
+    """
+    horarios.suscribir(notificar_cambio_horario)
+    return horarios.vigilar()
+
 def inicializar_documento_asistencia(course_id, fecha):
     """
     Crea el documento de asistencia con todos los estudiantes del curso en estado 'Ausente'.
@@ -174,20 +196,16 @@ def inicializar_documento_asistencia(course_id, fecha):
             print(f"   [!] Ya fue inicializado previamente en esta sesión")
             return True
         
-        # Referencia al documento de asistencia
-        asistencia_ref = db.collection('courses').document(course_id).collection('assistances').document(fecha)
-        
-        # Verificar si ya existe en Firebase
-        asistencia_doc = asistencia_ref.get()
+        # ¿Ya existe en Firebase? + estudiantes del curso (lecturas a la vez)
+        asistencia_doc, curso_doc = repositorio.leer_en_paralelo(
+            lambda: repositorio.obtener_asistencia(course_id, fecha, campos=[]),
+            lambda: repositorio.obtener_curso(course_id, campos=['estudianteID'])
+        )
         if asistencia_doc.exists:
             print(f"   [!] El documento ya existe en Firebase")
             documentos_inicializados.add(clave_documento)
             return True
         
-        # Obtener información del curso
-        curso_ref = db.collection('courses').document(course_id)
-        curso_doc = curso_ref.get()
-        
         if not curso_doc.exists:
             print(f"   ❌ ERROR: Curso {course_id} no existe")
             return False
@@ -198,24 +216,21 @@ def inicializar_documento_asistencia(course_id, fecha):
         if not estudiantes_ids or len(estudiantes_ids) == 0:
             print(f"   ⚠️ ADVERTENCIA: No hay estudiantes inscritos en el curso")
             print(f"   ℹ️ Creando documento vacío")
-            asistencia_ref.set({})
+            if not repositorio.crear_asistencia(course_id, fecha, {}):
+                print(f"   [!] Otro proceso creó el documento entre medias: se conserva")
             documentos_inicializados.add(clave_documento)
             return True
         
         print(f"   📚 Estudiantes inscritos: {len(estudiantes_ids)}")
         
         # Crear diccionario con todos los estudiantes en estado "Ausente"
-        datos_asistencia = {}
-        
-        for estudiante_id in estudiantes_ids:
-            datos_asistencia[estudiante_id] = {
-                'estadoAsistencia': 'Ausente',
-                'horaRegistro': None,
-                'late': False
-            }
+        datos_asistencia = crear_datos_asistencia_iniciales(estudiantes_ids)
         
-        # Crear el documento en Firebase
-        asistencia_ref.set(datos_asistencia)
+        # Crear el documento en Firebase (sin pisar uno creado entre medias)
+        if not repositorio.crear_asistencia(course_id, fecha, datos_asistencia):
+            print(f"   [!] Otro proceso creó el documento entre medias: se conserva")
+            documentos_inicializados.add(clave_documento)
+            return True
         
         # Marcar como inicializado
         documentos_inicializados.add(clave_documento)
@@ -234,6 +249,130 @@ def inicializar_documento_asistencia(course_id, fecha):
         return False
 
 
+def crear_datos_asistencia_iniciales(estudiantes_ids):
+    """
+    Contenido inicial de un documento de asistencia: todos los estudiantes 'Ausente'.
+    """
+    return {
+        estudiante_id: {
+            'estadoAsistencia': 'Ausente',
+            'horaRegistro': None,
+            'late': False
+        }
+        for estudiante_id in estudiantes_ids
+    }
+
+
+def inicializar_documentos_del_dia(fecha=None, salones=None):
+    """
+    Crea en bloque los documentos de asistencia de todos los cursos que tienen
+    clase en la fecha indicada (en todos los salones, o solo en 'salones').
+    
+    En lugar de get() + get() + set() por curso:
+    - Un get_all() de qué documentos de asistencia ya existen y, solo para
+      los que faltan, otro de los 'estudianteID' de sus cursos
+    - Unos pocos WriteBatch de hasta MAX_OPERACIONES_LOTE create(): un
+      documento creado entre la lectura y el commit (Node, un kiosco) hace
+      fallar el lote en vez de perder sus marcas; entonces se crean uno a
+      uno y los que ya existen cuentan como omitidos
+    
+    Args:
+        fecha: date a inicializar (por defecto, hoy)
+        salones: Conjunto de salones (None = todos)
+        
+    Returns:
+        dict: {'fecha', 'cursos', 'creados', 'omitidos', 'errores'}
+    """
+    fecha = fecha or datetime.now().date()
+    fecha_str = fecha.strftime('%Y-%m-%d')
+    reporte = {'fecha': fecha_str, 'cursos': 0, 'creados': 0, 'omitidos': 0, 'errores': 0}
+    
+    print(f"\n{'='*70}")
+    print(f"📦 INICIALIZACIÓN MASIVA DE ASISTENCIA: {fecha_str}")
+    print(f"{'='*70}")
+    
+    cursos_ids = sorted({curso_id for curso_id, _ in obtener_inicios_del_dia(salones, fecha)})
+    reporte['cursos'] = len(cursos_ids)
+    
+    # Los que ya se inicializaron en esta sesión no necesitan lectura
+    pendientes = [c for c in cursos_ids if f"{c}_{fecha_str}" not in documentos_inicializados]
+    reporte['omitidos'] = len(cursos_ids) - len(pendientes)
+    
+    if not pendientes:
+        print(f"   ℹ️ Nada que crear ({reporte['omitidos']} ya inicializados)")
+        return reporte
+    
+    # 1. ¿Qué documentos de asistencia ya existen?
+    snapshots_asistencia = repositorio.obtener_asistencias(pendientes, fecha_str, campos=[])
+    existentes = set()
+    for snapshot in snapshots_asistencia:
+        if snapshot.exists:
+            existentes.add(snapshot.reference.parent.parent.id)
+    
+    for curso_id in existentes:
+        documentos_inicializados.add(f"{curso_id}_{fecha_str}")
+    reporte['omitidos'] += len(existentes)
+    
+    faltantes = [c for c in pendientes if c not in existentes]
+    if not faltantes:
+        print(f"   ℹ️ Todos los documentos ya existían ({reporte['omitidos']} omitidos)")
+        return reporte
+    
+    # 2. Estudiantes inscritos, solo de los cursos que faltan (al reiniciar a
+    # mitad del día casi todos existen y no se descargan sus listas)
+    estudiantes_por_curso = {}
+    for snapshot in repositorio.obtener_cursos(faltantes, campos=['estudianteID']):
+        if snapshot.exists:
+            estudiantes_por_curso[snapshot.id] = (snapshot.to_dict() or {}).get('estudianteID', [])
+    
+    # 3. Escrituras en lotes
+    batch = repositorio.nuevo_lote()
+    en_lote = []
+    
+    def confirmar_lote(batch, en_lote):
+        try:
+            batch.commit()
+            for curso_id, _ in en_lote:
+                documentos_inicializados.add(f"{curso_id}_{fecha_str}")
+            reporte['creados'] += len(en_lote)
+            return
+        except Exception as e:
+            print(f"   ⚠️ Lote de {len(en_lote)} documentos rechazado ({e}): se crean uno a uno")
+        
+        for curso_id, datos in en_lote:
+            try:
+                if repositorio.crear_asistencia(curso_id, fecha_str, datos):
+                    reporte['creados'] += 1
+                else:
+                    reporte['omitidos'] += 1
+                documentos_inicializados.add(f"{curso_id}_{fecha_str}")
+            except Exception as e:
+                print(f"   ❌ ERROR creando asistencia de {curso_id}: {e}")
+                reporte['errores'] += 1
+    
+    for curso_id in faltantes:
+        if curso_id not in estudiantes_por_curso:
+            print(f"   ❌ ERROR: Curso {curso_id} no existe")
+            reporte['errores'] += 1
+            continue
+        
+        datos = crear_datos_asistencia_iniciales(estudiantes_por_curso[curso_id])
+        batch.create(repositorio.referencia_asistencia(curso_id, fecha_str), datos)
+        en_lote.append((curso_id, datos))
+        
+        if len(en_lote) >= MAX_OPERACIONES_LOTE:
+            confirmar_lote(batch, en_lote)
+            batch = repositorio.nuevo_lote()
+            en_lote = []
+    
+    if en_lote:
+        confirmar_lote(batch, en_lote)
+    
+    print(f"   ✅ Creados: {reporte['creados']} | Omitidos: {reporte['omitidos']} | Errores: {reporte['errores']}")
+    print(f"{'='*70}\n")
+    return reporte
+
+
 def limpiar_registros_antiguos():
     """
     Limpia el registro de documentos inicializados de días anteriores.
@@ -254,77 +393,72 @@ def limpiar_registros_antiguos():
 
 def tarea_programada(salon_configurado_callback):
     """
-    Tarea que se ejecuta cada minuto para verificar cursos a inicializar.
-    OPTIMIZACIÓN: Solo procesa cuando los minutos terminan en :54
+    Bucle del scheduler basado en un heap de inicios de clase.
+    Duerme hasta la próxima inicialización, la medianoche o un aviso de
+    replanificación (cambio de horario o de salones).
     
     Args:
-        salon_configurado_callback: Función que retorna el salón actual configurado
+        salon_configurado_callback: Función que retorna los salones configurados
     """
     print("\n" + "="*70)
     print("🚀 SCHEDULER DE ASISTENCIA INICIADO")
     print("="*70)
-    print("   ⏰ Verificación: Solo cuando los minutos terminen en :54")
-    print("   📋 Inicialización: Automática en horas en punto (:00)")
+    print(f"   📋 Inicialización: {MINUTOS_ANTICIPACION} min antes de cada clase")
+    print("   🔁 Replanificación: al cambiar el horario o los salones")
     print("   🧹 Limpieza: Diariamente a la medianoche")
-    print("   💡 Optimizado: Procesamiento mínimo de CPU")
+    if INICIALIZACION_MASIVA_DIARIA:
+        print("   📦 Inicialización masiva: al empezar cada día, todos los salones")
+    print("   💡 Sin sondeo: duerme hasta la próxima clase")
     print("="*70 + "\n")
     
-    ultima_limpieza = datetime.now().date()
-    ultimo_minuto_procesado = -1  # Para evitar procesar dos veces el mismo :54
+    heap = None
+    fecha_planificada = None
     
     while True:
         try:
             ahora = datetime.now()
-            minuto_actual = ahora.minute
             
-            # Verificar si es un nuevo día para limpiar registros
-            hoy = ahora.date()
-            if hoy > ultima_limpieza:
+            # Nuevo día: limpiar registros y replanificar
+            if fecha_planificada is not None and ahora.date() != fecha_planificada:
                 limpiar_registros_antiguos()
-                ultima_limpieza = hoy
+                heap = None
             
-            # ⭐ OPTIMIZACIÓN: Solo procesar cuando los minutos terminen en :54
-            if minuto_actual == 54 and ultimo_minuto_procesado != 54:
-                print(f"\n🔔 [{ahora.strftime('%H:%M:%S')}] ¡Minuto :54 detectado! Iniciando verificación...")
-                
-                # Obtener salón configurado
-                salon_actual = salon_configurado_callback()
-                
-                if salon_actual:
-                    # Buscar cursos próximos a iniciar
-                    cursos = obtener_cursos_proximos_a_iniciar(salon_actual)
-                    
-                    # Inicializar documentos
-                    for curso_id, fecha, hora_inicio in cursos:
-                        inicializar_documento_asistencia(curso_id, fecha)
-                    
-                    if not cursos:
-                        print(f"   ℹ️ No hay cursos a inicializar en este momento")
-                else:
-                    print(f"   ⚠️ No hay salón configurado - saltando verificación")
-                
-                # Marcar que ya procesamos este :54
-                ultimo_minuto_procesado = 54
-                print(f"✅ Verificación completada. Próxima verificación en ~60 minutos.\n")
+            # Inicio del día (o del servidor): crear en bloque los documentos de hoy
+            if INICIALIZACION_MASIVA_DIARIA and fecha_planificada != ahora.date():
+                inicializar_documentos_del_dia(ahora.date())
+            
+            if heap is None or _evento_replanificar.is_set():
+                _evento_replanificar.clear()
+                print(f"\n🗓️ [{ahora.strftime('%H:%M:%S')}] Planificando inicializaciones del día...")
+                heap = planificar_dia(salon_configurado_callback(), ahora)
+                fecha_planificada = ahora.date()
             
-            # Resetear cuando pasamos del minuto :54
-            elif minuto_actual != 54:
-                ultimo_minuto_procesado = -1
+            # Ejecutar todas las inicializaciones vencidas
+            while heap and heap[0][0] <= datetime.now():
+                momento, curso_id, fecha, hora_inicio = heapq.heappop(heap)
+                print(f"\n🔔 [{datetime.now().strftime('%H:%M:%S')}] Clase de las {hora_inicio}: inicializando {curso_id}")
+                inicializar_documento_asistencia(curso_id, fecha)
+            
+            # Dormir hasta la próxima inicialización o la medianoche
+            medianoche = datetime.combine(fecha_planificada + timedelta(days=1), datetime.min.time())
+            siguiente = min(heap[0][0], medianoche) if heap else medianoche
+            espera = max(0.0, (siguiente - datetime.now()).total_seconds())
+            _evento_replanificar.wait(timeout=espera)
             
         except Exception as e:
             print(f"\n❌ ERROR en tarea programada: {e}")
             import traceback
             traceback.print_exc()
-        
-        # Esperar 60 segundos antes de la siguiente verificación
-        time.sleep(60)
+            # Evitar un bucle caliente si el error se repite
+            heap = None
+            _evento_replanificar.wait(timeout=60)
 
 def iniciar_scheduler(salon_configurado_callback):
     """
     Inicia el scheduler en un hilo separado.
     
     Args:
-        salon_configurado_callback: Función que retorna el salón actual
+        salon_configurado_callback: Función que retorna los salones configurados
     """
     thread = threading.Thread(
         target=tarea_programada, 
@@ -332,4 +466,5 @@ def iniciar_scheduler(salon_configurado_callback):
         daemon=True  # Se cierra cuando termina el programa principal
     )
     thread.start()
+    vigilar_horarios()
     return thread
\ No newline at end of file
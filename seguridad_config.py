@@ -1,10 +1,20 @@
 """
 seguridad_config.py
 Sistema de encriptación para proteger datos biométricos según Ley 1581
+El cipher (MultiFernet) se cachea por proceso: la clave primaria cifra y las
+claves retiradas solo se usan para descifrar lo que aún no se ha
+re-encriptado tras una rotación. La caché depende de los archivos de claves,
+así que una rotación hecha por otro proceso (herramienta_cifrado.py con el
+servidor en marcha) se recoge en el siguiente uso sin reiniciar.
 """
 
+import hashlib
+import json
 import os
-from cryptography.fernet import Fernet
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.backends import default_backend
@@ -14,6 +24,87 @@ import base64
 CLAVE_FILE = 'clave_encriptacion.key'
 SALT_FILE = 'salt_encriptacion.key'
 
+# Claves anteriores a la última rotación (una por línea, la más reciente al final)
+CLAVES_RETIRADAS_FILE = 'claves_retiradas.key'
+
+# Progreso de la re-encriptación, para poder reanudarla
+PROGRESO_REENCRIPTACION_FILE = 'reencriptacion_progreso.jsonl'
+
+# Todo token Fernet (versión 0x80 + marca de tiempo) empieza así en base64
+PREFIJO_TOKEN_FERNET = b'gAAAAA'
+
+# fsync de cada captura cifrada: 'siempre' o 'nunca'. El rename ya impide que
+# quede visible un archivo a medias; sin fsync, un corte de luz puede perder
+# la última captura, que se vuelve a tomar
+FSYNC_CAPTURAS = os.environ.get('CIFRADO_FSYNC', 'nunca')
+
+# Hilos de la re-encriptación y cada cuántos archivos se informa
+WORKERS_REENCRIPTACION = 4
+INFORME_CADA_ARCHIVOS = 200
+
+_cipher = None
+_firma_cipher = None
+_lock_cipher = threading.Lock()
+
+
+def _escribir_atomico(ruta, datos, reemplazar=True, sincronizar=True):
+    """
+    Escribe un archivo completo de forma atómica (temporal + fsync).
+
+    Args:
+        reemplazar: Si es False y 'ruta' ya existe, no se toca y se devuelve False
+        sincronizar: fsync del temporal antes de renombrarlo
+
+    Returns:
+        bool: True si el archivo quedó con 'datos'
+    """
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, 'wb') as f:
+        f.write(datos)
+        if sincronizar:
+            f.flush()
+            os.fsync(f.fileno())
+    if reemplazar:
+        os.replace(temporal, ruta)
+        return True
+    try:
+        # link() falla si otro proceso creó la clave primero
+        os.link(temporal, ruta)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+
+def _derivar_clave():
+    """Nueva clave Fernet derivada de una contraseña aleatoria."""
+    salt = os.urandom(16)
+    password = os.urandom(32)  # Contraseña aleatoria
+
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        iterations=100000,
+        backend=default_backend()
+    )
+
+    clave = base64.urlsafe_b64encode(kdf.derive(password))
+    return clave, salt
+
+
+def es_token_fernet(datos):
+    """True si los bytes parecen un token Fernet (y no una imagen en claro)."""
+    return datos[:len(PREFIJO_TOKEN_FERNET)] == PREFIJO_TOKEN_FERNET
+
+
+def huella_clave(clave):
+    """Identificador corto de una clave (para registros, nunca la clave)."""
+    return hashlib.sha256(clave).hexdigest()[:12]
+
+
 def generar_o_cargar_clave():
     """
     Genera una nueva clave de encriptación o carga la existente.
@@ -29,34 +120,98 @@ def generar_o_cargar_clave():
         return clave, salt
     else:
         # Generar nueva clave
-        salt = os.urandom(16)
-        password = os.urandom(32)  # Contraseña aleatoria
-        
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-            backend=default_backend()
-        )
-        
-        clave = base64.urlsafe_b64encode(kdf.derive(password))
-        
-        # Guardar clave y salt
-        with open(CLAVE_FILE, 'wb') as f:
-            f.write(clave)
-        with open(SALT_FILE, 'wb') as f:
-            f.write(salt)
-        
+        clave, salt = _derivar_clave()
+
+        # Guardar clave y salt. Nunca se pisa una clave existente: si otro
+        # proceso se adelantó (o solo falta el salt) se usa la que hay
+        if not _escribir_atomico(CLAVE_FILE, clave, reemplazar=False):
+            _escribir_atomico(SALT_FILE, salt, reemplazar=False)
+            return _leer(CLAVE_FILE), _leer(SALT_FILE)
+        _escribir_atomico(SALT_FILE, salt)
+
         print("✔ Nueva clave de encriptación generada")
         print("⚠️ IMPORTANTE: Guarda 'clave_encriptacion.key' y 'salt_encriptacion.key' en lugar seguro")
-        
+
         return clave, salt
 
+
+def _leer(ruta):
+    with open(ruta, 'rb') as f:
+        return f.read()
+
+
+def cargar_claves_retiradas():
+    """Claves retiradas, de la más reciente a la más antigua."""
+    if not os.path.exists(CLAVES_RETIRADAS_FILE):
+        return []
+    lineas = _leer(CLAVES_RETIRADAS_FILE).split(b'\n')
+    return [linea.strip() for linea in reversed(lineas) if linea.strip()]
+
+
+def _firma_claves():
+    """
+    (inodo, mtime, tamaño) de la clave primaria y de las retiradas. Cada
+    escritura de claves es un rename, así que cualquier rotación la cambia.
+    """
+    firma = []
+    for ruta in (CLAVE_FILE, CLAVES_RETIRADAS_FILE):
+        try:
+            info = os.stat(ruta)
+            firma.append((info.st_ino, info.st_mtime_ns, info.st_size))
+        except FileNotFoundError:
+            firma.append(None)
+    return tuple(firma)
+
+
 def obtener_cipher():
-    """Retorna el objeto cipher para encriptar/desencriptar"""
-    clave, _ = generar_o_cargar_clave()
-    return Fernet(clave)
+    """
+    Retorna el objeto cipher para encriptar/desencriptar (cacheado por
+    proceso y recargado si los archivos de claves cambiaron)
+    """
+    global _cipher, _firma_cipher
+    firma = _firma_claves()
+    if _cipher is not None and firma == _firma_cipher:
+        return _cipher
+    with _lock_cipher:
+        if _cipher is None or firma != _firma_cipher:
+            clave, _ = generar_o_cargar_clave()
+            retiradas = cargar_claves_retiradas()
+            _cipher = MultiFernet([Fernet(clave)] + [Fernet(c) for c in retiradas])
+            # Firma de antes de leer: si las claves cambian mientras tanto,
+            # el siguiente uso no coincide y vuelve a cargar
+            _firma_cipher = firma
+            if retiradas:
+                print(f"🔑 {len(retiradas)} claves retiradas disponibles para descifrar")
+        return _cipher
+
+
+def rotar_clave():
+    """
+    Genera una nueva clave primaria. La anterior pasa a las claves retiradas
+    (se sigue aceptando para descifrar) hasta que se re-encripten los datos.
+
+    Returns:
+        str: Huella de la nueva clave primaria
+    """
+    global _cipher
+    with _lock_cipher:
+        clave_anterior, _ = generar_o_cargar_clave()
+
+        # Primero se guarda la clave anterior: una caída a mitad no la pierde
+        retiradas = b''
+        if os.path.exists(CLAVES_RETIRADAS_FILE):
+            retiradas = _leer(CLAVES_RETIRADAS_FILE).rstrip(b'\n') + b'\n'
+        if clave_anterior.strip() not in retiradas.split(b'\n'):
+            _escribir_atomico(CLAVES_RETIRADAS_FILE, retiradas + clave_anterior.strip() + b'\n')
+
+        clave, salt = _derivar_clave()
+        _escribir_atomico(CLAVE_FILE, clave)
+        _escribir_atomico(SALT_FILE, salt)
+        _cipher = None
+
+    print(f"🔑 Clave rotada: {huella_clave(clave_anterior)} → {huella_clave(clave)}")
+    return huella_clave(clave)
+
 
 def encriptar_archivo(ruta_archivo):
     """
@@ -69,24 +224,33 @@ def encriptar_archivo(ruta_archivo):
         with open(ruta_archivo, 'rb') as f:
             datos = f.read()
         
+        # Ya encriptado: no cifrar dos veces
+        if es_token_fernet(datos):
+            return True
+        
         # Encriptar
         datos_encriptados = cipher.encrypt(datos)
         
-        # Guardar archivo encriptado
-        with open(ruta_archivo + '.enc', 'wb') as f:
-            f.write(datos_encriptados)
-        
-        # Eliminar archivo original
-        os.remove(ruta_archivo)
-        
-        # Renombrar archivo encriptado
-        os.rename(ruta_archivo + '.enc', ruta_archivo)
+        # Reemplazar el original en un solo paso (temporal + fsync + os.replace)
+        _escribir_atomico(ruta_archivo, datos_encriptados)
         
         return True
     except Exception as e:
         print(f"Error encriptando {ruta_archivo}: {e}")
         return False
 
+def guardar_encriptado(ruta_archivo, datos):
+    """
+    Encripta bytes en memoria y los escribe una sola vez, de forma atómica:
+    el contenido en claro nunca llega al disco.
+
+    Returns:
+        int: Bytes escritos (token cifrado)
+    """
+    token = obtener_cipher().encrypt(datos)
+    _escribir_atomico(ruta_archivo, token, sincronizar=FSYNC_CAPTURAS == 'siempre')
+    return len(token)
+
 def desencriptar_archivo(ruta_archivo):
     """
     Desencripta un archivo y retorna los datos.
@@ -123,4 +287,103 @@ def encriptar_carpeta_estudiante(nombre_carpeta):
             archivos_encriptados += 1
     
     print(f"✔ {archivos_encriptados} imágenes encriptadas en {nombre_carpeta}")
-    return True
\ No newline at end of file
+    return True
+
+
+# ==================== RE-ENCRIPTACIÓN TRAS ROTAR ====================
+def _cargar_progreso(huella):
+    """Archivos ya re-encriptados con la clave 'huella' (de una ejecución anterior)."""
+    hechos = set()
+    if not os.path.exists(PROGRESO_REENCRIPTACION_FILE):
+        return hechos
+    with open(PROGRESO_REENCRIPTACION_FILE, 'r', encoding='utf-8') as f:
+        for linea in f:
+            try:
+                registro = json.loads(linea)
+            except ValueError:
+                continue
+            if registro.get('clave') == huella:
+                hechos.add(registro['archivo'])
+    return hechos
+
+
+def _reencriptar(cipher, ruta):
+    """
+    Re-encripta un archivo con la clave primaria (escritura atómica).
+
+    Returns:
+        str: 'reencriptado', 'sin_encriptar' o 'error'
+    """
+    try:
+        token = _leer(ruta)
+        try:
+            nuevo = cipher.rotate(token)
+        except InvalidToken:
+            # Imagen en claro o cifrada con una clave que ya no está
+            return 'sin_encriptar'
+        _escribir_atomico(ruta, nuevo)
+        return 'reencriptado'
+    except Exception as e:
+        print(f"Error re-encriptando {ruta}: {e}")
+        return 'error'
+
+
+def _contar_por_carpeta(resultado, carpeta, ruta, estado):
+    """Contadores por carpeta de estudiante (primer nivel bajo 'carpeta')."""
+    subcarpeta = os.path.relpath(ruta, carpeta).split(os.sep)[0]
+    por_carpeta = resultado['por_carpeta'].setdefault(subcarpeta, {})
+    por_carpeta[estado] = por_carpeta.get(estado, 0) + 1
+
+
+def reencriptar_datos(carpeta='Data', workers=WORKERS_REENCRIPTACION):
+    """
+    Re-encripta todos los archivos de 'carpeta' con la clave primaria actual,
+    con un número acotado de hilos. Lo hecho se anota en
+    PROGRESO_REENCRIPTACION_FILE, así que si se interrumpe se reanuda donde
+    quedó (mientras la clave primaria sea la misma).
+
+    Returns:
+        dict: Contadores (total, reencriptado, omitido, sin_encriptar, error,
+              segundos) y los mismos por carpeta de estudiante en 'por_carpeta'
+    """
+    cipher = obtener_cipher()
+    huella = huella_clave(_leer(CLAVE_FILE))
+    hechos = _cargar_progreso(huella)
+
+    rutas = []
+    for raiz, _, archivos in os.walk(carpeta):
+        for nombre in archivos:
+            if not nombre.endswith('.tmp'):
+                rutas.append(os.path.join(raiz, nombre))
+    rutas.sort()
+
+    resultado = {'total': len(rutas), 'reencriptado': 0, 'omitido': 0, 'sin_encriptar': 0, 'error': 0,
+                 'por_carpeta': {}}
+    pendientes = [r for r in rutas if r not in hechos]
+    resultado['omitido'] = len(rutas) - len(pendientes)
+    for ruta in rutas:
+        if ruta in hechos:
+            _contar_por_carpeta(resultado, carpeta, ruta, 'omitido')
+    print(f"🔁 Re-encriptando {len(pendientes)} archivos de {carpeta} "
+          f"({resultado['omitido']} ya hechos) con la clave {huella}")
+
+    inicio = time.time()
+    with open(PROGRESO_REENCRIPTACION_FILE, 'a', encoding='utf-8') as progreso, \
+            ThreadPoolExecutor(max_workers=workers) as pool:
+        # map() entrega los resultados en el orden de 'pendientes'
+        for numero, (ruta, estado) in enumerate(
+                zip(pendientes, pool.map(lambda r: _reencriptar(cipher, r), pendientes)), start=1):
+            resultado[estado] += 1
+            _contar_por_carpeta(resultado, carpeta, ruta, estado)
+            if estado != 'error':
+                progreso.write(json.dumps({'archivo': ruta, 'clave': huella, 'estado': estado}) + '\n')
+            if numero % INFORME_CADA_ARCHIVOS == 0 or numero == len(pendientes):
+                progreso.flush()
+                os.fsync(progreso.fileno())
+                transcurrido = time.time() - inicio
+                print(f"   {numero}/{len(pendientes)} "
+                      f"({numero / transcurrido if transcurrido else 0:.0f} archivos/s)")
+
+    resultado['segundos'] = round(time.time() - inicio, 2)
+    print(f"✔ Re-encriptación terminada: {({k: v for k, v in resultado.items() if k != 'por_carpeta'})}")
+    return resultado
@@ -0,0 +1,355 @@
+"""
+vision_pool.py
+Pool de procesos para el trabajo de OpenCV (decodificación, detección y reconocimiento).
+Cada proceso tiene su propio CascadeClassifier y su propia copia del modelo LBPH,
+que solo se vuelve a leer cuando cambia la versión publicada en disco.
+Con VISION_WORKERS=0 las tareas se ejecutan en el propio proceso.
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+
+# Número de procesos de visión (0 = ejecutar en el proceso de Flask)
+VISION_WORKERS = int(os.environ.get('VISION_WORKERS', os.cpu_count() or 1))
+
+# Tiempo máximo que un handler espera el resultado de una tarea
+TIEMPO_MAXIMO_TAREA_SEGUNDOS = 15
+
+# Lado del recorte facial que usa el modelo
+TAMANO_RECORTE = 150
+
+# Resultado de un rostro cuando no hay modelo entrenado (p. ej. tras revocar el
+# consentimiento del último estudiante): desconocido, sin llamar a predict()
+ETIQUETA_SIN_MODELO = -1
+CONFIANZA_SIN_MODELO = float('inf')
+
+# ==================== ESTADO DE CADA PROCESO ====================
+_ruta_modelo = None
+_clasificador = None
+_reconocedor = None
+_version_cargada = None
+_entrenado = False
+
+
+def _inicializar_proceso(ruta_modelo):
+    """Inicializador de cada proceso: carga el clasificador una sola vez."""
+    global _ruta_modelo, _clasificador
+    _ruta_modelo = ruta_modelo
+    _clasificador = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+
+def _obtener_reconocedor(version):
+    """
+    Retorna el reconocedor del proceso, recargándolo si la versión publicada cambió.
+    """
+    global _reconocedor, _version_cargada, _entrenado
+    if _reconocedor is None or version != _version_cargada:
+        reconocedor = cv2.face.LBPHFaceRecognizer_create()
+        entrenado = False
+        if version and os.path.exists(_ruta_modelo):
+            reconocedor.read(_ruta_modelo)
+            entrenado = len(reconocedor.getHistograms()) > 0
+        _reconocedor = reconocedor
+        _version_cargada = version
+        _entrenado = entrenado
+    return _reconocedor
+
+
+def _predecir(rostro, version):
+    """
+    (label, confianza) del rostro; sin modelo entrenado, predict() lanzaría
+    cv2.error, así que se devuelve (ETIQUETA_SIN_MODELO, CONFIANZA_SIN_MODELO).
+    """
+    reconocedor = _obtener_reconocedor(version)
+    if not _entrenado:
+        return ETIQUETA_SIN_MODELO, CONFIANZA_SIN_MODELO
+    return reconocedor.predict(rostro)
+
+
+def version_modelo(ruta_modelo):
+    """
+    Versión del modelo publicado en disco (mtime + tamaño); 0 si no existe.
+    Los procesos la comparan con la que tienen cargada para saber si recargar.
+    """
+    try:
+        info = os.stat(ruta_modelo)
+        return (info.st_mtime_ns, info.st_size)
+    except FileNotFoundError:
+        return 0
+
+
+# ==================== FUNCIONES DE VISIÓN ====================
+def detectar_rostro_mejorado(imagen_gray):
+    """
+    Detecta rostros con múltiples estrategias.
+    Retorna (faces, metodo_usado) o (None, None) si falla.
+    """
+    try:
+        # Estrategia 1: Detección normal
+        faces = _clasificador.detectMultiScale(
+            imagen_gray,
+            scaleFactor=1.1,
+            minNeighbors=3,
+            minSize=(30, 30)
+        )
+        if len(faces) > 0:
+            return faces, "normal"
+
+        # Estrategia 2: Más permisivo
+        faces = _clasificador.detectMultiScale(
+            imagen_gray,
+            scaleFactor=1.05,
+            minNeighbors=2,
+            minSize=(20, 20)
+        )
+        if len(faces) > 0:
+            return faces, "permisivo"
+
+        # Estrategia 3: Ecualizar histograma
+        imagen_eq = cv2.equalizeHist(imagen_gray)
+        faces = _clasificador.detectMultiScale(
+            imagen_eq,
+            scaleFactor=1.1,
+            minNeighbors=3,
+            minSize=(30, 30)
+        )
+        if len(faces) > 0:
+            return faces, "ecualizado"
+
+    except Exception as e:
+        print(f"Error en detección: {e}")
+
+    return None, None
+
+
+def _decodificar_gris(image_bytes):
+    """Decodifica un JPEG en color y lo convierte a escala de grises (None si es inválido)."""
+    frame = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        return None
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+# ==================== TAREAS (se ejecutan en los procesos) ====================
+def tarea_analizar_fotograma(image_bytes, version):
+    """
+    Decodifica un fotograma, detecta el rostro principal y lo reconoce.
+
+    Returns:
+        dict: {'estado': 'invalido'} | {'estado': 'sin_rostro'} |
+              {'estado': 'rostro', 'box': [x, y, w, h], 'label': int, 'confianza': float}
+    """
+    gray = _decodificar_gris(image_bytes)
+    if gray is None:
+        return {'estado': 'invalido'}
+
+    faces, metodo = detectar_rostro_mejorado(gray)
+    if faces is None or len(faces) == 0:
+        return {'estado': 'sin_rostro'}
+
+    x, y, w, h = faces[0]
+    rostro = gray[y:y+h, x:x+w]
+    rostro = cv2.resize(rostro, (TAMANO_RECORTE, TAMANO_RECORTE), interpolation=cv2.INTER_CUBIC)
+    label, confianza = _predecir(rostro, version)
+
+    return {
+        'estado': 'rostro',
+        'box': [int(x), int(y), int(w), int(h)],
+        'label': int(label),
+        'confianza': float(confianza)
+    }
+
+
+def tarea_analizar_recorte(rostro_bytes, box, version):
+    """
+    Reconoce un rostro que el kiosco ya recortó y pasó a escala de grises.
+
+    Returns:
+        dict: Mismo formato que tarea_analizar_fotograma()
+    """
+    rostro = cv2.imdecode(np.frombuffer(rostro_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if rostro is None or rostro.shape != (TAMANO_RECORTE, TAMANO_RECORTE):
+        return {'estado': 'invalido'}
+
+    label, confianza = _predecir(rostro, version)
+
+    return {
+        'estado': 'rostro',
+        'box': box,
+        'label': int(label),
+        'confianza': float(confianza)
+    }
+
+
+def tarea_detectar_rostro(image_bytes):
+    """
+    Solo detección (pantalla de registro).
+
+    Returns:
+        dict: {'rostro_detectado': bool, 'box': [...], 'metodo': str}
+    """
+    gray = _decodificar_gris(image_bytes)
+    if gray is None:
+        return {'rostro_detectado': False}
+
+    faces, metodo = detectar_rostro_mejorado(gray)
+    if faces is None or len(faces) == 0:
+        return {'rostro_detectado': False}
+
+    x, y, w, h = faces[0]
+    return {
+        'rostro_detectado': True,
+        'box': [int(x), int(y), int(w), int(h)],
+        'metodo': metodo
+    }
+
+
+def tarea_preparar_foto(image_bytes):
+    """
+    Prepara una captura de registro: recorte del rostro en grises a
+    TAMANO_RECORTE (o la imagen completa reducida si no se detecta rostro),
+    ya codificado como JPEG para cifrarlo en memoria sin pasar por disco.
+
+    Returns:
+        dict: {'estado': 'invalido'} | {'estado': 'ok', 'jpeg': bytes,
+              'tipo': 'recorte'|'completa', 'metodo': str}
+    """
+    gray = _decodificar_gris(image_bytes)
+    if gray is None:
+        return {'estado': 'invalido'}
+
+    faces, metodo = detectar_rostro_mejorado(gray)
+
+    if faces is not None and len(faces) > 0:
+        x, y, w, h = faces[0]
+        rostro = gray[y:y+h, x:x+w]
+        tipo = "recorte"
+    else:
+        rostro = gray
+        tipo = "completa"
+        metodo = "ninguno"
+
+    rostro = cv2.resize(rostro, (TAMANO_RECORTE, TAMANO_RECORTE), interpolation=cv2.INTER_CUBIC)
+    ok, jpeg = cv2.imencode('.jpg', rostro)
+    if not ok:
+        return {'estado': 'invalido'}
+
+    return {
+        'estado': 'ok',
+        'jpeg': jpeg.tobytes(),
+        'tipo': tipo,
+        'metodo': metodo
+    }
+
+
+# ==================== POOL (proceso de Flask) ====================
+_pool = None
+_configuracion = None   # (ruta_modelo, workers)
+_lock_pool = threading.Lock()
+_pendientes = 0
+
+
+def es_proceso_de_vision():
+    """
+    True en los procesos del pool, también mientras 'spawn' vuelve a importar
+    el script principal (parent_process() aún no está asignado en ese
+    momento; el nombre del proceso sí).
+    """
+    return multiprocessing.current_process().name != 'MainProcess'
+
+
+def configurar_pool(ruta_modelo, workers=VISION_WORKERS):
+    """
+    Registra la configuración del pool. Los procesos se crean en la primera
+    tarea, así importar el módulo (también desde los propios procesos) es barato.
+    """
+    global _configuracion
+    _configuracion = (ruta_modelo, workers)
+
+
+def _asegurar_pool():
+    """Crea el pool la primera vez (o prepara la ejecución local si workers == 0)."""
+    global _pool
+    with _lock_pool:
+        if _pool is not None or _clasificador is not None:
+            return
+
+        ruta_modelo, workers = _configuracion
+        if workers > 0:
+            # 'spawn' evita heredar hilos de gRPC/Firebase del proceso padre
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_inicializar_proceso,
+                initargs=(ruta_modelo,)
+            )
+            print(f"👷 Pool de visión iniciado con {workers} procesos")
+        else:
+            _inicializar_proceso(ruta_modelo)
+            print("👷 Visión en el proceso principal (VISION_WORKERS=0)")
+
+
+def ejecutar(tarea, *args):
+    """
+    Ejecuta una tarea de visión en el pool y espera su resultado.
+    Mientras tanto el hilo del handler solo espera: otros kioscos siguen
+    siendo atendidos por los demás procesos.
+    """
+    global _pendientes
+    _asegurar_pool()
+    with _lock_pool:
+        _pendientes += 1
+    pool = _pool
+    try:
+        if pool is None:
+            return tarea(*args)
+        return pool.submit(tarea, *args).result(timeout=TIEMPO_MAXIMO_TAREA_SEGUNDOS)
+    except BrokenProcessPool:
+        # Un proceso murió (p. ej. un fallo nativo de OpenCV): sin reemplazo,
+        # todas las tareas siguientes fallarían hasta reiniciar el servidor
+        _reemplazar_pool(pool)
+        raise
+    finally:
+        with _lock_pool:
+            _pendientes -= 1
+
+
+def _reemplazar_pool(roto):
+    """Cierra el pool roto; el siguiente ejecutar() crea uno nuevo."""
+    global _pool
+    with _lock_pool:
+        if _pool is not roto:
+            return  # Otra tarea ya lo reemplazó
+        _pool = None
+    roto.shutdown(wait=False, cancel_futures=True)
+    print("⚠️ Un proceso de visión terminó inesperadamente; el pool se recreará")
+
+
+def tareas_pendientes():
+    """Número de tareas de visión enviadas y aún sin resultado."""
+    return _pendientes
+
+
+def capacidad():
+    """Número de tareas que se pueden ejecutar en paralelo."""
+    workers = _configuracion[1] if _configuracion else VISION_WORKERS
+    return max(1, workers)
+
+
+def detener_pool():
+    """Cierra el pool esperando las tareas en curso."""
+    global _pool
+    with _lock_pool:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+atexit.register(detener_pool)